@@ -0,0 +1,93 @@
+"""Compare the action scanner with full restricted unpickling.
+
+The scan walks opcodes in Python, so its cost follows the opcode count while
+restricted_loads follows the byte count. The crossover is where
+ACTION_SCAN_MIN_BYTES in utils.decode_pickle should sit.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_action_scan [--repeat 5] [--output results.json]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import pickle
+import timeit
+from typing import Any, Dict, List
+
+import numpy as np
+
+from utils.action_scan import scan_action
+from utils.decode_pickle import restricted_loads
+
+
+def make_messages() -> Dict[str, Dict[str, Any]]:
+    """QKD-style messages from small control frames up to multi-megabyte key blocks."""
+    rng = np.random.default_rng(7)
+    messages: Dict[str, Dict[str, Any]] = {
+        "control_small": {"action": "ack", "seq": 17, "session": "alice-bob"},
+    }
+    for label, size in (("4k", 4096), ("64k", 64 * 1024), ("256k", 256 * 1024), ("1m", 1 << 20), ("4m", 4 << 20)):
+        messages[f"key_block_{label}"] = {
+            "action": "raw_key",
+            "seq": 1,
+            "bits": rng.integers(0, 2, size, dtype=np.uint8),
+            "meta": {"round": 4, "qber": 0.021},
+        }
+    messages["action_after_array_1m"] = {
+        "bits": rng.integers(0, 2, 1 << 20, dtype=np.uint8),
+        "meta": {"round": 4, "qber": 0.021},
+        "action": "raw_key",
+    }
+    return messages
+
+
+def time_call(func: Any, payload: bytes, repeat: int) -> float:
+    """Return the best per-call time in microseconds."""
+    number = 1
+    while True:
+        elapsed = timeit.timeit(lambda: func(payload), number=number)
+        if elapsed >= 0.05 or number >= 1_000_000:
+            break
+        number *= 10
+    best = min(timeit.repeat(lambda: func(payload), number=number, repeat=repeat))
+    return best / number * 1e6
+
+
+def run(repeat: int) -> List[Dict[str, Any]]:
+    results = []
+    for name, message in make_messages().items():
+        payload = pickle.dumps(message, protocol=4)
+        assert scan_action(payload) == message["action"]
+        scan_us = time_call(scan_action, payload, repeat)
+        loads_us = time_call(restricted_loads, payload, repeat)
+        results.append(
+            {
+                "message": name,
+                "payload_bytes": len(payload),
+                "scan_action_us": round(scan_us, 3),
+                "restricted_loads_us": round(loads_us, 3),
+                "speedup": round(loads_us / scan_us, 1),
+            }
+        )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write JSON results to this path instead of stdout")
+    args = parser.parse_args()
+
+    report = json.dumps({"benchmark": "action_scan", "results": run(args.repeat)}, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
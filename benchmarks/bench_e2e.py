@@ -0,0 +1,301 @@
+"""End-to-end throughput and latency of forward_data over loopback, without TPROXY.
+
+The proxy side runs in this process exactly as handle_connection wires it (two
+forward_data tasks per connection, splice enabled), but it accepts plain loopback
+connections instead of transparently redirected ones. A spawned child process runs
+the load generator and the sink on its own event loop. The generator sends
+synthetic length-prefixed pickled messages, and the sink timestamps each frame on arrival.
+
+Each scenario is one combination of payload size, rule density, and connection count.
+For each one the benchmark reports:
+- frames/s and MB/s at the sink
+- p50/p99 end-to-end latency
+- the proxy's own added latency, from the tcp_proxy_added_latency_us histograms
+- RSS of the proxy process
+
+Run from the repository root:
+
+    python -m benchmarks.bench_e2e [--quick] [--sizes 64,4096] [--densities none,scan]
+                                   [--connections 1,8] [--output results.json]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import pickle
+import resource
+import struct
+import tempfile
+import time
+from multiprocessing.connection import Connection
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from tcp_proxy import ProxyRuntimeState, forward_data
+from utils import event_log
+from utils.contracts import ForwardingContext, LoggingConfig
+from utils.metrics import LogHistogram
+
+SEND_BATCH_FRAMES = 64
+TARGET_BYTES_PER_SCENARIO = 64 * 1024 * 1024
+UNUSED_ACTIONS = [f"unused_{index}" for index in range(50)]
+_LENGTH = struct.Struct(">I")
+
+
+def frame_bytes(message: Dict[str, Any]) -> bytes:
+    payload = pickle.dumps(message, protocol=4)
+    return _LENGTH.pack(len(payload)) + payload
+
+
+def config_for(density: str) -> str:
+    """Rule sets from pure passthrough to many rules with insertions on every 10th frame."""
+    lines = ["logging:", '  frame_decisions: "non_default"', "payload_handling:", "  global:"]
+    if density == "none":
+        lines[-1] = "  global: {}"
+    elif density == "scan":
+        lines += ["    block:", '      - action: "unused_0"']
+    elif density == "dense":
+        injected = frame_bytes({"action": "injected", "seq": -1}).hex()
+        lines += ["    block:"] + [f'      - action: "{action}"' for action in UNUSED_ACTIONS]
+        lines += ["    insert:", '      - action: "tagged"', '        position: "after"', f'        data: "{injected}"']
+    else:
+        raise ValueError(f"unknown rule density {density!r}")
+    return "\n".join(lines) + "\n"
+
+
+def build_frames(count: int, payload_size: int, conn_index: int) -> List[bytes]:
+    """QKD-style key blocks; ``conn`` lets the sink match frames to their departure."""
+    rng = np.random.default_rng(11)
+    bits = rng.integers(0, 256, payload_size, dtype=np.uint8)
+    return [
+        frame_bytes({"action": "tagged" if seq % 10 == 0 else "raw_key", "seq": seq, "conn": conn_index, "bits": bits})
+        for seq in range(count)
+    ]
+
+
+# --- child process: load generator and sink -------------------------------------
+
+
+async def _sink(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    arrivals: Dict[Tuple[int, int], float],
+    done: asyncio.Queue,
+) -> None:
+    buffer = bytearray()
+    conn_index = -1
+    frames = 0
+    total_bytes = 0
+    while True:
+        data = await reader.read(256 * 1024)
+        if not data:
+            break
+        now = time.perf_counter()
+        total_bytes += len(data)
+        buffer += data
+        offset = 0
+        while len(buffer) - offset >= 4:
+            length = _LENGTH.unpack_from(buffer, offset)[0]
+            end = offset + 4 + length
+            if end > len(buffer):
+                break
+            message = pickle.loads(memoryview(buffer)[offset + 4:end])
+            offset = end
+            if message["seq"] < 0:
+                continue
+            if conn_index < 0:
+                conn_index = message["conn"]
+            arrivals[(conn_index, message["seq"])] = now
+            frames += 1
+        del buffer[:offset]
+    writer.close()
+    await done.put((frames, total_bytes, time.perf_counter()))
+
+
+async def _send(port: int, conn_index: int, frames: List[bytes], departures: Dict[Tuple[int, int], float]) -> None:
+    _, writer = await asyncio.open_connection("127.0.0.1", port)
+    for start in range(0, len(frames), SEND_BATCH_FRAMES):
+        now = time.perf_counter()
+        for seq in range(start, min(start + SEND_BATCH_FRAMES, len(frames))):
+            departures[(conn_index, seq)] = now
+        writer.writelines(frames[start:start + SEND_BATCH_FRAMES])
+        await writer.drain()
+    writer.write_eof()
+    await writer.drain()
+    writer.close()
+
+
+async def _load_generator(control: Connection, scenario: Dict[str, Any]) -> None:
+    loop = asyncio.get_running_loop()
+    arrivals: Dict[Tuple[int, int], float] = {}
+    departures: Dict[Tuple[int, int], float] = {}
+    done: asyncio.Queue = asyncio.Queue()
+    sink_server = await asyncio.start_server(lambda r, w: _sink(r, w, arrivals, done), "127.0.0.1", 0)
+    control.send(sink_server.sockets[0].getsockname()[1])
+    proxy_port = await loop.run_in_executor(None, control.recv)
+
+    connections = scenario["connections"]
+    per_connection = [
+        build_frames(scenario["frames_per_connection"], scenario["payload_size"], conn_index)
+        for conn_index in range(connections)
+    ]
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_send(proxy_port, index, frames, departures) for index, frames in enumerate(per_connection)))
+    results = [await done.get() for _ in range(connections)]
+    finished = max(result[2] for result in results)
+    sink_server.close()
+
+    latencies = np.array([(arrivals[key] - sent) * 1e6 for key, sent in departures.items() if key in arrivals])
+    frames_received = sum(result[0] for result in results)
+    bytes_received = sum(result[1] for result in results)
+    elapsed = finished - started
+    control.send(
+        {
+            "frames_sent": len(departures),
+            "frames_received": frames_received,
+            "seconds": round(elapsed, 4),
+            "frames_per_s": round(frames_received / elapsed, 1),
+            "mb_per_s": round(bytes_received / elapsed / 1e6, 2),
+            "e2e_latency_p50_us": round(float(np.percentile(latencies, 50)), 1) if len(latencies) else None,
+            "e2e_latency_p99_us": round(float(np.percentile(latencies, 99)), 1) if len(latencies) else None,
+        }
+    )
+
+
+def _child_main(control: Connection, scenario: Dict[str, Any]) -> None:
+    asyncio.run(_load_generator(control, scenario))
+
+
+# --- proxy side ------------------------------------------------------------------
+
+
+async def _run_proxy(runtime_state: ProxyRuntimeState, control: Connection, connections: int) -> Dict[str, Any]:
+    loop = asyncio.get_running_loop()
+    sink_port = await loop.run_in_executor(None, control.recv)
+    bridges: List[asyncio.Task] = []
+
+    async def on_client(client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter) -> None:
+        remote_reader, remote_writer = await asyncio.open_connection("127.0.0.1", sink_port)
+        outbound = ForwardingContext(
+            connection_id="bench", direction_label="client->sink", source_ip="127.0.0.1", target_ip="127.0.0.2"
+        )
+        inbound = ForwardingContext(
+            connection_id="bench", direction_label="client<-sink", source_ip="127.0.0.2", target_ip="127.0.0.1"
+        )
+        await asyncio.gather(
+            forward_data(client_reader, remote_writer, runtime_state, outbound, client_writer.transport),
+            forward_data(remote_reader, client_writer, runtime_state, inbound, remote_writer.transport),
+            return_exceptions=True,
+        )
+        client_writer.close()
+        remote_writer.close()
+
+    server = await asyncio.start_server(lambda r, w: bridges.append(asyncio.create_task(on_client(r, w))), "127.0.0.1", 0)
+    control.send(server.sockets[0].getsockname()[1])
+    result = await loop.run_in_executor(None, control.recv)
+    result["proxy_rss_kib"] = _rss_kib()
+    server.close()
+    for bridge in bridges:
+        bridge.cancel()
+    await asyncio.gather(*bridges, return_exceptions=True)
+    return result
+
+
+def _rss_kib() -> int:
+    """Current resident set size of the proxy process."""
+    try:
+        with open("/proc/self/statm", encoding="ascii") as handle:
+            resident_pages = int(handle.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _proxy_added_latency(runtime_state: ProxyRuntimeState) -> Dict[str, Any]:
+    merged = LogHistogram()
+    for state in runtime_state.metrics.added_latency_us.export_state().values():
+        merged.merge(state)
+    snapshot = merged.snapshot()
+    return {"count": snapshot["count"], "p50_us": snapshot["p50_us"], "p99_us": snapshot["p99_us"]}
+
+
+def run_scenario(payload_size: int, density: str, connections: int, frames: int) -> Dict[str, Any]:
+    frames_per_connection = frames or max(200, min(20000, TARGET_BYTES_PER_SCENARIO // (payload_size + 64) // connections))
+    scenario = {
+        "payload_size": payload_size,
+        "density": density,
+        "connections": connections,
+        "frames_per_connection": frames_per_connection,
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_path = os.path.join(tmp_dir, "config.yaml")
+        with open(config_path, "w", encoding="utf-8") as handle:
+            handle.write(config_for(density))
+
+        parent_end, child_end = multiprocessing.get_context("spawn").Pipe()
+        child = multiprocessing.get_context("spawn").Process(target=_child_main, args=(child_end, scenario))
+        child.start()
+        with contextlib.redirect_stdout(io.StringIO()):
+            runtime_state = ProxyRuntimeState(config_path)
+            runtime_state.load_initial()
+        with open(os.devnull, "w", encoding="utf-8") as devnull:
+            event_log.configure(LoggingConfig(), stream=devnull)
+            try:
+                result = asyncio.run(_run_proxy(runtime_state, parent_end, connections))
+            finally:
+                event_log.shutdown()
+                runtime_state.close()
+        child.join()
+
+    return {
+        **scenario,
+        **result,
+        "proxy_added_latency_us": _proxy_added_latency(runtime_state),
+    }
+
+
+def _csv(value: str, cast: Any) -> List[Any]:
+    return [cast(item) for item in value.split(",") if item]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", help="payload sizes in bytes (default 64,4096,262144; 256,65536 with --quick)")
+    parser.add_argument("--densities", default="none,scan,dense", help="rule densities: none, scan, dense")
+    parser.add_argument("--connections", help="concurrent connection counts (default 1,8; 1,4 with --quick)")
+    parser.add_argument("--frames", type=int, default=0, help="frames per connection (0 sizes it by bytes)")
+    parser.add_argument("--quick", action="store_true", help="small matrix with 500 frames per connection, unless overridden")
+    parser.add_argument("--output", help="write JSON results to this path instead of stdout")
+    args = parser.parse_args()
+
+    # --quick only fills in what was not given explicitly.
+    sizes = _csv(args.sizes or ("256,65536" if args.quick else "64,4096,262144"), int)
+    densities = _csv(args.densities, str)
+    connections = _csv(args.connections or ("1,4" if args.quick else "1,8"), int)
+    frames = args.frames or (500 if args.quick else 0)
+
+    results = [
+        run_scenario(size, density, count, frames)
+        for size in sizes
+        for density in densities
+        for count in connections
+    ]
+    report = json.dumps({"benchmark": "e2e", "results": results}, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
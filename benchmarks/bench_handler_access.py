@@ -0,0 +1,119 @@
+"""Per-frame cost of reading the current payload handler.
+
+Compares the locked ``ProxyRuntimeState.payload_handler()`` with the versioned read
+``forward_data`` uses: it keeps the (handler, version) pair and compares one integer
+per frame. Each variant runs in one thread, and also in several threads at once to
+show lock contention from thread-mode event loops.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_handler_access [--iterations 1000000] [--threads 1,4]
+                                              [--output results.json]
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+from tcp_proxy import ProxyRuntimeState
+
+
+def locked_reads(runtime_state: ProxyRuntimeState, iterations: int) -> None:
+    for _ in range(iterations):
+        runtime_state.payload_handler()
+
+
+def versioned_reads(runtime_state: ProxyRuntimeState, iterations: int) -> None:
+    handler, handler_version = runtime_state.current_handler()
+    for _ in range(iterations):
+        if runtime_state.handler_version != handler_version:
+            handler, handler_version = runtime_state.current_handler()
+
+
+def empty_loop(runtime_state: ProxyRuntimeState, iterations: int) -> None:
+    for _ in range(iterations):
+        pass
+
+
+def measure(
+    reads: Callable[[ProxyRuntimeState, int], None],
+    runtime_state: ProxyRuntimeState,
+    iterations: int,
+    threads: int,
+) -> float:
+    """Wall-clock seconds for ``threads`` threads to finish ``iterations`` reads each."""
+    barrier = threading.Barrier(threads + 1)
+
+    def run() -> None:
+        barrier.wait()
+        reads(runtime_state, iterations)
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    started = time.perf_counter()
+    barrier.wait()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - started
+
+
+def run(iterations: int, thread_counts: List[int]) -> List[Dict[str, Any]]:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_path = os.path.join(tmp_dir, "config.yaml")
+        with open(config_path, "w", encoding="utf-8") as handle:
+            handle.write('payload_handling:\n  global:\n    block:\n      - action: "drop"\n')
+        runtime_state = ProxyRuntimeState(config_path)
+        with contextlib.redirect_stdout(io.StringIO()):
+            runtime_state.load_initial()
+
+    results = []
+    for threads in thread_counts:
+        baseline = min(measure(empty_loop, runtime_state, iterations, threads) for _ in range(3))
+        for name, reads in (("locked", locked_reads), ("versioned", versioned_reads)):
+            elapsed = min(measure(reads, runtime_state, iterations, threads) for _ in range(3))
+            total_reads = iterations * threads
+            results.append(
+                {
+                    "variant": name,
+                    "threads": threads,
+                    "reads": total_reads,
+                    "ns_per_read": round((elapsed - baseline) / total_reads * 1e9, 2),
+                    "reads_per_s": round(total_reads / elapsed),
+                }
+            )
+    return results
+
+
+def _csv(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=1_000_000, help="reads per thread")
+    parser.add_argument("--threads", default="1,4", help="concurrent reader thread counts")
+    parser.add_argument("--output", help="write JSON results to this path instead of stdout")
+    args = parser.parse_args()
+
+    report = json.dumps(
+        {"benchmark": "handler_access", "results": run(args.iterations, _csv(args.threads))},
+        indent=2,
+    )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
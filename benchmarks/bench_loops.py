@@ -0,0 +1,232 @@
+"""Throughput scaling of multiple event loops against the single-loop proxy.
+
+Starts ``tcp_proxy.py`` as a real subprocess in explicit-upstream mode, once per
+layout:
+- ``single``: one event loop (the default proxy)
+- ``thread``: ``workers.mode: thread``, N loops sharing one ProxyRuntimeState
+- ``process``: ``workers.mode: process``, N forked SO_REUSEPORT workers
+
+Sender processes keep many connections busy with QKD-style frames under the ``dense``
+rule set from ``bench_e2e``. A sink process counts what arrives upstream. Rule
+evaluation is CPU bound, so ``thread`` only scales on a free-threaded CPython build;
+``gil_enabled`` in the report says which build ran.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_loops [--loops 4] [--seconds 5] [--layouts single,thread,process]
+                                     [--output results.json]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing.connection import Connection
+from typing import Any, Dict, List
+
+from benchmarks.bench_e2e import build_frames, config_for
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SEND_BATCH_FRAMES = 64
+
+
+def _free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+# --- load processes ------------------------------------------------------------------
+
+
+def _sink_main(control: Connection, port: int) -> None:
+    """Count upstream bytes between the parent's start and stop messages."""
+
+    async def run() -> None:
+        counted = [0]
+        counting = [False]
+
+        async def on_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+            try:
+                while data := await reader.read(256 * 1024):
+                    if counting[0]:
+                        counted[0] += len(data)
+            except (ConnectionError, asyncio.CancelledError):
+                pass
+            writer.close()
+
+        server = await asyncio.start_server(on_connection, "127.0.0.1", port, backlog=1024)
+        loop = asyncio.get_running_loop()
+        control.send("ready")
+        await loop.run_in_executor(None, control.recv)
+        counting[0] = True
+        await loop.run_in_executor(None, control.recv)
+        counting[0] = False
+        control.send(counted[0])
+        # Stay up until the proxy is gone so it never sees the upstream reset.
+        await loop.run_in_executor(None, control.recv)
+        server.close()
+
+    asyncio.run(run())
+
+
+def _sender_main(control: Connection, port: int, connections: int, payload_size: int, seconds: float) -> None:
+    """Keep ``connections`` proxy connections writing frames until the deadline."""
+    frames = build_frames(SEND_BATCH_FRAMES * 4, payload_size, os.getpid())
+    batches = [frames[start:start + SEND_BATCH_FRAMES] for start in range(0, len(frames), SEND_BATCH_FRAMES)]
+
+    async def connection(deadline: float) -> None:
+        _, writer = await asyncio.open_connection("127.0.0.1", port)
+        index = 0
+        while time.monotonic() < deadline:
+            writer.writelines(batches[index % len(batches)])
+            index += 1
+            await writer.drain()
+        writer.close()
+
+    async def run() -> None:
+        control.send("ready")
+        await asyncio.get_running_loop().run_in_executor(None, control.recv)
+        deadline = time.monotonic() + seconds
+        await asyncio.gather(*(connection(deadline) for _ in range(connections)), return_exceptions=True)
+
+    asyncio.run(run())
+
+
+# --- proxy under test ------------------------------------------------------------------
+
+
+def _proxy_config(layout: str, loops: int, proxy_port: int, sink_port: int) -> str:
+    lines = [
+        "src:",
+        '  host: "127.0.0.1"',
+        f"  port: {proxy_port}",
+        '  mode: "upstream"',
+        "  upstream:",
+        '    host: "127.0.0.1"',
+        f"    port: {sink_port}",
+    ]
+    if layout != "single":
+        lines += ["workers:", f"  count: {loops}", f'  mode: "{layout}"']
+    return "\n".join(lines) + "\n" + config_for("dense")
+
+
+def _wait_for_listener(port: int, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"proxy did not start listening on port {port}")
+
+
+def run_layout(layout: str, loops: int, seconds: float, senders: int, connections: int, payload_size: int) -> Dict[str, Any]:
+    proxy_port, sink_port = _free_port(), _free_port()
+    context = multiprocessing.get_context("spawn")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.makedirs(os.path.join(work_dir, "config"))
+        with open(os.path.join(work_dir, "config", "config.yaml"), "w", encoding="utf-8") as handle:
+            handle.write(_proxy_config(layout, loops, proxy_port, sink_port))
+
+        sink_end, sink_child = context.Pipe()
+        sink = context.Process(target=_sink_main, args=(sink_child, sink_port))
+        sink.start()
+        sink_end.recv()
+
+        proxy = subprocess.Popen(
+            [sys.executable, os.path.join(REPO_ROOT, "tcp_proxy.py")],
+            cwd=work_dir,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            _wait_for_listener(proxy_port)
+            sender_ends: List[Connection] = []
+            sender_processes = []
+            for _ in range(senders):
+                parent_end, child_end = context.Pipe()
+                process = context.Process(
+                    target=_sender_main,
+                    args=(child_end, proxy_port, connections, payload_size, seconds + 1.0),
+                )
+                process.start()
+                parent_end.recv()
+                sender_ends.append(parent_end)
+                sender_processes.append(process)
+
+            for end in sender_ends:
+                end.send("go")
+            # Skip the first half second while connections ramp up.
+            time.sleep(0.5)
+            sink_end.send("start")
+            time.sleep(seconds)
+            sink_end.send("stop")
+            counted = sink_end.recv()
+            for process in sender_processes:
+                process.join()
+        finally:
+            proxy.terminate()
+            proxy.wait(timeout=15)
+            sink_end.send("exit")
+            sink.join()
+
+    return {
+        "layout": layout,
+        "loops": 1 if layout == "single" else loops,
+        "mb_per_s": round(counted / seconds / 1e6, 2),
+    }
+
+
+def _csv(value: str) -> List[str]:
+    return [item for item in value.split(",") if item]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--loops", type=int, default=os.cpu_count() or 1, help="event loops per multi-loop layout")
+    parser.add_argument("--layouts", default="single,thread,process", help="single, thread, process")
+    parser.add_argument("--seconds", type=float, default=5.0, help="measured duration per layout")
+    parser.add_argument("--senders", type=int, default=2, help="load generator processes")
+    parser.add_argument("--connections", type=int, default=8, help="connections per load generator")
+    parser.add_argument("--payload-size", type=int, default=4096, help="key bytes per frame")
+    parser.add_argument("--output", help="write JSON results to this path instead of stdout")
+    args = parser.parse_args()
+
+    results = [
+        run_layout(layout, args.loops, args.seconds, args.senders, args.connections, args.payload_size)
+        for layout in _csv(args.layouts)
+    ]
+    baseline = next((result["mb_per_s"] for result in results if result["layout"] == "single"), None)
+    for result in results:
+        result["speedup"] = round(result["mb_per_s"] / baseline, 2) if baseline else None
+
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    report = json.dumps(
+        {
+            "benchmark": "loops",
+            "cpu_count": os.cpu_count(),
+            "gil_enabled": is_gil_enabled() if is_gil_enabled is not None else True,
+            "results": results,
+        },
+        indent=2,
+    )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Compare raw passthrough throughput of the splice and stream engines on loopback.
+
+A sender pushes a fixed volume through forward_data into a sink that discards it;
+the only difference between the two runs is whether forward_data is handed the
+source transport (splice) or not (stream reads and writes).
+
+Run from the repository root:
+
+    python -m benchmarks.bench_passthrough [--megabytes 256] [--repeat 3] [--output results.json]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from tcp_proxy import ProxyRuntimeState, forward_data
+from utils.contracts import ForwardingContext
+from utils.splice_passthrough import splice_available
+
+SEND_CHUNK_SIZE = 256 * 1024
+
+
+async def _transfer(runtime_state: ProxyRuntimeState, total_bytes: int, engine: str) -> float:
+    """Return seconds from the first byte sent until the sink saw EOF."""
+    loop = asyncio.get_running_loop()
+    accepted: asyncio.Future = loop.create_future()
+    sink_done: asyncio.Future = loop.create_future()
+
+    async def on_proxy_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        accepted.set_result((reader, writer))
+
+    async def on_sink(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        received = 0
+        while True:
+            data = await reader.read(SEND_CHUNK_SIZE)
+            if not data:
+                break
+            received += len(data)
+        sink_done.set_result(received)
+        writer.close()
+
+    proxy_server = await asyncio.start_server(on_proxy_client, "127.0.0.1", 0)
+    sink_server = await asyncio.start_server(on_sink, "127.0.0.1", 0)
+    _, client_writer = await asyncio.open_connection("127.0.0.1", proxy_server.sockets[0].getsockname()[1])
+    proxy_reader, proxy_writer = await accepted
+    _, sink_writer = await asyncio.open_connection("127.0.0.1", sink_server.sockets[0].getsockname()[1])
+
+    context = ForwardingContext(
+        connection_id="bench",
+        direction_label="bench",
+        source_ip="127.0.0.1",
+        target_ip="127.0.0.1",
+    )
+    source_transport = proxy_writer.transport if engine == "splice" else None
+
+    chunk = os.urandom(SEND_CHUNK_SIZE)
+    started = time.perf_counter()
+    forward = asyncio.create_task(
+        forward_data(proxy_reader, sink_writer, runtime_state, context, source_transport=source_transport)
+    )
+    sent = 0
+    while sent < total_bytes:
+        client_writer.write(chunk)
+        await client_writer.drain()
+        sent += len(chunk)
+    client_writer.write_eof()
+
+    received = await sink_done
+    elapsed = time.perf_counter() - started
+    await forward
+    assert received == sent, (received, sent)
+
+    for writer in (client_writer, proxy_writer, sink_writer):
+        writer.close()
+    proxy_server.close()
+    sink_server.close()
+    return elapsed
+
+
+def run(megabytes: int, repeat: int) -> List[Dict[str, Any]]:
+    total_bytes = megabytes * 1024 * 1024
+    engines = ["stream"] + (["splice"] if splice_available() else [])
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_path = os.path.join(tmp_dir, "config.yaml")
+        with open(config_path, "w", encoding="utf-8") as handle:
+            handle.write("payload_handling:\n  global: {}\n")
+
+        # forward_data logs JSON events to stdout; keep them out of the report.
+        with contextlib.redirect_stdout(io.StringIO()):
+            runtime_state = ProxyRuntimeState(config_path)
+            runtime_state.load_initial()
+            for engine in engines:
+                best = min(
+                    asyncio.run(_transfer(runtime_state, total_bytes, engine)) for _ in range(repeat)
+                )
+                results.append(
+                    {
+                        "engine": engine,
+                        "bytes": total_bytes,
+                        "best_seconds": round(best, 4),
+                        "throughput_mib_s": round(total_bytes / best / (1024 * 1024), 1),
+                    }
+                )
+            runtime_state.close()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megabytes", type=int, default=256)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write JSON results to this path instead of stdout")
+    args = parser.parse_args()
+
+    report = json.dumps({"benchmark": "passthrough", "results": run(args.megabytes, args.repeat)}, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Cost of rebuilding ``PayloadHandler`` on a config reload as directions grow.
+
+Builds configs with 100 and 500 directions, each with a delay, block, insert, and
+replay rule, and times:
+- ``full``: a handler built from scratch, as the first load does
+- ``unchanged``: a reload of the same config
+- ``one_direction``: a reload where one direction's delay changed
+- ``global``: a reload where a global rule changed, so every plan is recompiled
+
+``normalize_ms`` is the config validation every reload pays before the build.
+Times are the best of five runs, in milliseconds.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_reload [--directions 100,500] [--output results.json]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from typing import Any, Callable, Dict, List
+
+from utils.config_loading import normalize_proxy_config
+from utils.payload_handling import PayloadHandler
+
+
+def config_for(direction_count: int, changed_direction: int = -1, global_delay_ms: int = 1) -> Dict[str, Any]:
+    directions = {}
+    for index in range(direction_count):
+        action = f"action_{index}"
+        directions[f"direction_{index}"] = {
+            "source_ip": f"10.{index // 256}.{index % 256}.1",
+            "target_ip": "10.255.0.0/16",
+            "delay": [{"action": action, "delay_ms": 2 if index == changed_direction else 1}],
+            "block": [{"action": f"{action}_blocked"}],
+            "insert": [{"action": action, "data": "deadbeef", "position": "after"}],
+            "replay": [{"action": f"{action}_replayed", "count": 2, "data": "00"}],
+        }
+    return {
+        "logging": {"level": "off"},
+        "payload_handling": {
+            "global": {"delay": [{"action": "heartbeat", "delay_ms": global_delay_ms}]},
+            "directions": directions,
+        },
+    }
+
+
+def best_ms(build: Callable[[], Any], runs: int = 5) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        started = time.perf_counter()
+        build()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def run(direction_counts: List[int]) -> List[Dict[str, Any]]:
+    results = []
+    for direction_count in direction_counts:
+        raw = config_for(direction_count)
+        config = normalize_proxy_config(raw).config
+        active = PayloadHandler(config)
+        reloads = {
+            "full": (config, None),
+            "unchanged": (normalize_proxy_config(raw).config, active),
+            "one_direction": (normalize_proxy_config(config_for(direction_count, changed_direction=0)).config, active),
+            "global": (normalize_proxy_config(config_for(direction_count, global_delay_ms=2)).config, active),
+        }
+        normalize_ms = best_ms(lambda: normalize_proxy_config(raw))
+        for case, (next_config, previous) in reloads.items():
+            handler = PayloadHandler(next_config, previous=previous)
+            results.append(
+                {
+                    "directions": direction_count,
+                    "reload": case,
+                    "build_ms": round(best_ms(lambda: PayloadHandler(next_config, previous=previous)), 3),
+                    "normalize_ms": round(normalize_ms, 3),
+                    "rule_sets_reused": handler.rule_sets_reused,
+                    "rule_sets_rebuilt": handler.rule_sets_rebuilt,
+                }
+            )
+    return results
+
+
+def _csv(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--directions", default="100,500", help="direction counts to compare")
+    parser.add_argument("--output", help="write JSON results to this path instead of stdout")
+    args = parser.parse_args()
+
+    report = json.dumps({"benchmark": "reload", "results": run(_csv(args.directions))}, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Per-frame cost of ``PayloadHandler.process_frame`` as the rule count grows.
+
+Builds a handler with 0, 10, and 1000 rules, split between ``global`` and one
+direction and cycling through delay, block, and insert rules. It then times
+already-decoded frames of two kinds:
+- ``miss``: an action no rule names, the common case on a busy link
+- ``hit``: an action with one delay rule
+
+Event logging is switched off so the numbers cover rule evaluation only.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_rule_plan [--frames 200000] [--rules 0,10,1000]
+                                         [--output results.json]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+from typing import Any, Dict, List
+
+from utils.contracts import ForwardingContext, MessageFrame
+from utils.payload_handling import PayloadHandler
+
+SOURCE_IP = "10.0.0.1"
+TARGET_IP = "10.0.0.2"
+
+
+def config_for(rule_count: int) -> Dict[str, Any]:
+    rule_sets: List[Dict[str, List[Dict[str, Any]]]] = [{}, {}]
+    for index in range(rule_count):
+        rules = rule_sets[index % 2]
+        action = f"rule_{index}"
+        kind = ("delay", "block", "insert")[(index // 2) % 3]
+        if kind == "delay":
+            rules.setdefault("delay", []).append({"action": action, "delay_ms": 1})
+        elif kind == "block":
+            rules.setdefault("block", []).append({"action": action})
+        else:
+            rules.setdefault("insert", []).append({"action": action, "data": "00", "position": "after"})
+
+    direction = {"source_ip": SOURCE_IP, "target_ip": TARGET_IP, **rule_sets[1]}
+    return {
+        "logging": {"level": "off"},
+        "payload_handling": {"global": rule_sets[0], "directions": {"bench": direction}},
+    }
+
+
+def make_frame(action: str) -> MessageFrame:
+    return MessageFrame(
+        length_prefix=b"\x00\x00\x00\x04",
+        payload=b"data",
+        raw_frame=b"\x00\x00\x00\x04data",
+        decoded={"action": action, "seq": 1},
+    )
+
+
+async def time_frames(handler: PayloadHandler, frame: MessageFrame, frames: int) -> float:
+    """Best per-frame time in nanoseconds over three runs."""
+    context = ForwardingContext(
+        connection_id="bench",
+        direction_label="client_to_server",
+        source_ip=SOURCE_IP,
+        target_ip=TARGET_IP,
+    )
+    best = float("inf")
+    for _ in range(3):
+        started = time.perf_counter()
+        for _ in range(frames):
+            await handler.process_frame(frame, context)
+        best = min(best, time.perf_counter() - started)
+    return best / frames * 1e9
+
+
+def run(frames: int, rule_counts: List[int]) -> List[Dict[str, Any]]:
+    results = []
+    for rule_count in rule_counts:
+        handler = PayloadHandler(config_for(rule_count))
+        cases = {"miss": "no_rule"}
+        if rule_count:
+            cases["hit"] = "rule_0"
+        for case, action in cases.items():
+            ns_per_frame = asyncio.run(time_frames(handler, make_frame(action), frames))
+            results.append(
+                {
+                    "rules": rule_count,
+                    "frame": case,
+                    "ns_per_frame": round(ns_per_frame, 1),
+                    "frames_per_s": round(1e9 / ns_per_frame),
+                }
+            )
+    return results
+
+
+def _csv(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frames", type=int, default=200_000, help="frames per timed run")
+    parser.add_argument("--rules", default="0,10,1000", help="rule counts to compare")
+    parser.add_argument("--output", help="write JSON results to this path instead of stdout")
+    args = parser.parse_args()
+
+    report = json.dumps({"benchmark": "rule_plan", "results": run(args.frames, _csv(args.rules))}, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
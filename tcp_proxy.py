@@ -1,13 +1,15 @@
 import asyncio
-import json
+import concurrent.futures
+import contextlib
 import os
+import signal
 import socket
 import struct
 import threading
 import time
 from dataclasses import dataclass
 from functools import partial
-from typing import Any, Optional
+from typing import Any, Callable, Coroutine, Optional
 
 try:
     import uvloop
@@ -21,8 +23,15 @@ except ModuleNotFoundError:
     FileSystemEventHandler = object  # type: ignore[assignment]
     Observer = None
 
+from utils import event_log
+from utils.decode_offload import DecodeOffloader
 from utils.decode_pickle import PickleDecoder
+from utils.frame_writer import CoalescingWriter, decision_buffers
+from utils.metrics import MetricsRegistry, start_metrics_server
 from utils.payload_handling import PayloadHandler
+from utils.release_scheduler import ReleaseScheduler
+from utils.splice_passthrough import can_splice, splice_forward
+from utils.workers import WorkerHandle, aggregate_metrics, fork_worker, serve_control_channel
 from utils.config_loading import ConfigValidationError, load_proxy_config
 from utils.contracts import ForwardingContext, SourceConfig
 
@@ -32,13 +41,15 @@ READ_CHUNK_SIZE = 64 * 1024
 
 def log_event(event: str, **fields: Any) -> None:
     """Emit machine-readable proxy events for operators and tests."""
+    if not event_log.enabled(event):
+        return
     payload = {
         "component": "tcp_proxy",
         "event": event,
         "timestamp": time.time(),
         **fields,
     }
-    print(json.dumps(payload, default=str))
+    event_log.emit(payload)
 
 
 @dataclass(frozen=True)
@@ -59,17 +70,44 @@ class ProxyRuntimeState:
         self._source: Optional[SourceConfig] = None
         self._payload_handler: Optional[PayloadHandler] = None
         self._config_version = 0
+        self._decode_offloader: Optional[DecodeOffloader] = None
+        # Read-mostly copy of (handler, version) for the per-frame path; see current_handler.
+        self._published: Optional[tuple[PayloadHandler, int]] = None
+        self.handler_version = -1
+        self._reload_listeners: list[Callable[[int], None]] = []
+        self.metrics = MetricsRegistry()
+
+    def add_reload_listener(self, listener: Callable[[int], None]) -> None:
+        """Call ``listener(config_version)`` after every successful reload."""
+        self._reload_listeners.append(listener)
 
     def load_initial(self) -> None:
         """Load the initial config before the listener is bound."""
         loaded = load_proxy_config(self.config_path)
         self._log_warnings(loaded.warnings, phase="initial")
 
-        handler = PayloadHandler(config=loaded.config, config_version=0)
+        decoding = loaded.config.decoding
+        if decoding.offload_threshold_bytes > 0:
+            # The pool starts on the first offloaded decode, so forked workers build their own.
+            self._decode_offloader = DecodeOffloader(decoding)
+            log_event(
+                "decode_offload_enabled",
+                threshold_bytes=decoding.offload_threshold_bytes,
+                executor=decoding.offload_executor,
+                workers=decoding.offload_workers,
+            )
+
+        handler = PayloadHandler(
+            config=loaded.config,
+            config_version=0,
+            decode_offloader=self._decode_offloader,
+        )
         with self._lock:
             self._source = loaded.config.source
             self._payload_handler = handler
             self._config_version = 0
+            self._publish(handler, 0)
+        event_log.set_policy(handler.log_policy)
 
         log_event(
             "config_loaded",
@@ -103,9 +141,31 @@ class ProxyRuntimeState:
                 requested_port=loaded.config.source.port,
             )
 
+        # The decode pool is sized at startup and shared by every handler generation.
+        if loaded.config.decoding != current.payload_handler.config.decoding:
+            log_event("config_reload_decoding_ignored", path=self.config_path)
+
+        if loaded.config.metrics != current.payload_handler.config.metrics:
+            log_event("config_reload_metrics_ignored", path=self.config_path)
+
+        if loaded.config.workers != current.payload_handler.config.workers:
+            log_event("config_reload_workers_ignored", path=self.config_path)
+
+        # The log writer thread and its queue are built once in main(); levels and
+        # sampling travel with the handler and apply from this reload on.
+        if loaded.config.logging.writer_settings() != current.payload_handler.config.logging.writer_settings():
+            log_event("config_reload_logging_writer_ignored", path=self.config_path)
+
         next_version = current.config_version + 1
+        build_started = time.perf_counter()
         try:
-            next_handler = PayloadHandler(config=loaded.config, config_version=next_version)
+            # Unchanged rule sets keep their insert counters and replay sessions.
+            next_handler = PayloadHandler(
+                config=loaded.config,
+                config_version=next_version,
+                decode_offloader=self._decode_offloader,
+                previous=current.payload_handler,
+            )
         except Exception as exc:
             log_event("config_reload_failed", reason="build", error=str(exc))
             return False
@@ -113,10 +173,39 @@ class ProxyRuntimeState:
         with self._lock:
             self._payload_handler = next_handler
             self._config_version = next_version
+            self._publish(next_handler, next_version)
+        event_log.set_policy(next_handler.log_policy)
 
-        log_event("config_reloaded", path=self.config_path, config_version=next_version)
+        log_event(
+            "config_reloaded",
+            path=self.config_path,
+            config_version=next_version,
+            rule_sets_reused=next_handler.rule_sets_reused,
+            rule_sets_rebuilt=next_handler.rule_sets_rebuilt,
+            build_ms=round((time.perf_counter() - build_started) * 1000, 3),
+        )
+        for listener in self._reload_listeners:
+            listener(next_version)
         return True
 
+    def _publish(self, handler: PayloadHandler, version: int) -> None:
+        # Called under self._lock. The pair is swapped with one reference assignment
+        # before the counter moves, so a reader that sees the new counter also finds
+        # the new pair, and no reader can see a handler with the wrong version.
+        self._published = (handler, version)
+        self.handler_version = version
+
+    def current_handler(self) -> tuple[PayloadHandler, int]:
+        """Lock-free read of the current handler and its config version.
+
+        Per-frame callers keep the pair and re-read it only when ``handler_version``
+        no longer matches, so a frame costs one integer comparison instead of a lock.
+        """
+        published = self._published
+        if published is None:
+            raise RuntimeError("runtime state has not been initialized")
+        return published
+
     def payload_handler(self) -> PayloadHandler:
         """Return the current handler without allocating a full snapshot per frame."""
         with self._lock:
@@ -136,6 +225,13 @@ class ProxyRuntimeState:
                 config_version=self._config_version,
             )
 
+    def close(self) -> None:
+        """Release worker pools owned by the runtime state."""
+        if self._decode_offloader is not None:
+            log_event("decode_offload_stats", **self._decode_offloader.stats_snapshot())
+            self._decode_offloader.shutdown()
+            self._decode_offloader = None
+
     def _log_warnings(self, warnings: tuple[str, ...], *, phase: str) -> None:
         for warning in warnings:
             log_event("config_warning", path=self.config_path, phase=phase, warning=warning)
@@ -180,29 +276,66 @@ async def forward_data(
     writer: asyncio.StreamWriter,
     runtime_state: ProxyRuntimeState,
     context: ForwardingContext,
-) -> None:
-    """Forward one direction of traffic through the frame-aware rule engine."""
-    initial_handler = runtime_state.payload_handler()
+    source_transport: Optional[asyncio.BaseTransport] = None,
+    metrics: Optional[MetricsRegistry] = None,
+) -> dict[str, Any]:
+    """Forward one direction of traffic through the frame-aware rule engine.
+
+    ``source_transport`` is the transport behind ``reader``; when it is given and the
+    direction needs no frame processing, bytes are spliced between the sockets in the
+    kernel instead of passing through the stream buffers. Returns this direction's
+    per-action added-latency summary. ``metrics`` is the registry of the event loop
+    running this direction and defaults to ``runtime_state.metrics``.
+    """
+    initial_handler, handler_version = runtime_state.current_handler()
+    handler = initial_handler
+    # Every generation this direction ran under may hold one of its replay sessions.
+    observed_handlers = [initial_handler]
     frame_processing_enabled = initial_handler.requires_frame_processing
-    decoder = PickleDecoder() if frame_processing_enabled else None
-    if decoder is None:
+    if frame_processing_enabled:
+        initial_handler.bind_direction(context)
+    decoder = PickleDecoder(zero_copy=True) if frame_processing_enabled else None
+    use_splice = decoder is None and can_splice(reader, writer, source_transport)
+    frame_writer: Optional[CoalescingWriter] = None
+    scheduler: Optional[ReleaseScheduler] = None
+    release_task: Optional[asyncio.Task] = None
+    if decoder is not None:
+        forwarding = initial_handler.config.forwarding
+        frame_writer = CoalescingWriter(writer, forwarding)
+        scheduler = ReleaseScheduler(frame_writer, forwarding.delay_max_pending_bytes)
+        release_task = asyncio.create_task(scheduler.run())
+    else:
         log_event(
             "raw_passthrough_enabled",
             connection_id=context.connection_id,
             direction=context.direction_label,
             config_version=initial_handler.config_version,
+            engine="splice" if use_splice else "stream",
         )
 
+    direction_metrics = (metrics or runtime_state.metrics).direction(
+        context.source_ip, context.target_ip, initial_handler.rule_actions
+    )
+    loop = asyncio.get_running_loop()
     try:
+        if use_splice:
+            forwarded = await splice_forward(reader, writer, source_transport)
+            direction_metrics.record_read(forwarded)
+            direction_metrics.record_raw_forward(forwarded)
+            return direction_metrics.latency_snapshot()
+
         while True:
             data = await reader.read(READ_CHUNK_SIZE)
             if not data:
                 break
+            read_at = time.perf_counter()
+            direction_metrics.record_read(len(data))
 
             if decoder is None:
                 # Mode is fixed per direction; mid-stream rule activation cannot safely
                 # reinterpret bytes that were already forwarded without frame decoding.
                 writer.write(data)
+                direction_metrics.record_raw_forward(len(data))
                 await writer.drain()
                 continue
 
@@ -210,23 +343,45 @@ async def forward_data(
             if not frames:
                 continue
 
+            # Every decision from one read chunk leaves in a single vectored write.
+            # Delayed frames, and anything queued behind them, go through the
+            # scheduler so reading continues while they wait.
+            received_at = loop.time()
             for frame in frames:
-                handler = runtime_state.payload_handler()
+                if runtime_state.handler_version != handler_version:
+                    handler, handler_version = runtime_state.current_handler()
+                    if handler not in observed_handlers:
+                        observed_handlers.append(handler)
+                    direction_metrics.rule_actions = handler.rule_actions
                 decision = await handler.process_frame(
                     frame=frame,
                     context=context,
+                    before_wait=frame_writer.flush,
                 )
-
-                for insertion in decision.before_insertions:
-                    writer.write(insertion.data)
-
+                direction_metrics.record_decision(decision, len(frame.raw_frame))
+                mark = None
                 if decision.forward_original:
-                    writer.write(frame.raw_frame)
-
-                for insertion in decision.after_insertions:
-                    writer.write(insertion.data)
-
-                await writer.drain()
+                    mark = (read_at, decision.delayed_ms, direction_metrics.latency_recorders(decision.action))
+                for scheduled in decision.scheduled_insertions:
+                    scheduler.inject([scheduled.data], received_at, scheduled.delay_ms)
+                if decision.delayed_ms or scheduler.has_pending:
+                    scheduler.schedule(
+                        decision_buffers(decision, frame.raw_frame),
+                        received_at,
+                        decision.delayed_ms,
+                        mark,
+                    )
+                else:
+                    frame_writer.add_decision(decision, frame.raw_frame, mark)
+
+            await frame_writer.drain()
+            await scheduler.wait_for_capacity()
+            if release_task.done():
+                release_task.result()
+
+        if scheduler is not None:
+            scheduler.close()
+            await release_task
 
     except Exception as exc:
         log_event(
@@ -236,6 +391,35 @@ async def forward_data(
             error=str(exc),
         )
     finally:
+        if release_task is not None and not release_task.done():
+            release_task.cancel()
+            log_event(
+                "delayed_frames_dropped",
+                connection_id=context.connection_id,
+                direction=context.direction_label,
+                pending_bytes=scheduler.pending_bytes,
+            )
+        if scheduler is not None and scheduler.dropped_injections:
+            log_event(
+                "scheduled_insertions_dropped",
+                connection_id=context.connection_id,
+                direction=context.direction_label,
+                count=scheduler.dropped_injections,
+            )
+        if scheduler is not None and scheduler.stats.released:
+            log_event(
+                "delay_stats",
+                connection_id=context.connection_id,
+                direction=context.direction_label,
+                **scheduler.stats.snapshot(),
+            )
+        if frame_writer is not None:
+            # Frames already decided before a failure still go out in order.
+            frame_writer.flush()
+        if frame_processing_enabled:
+            # Replay sessions are scoped to this direction and must not outlive it.
+            for observed in observed_handlers:
+                observed.release_context(context)
         if decoder is not None and decoder.buffer:
             log_event(
                 "partial_frame_dropped",
@@ -245,6 +429,8 @@ async def forward_data(
             )
         await finish_writer_output(writer, context)
 
+    return direction_metrics.latency_snapshot()
+
 
 def get_original_dest(sock: socket.socket) -> tuple[str, int]:
     """Read Linux SO_ORIGINAL_DST for a transparently redirected connection."""
@@ -255,14 +441,31 @@ def get_original_dest(sock: socket.socket) -> tuple[str, int]:
     return ip, port
 
 
+def bind_transparent_socket(client_ip: str, client_port: int) -> socket.socket:
+    """Create an outbound socket that carries the client's address as its source."""
+    remote_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        remote_socket.setblocking(False)
+        # IP_TRANSPARENT requires Linux support and elevated network privileges.
+        remote_socket.setsockopt(socket.SOL_IP, socket.IP_TRANSPARENT, 1)
+        remote_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        remote_socket.bind((client_ip, client_port))
+    except Exception:
+        remote_socket.close()
+        raise
+    return remote_socket
+
+
 async def handle_connection(
     src_reader: asyncio.StreamReader,
     src_writer: asyncio.StreamWriter,
     runtime_state: ProxyRuntimeState,
+    metrics: Optional[MetricsRegistry] = None,
 ) -> None:
-    """Bridge a redirected client connection to its original destination."""
+    """Bridge a client connection to its original destination or the configured upstream."""
     client_addr = src_writer.get_extra_info("peername")
     sock = src_writer.get_extra_info("socket")
+    source = runtime_state.snapshot().source
 
     if not client_addr or not sock:
         src_writer.close()
@@ -270,35 +473,33 @@ async def handle_connection(
         return
 
     try:
-        orig_dst_ip, orig_dst_port = get_original_dest(sock)
-        client_ip, client_port = client_addr
+        client_ip, client_port = client_addr[:2]
+        if source.transparent:
+            dst_host, dst_port = get_original_dest(sock)
+        else:
+            dst_host, dst_port = source.upstream_host, source.upstream_port
     except Exception as exc:
         log_event("connection_rejected", reason="original_dest_lookup", error=str(exc))
         src_writer.close()
         await src_writer.wait_closed()
         return
 
-    connection_id = f"{client_ip}:{client_port}->{orig_dst_ip}:{orig_dst_port}@{int(time.time() * 1000)}"
+    connection_id = f"{client_ip}:{client_port}->{dst_host}:{dst_port}@{int(time.time() * 1000)}"
     log_event(
         "connection_open",
         connection_id=connection_id,
+        mode=source.mode,
         client_ip=client_ip,
         client_port=client_port,
-        original_dst_ip=orig_dst_ip,
-        original_dst_port=orig_dst_port,
+        original_dst_ip=dst_host,
+        original_dst_port=dst_port,
     )
 
-    remote_writer: Optional[asyncio.StreamWriter] = None
-
-    try:
-        remote_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        remote_socket.setblocking(False)
-        # IP_TRANSPARENT requires Linux support and elevated network privileges.
-        remote_socket.setsockopt(socket.SOL_IP, socket.IP_TRANSPARENT, 1)
-
+    remote_socket: Optional[socket.socket] = None
+    if source.transparent:
+        # Rejected before any upstream exists, so there is no connection to close or count.
         try:
-            remote_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            remote_socket.bind((client_ip, client_port))
+            remote_socket = bind_transparent_socket(client_ip, client_port)
         except Exception as exc:
             log_event(
                 "connection_rejected",
@@ -310,10 +511,27 @@ async def handle_connection(
             await src_writer.wait_closed()
             return
 
-        loop = asyncio.get_running_loop()
-        await loop.sock_connect(remote_socket, (orig_dst_ip, orig_dst_port))
+    remote_writer: Optional[asyncio.StreamWriter] = None
+    added_latency_us: dict[str, Any] = {}
+    metrics = metrics or runtime_state.metrics
+    metrics.connections_total.labels().value += 1
+    metrics.connections_active.labels().value += 1
 
-        remote_reader, remote_writer = await asyncio.open_connection(sock=remote_socket)
+    try:
+        if remote_socket is not None:
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.sock_connect(remote_socket, (dst_host, dst_port))
+            except BaseException:
+                remote_socket.close()
+                raise
+            remote_reader, remote_writer = await asyncio.open_connection(sock=remote_socket)
+            orig_dst_ip = dst_host
+        else:
+            remote_reader, remote_writer = await asyncio.open_connection(dst_host, dst_port)
+            # Direction rules match IP pairs, so use the address the upstream host resolved to.
+            orig_dst_ip = remote_writer.get_extra_info("peername")[0]
+        orig_dst_port = dst_port
 
         client_to_remote = asyncio.create_task(
             forward_data(
@@ -326,6 +544,8 @@ async def handle_connection(
                     source_ip=client_ip,
                     target_ip=orig_dst_ip,
                 ),
+                source_transport=src_writer.transport,
+                metrics=metrics,
             )
         )
         remote_to_client = asyncio.create_task(
@@ -339,48 +559,108 @@ async def handle_connection(
                     source_ip=orig_dst_ip,
                     target_ip=client_ip,
                 ),
+                source_transport=remote_writer.transport,
+                metrics=metrics,
             )
         )
 
         # A TCP half-close in one direction is not the end of the whole exchange.
-        await asyncio.gather(
+        results = await asyncio.gather(
             client_to_remote,
             remote_to_client,
             return_exceptions=True,
         )
+        added_latency_us = {
+            "client_to_remote": results[0] if isinstance(results[0], dict) else {},
+            "remote_to_client": results[1] if isinstance(results[1], dict) else {},
+        }
 
     except ConnectionRefusedError:
         log_event("connection_refused", connection_id=connection_id)
     except Exception as exc:
         log_event("connection_error", connection_id=connection_id, error=str(exc))
     finally:
+        metrics.connections_active.labels().value -= 1
         src_writer.close()
         await src_writer.wait_closed()
         if remote_writer is not None:
             remote_writer.close()
             await remote_writer.wait_closed()
 
-    log_event("connection_closed", connection_id=connection_id)
+    log_event("connection_closed", connection_id=connection_id, added_latency_us=added_latency_us)
+
+
+async def sweep_replay_sessions(runtime_state: ProxyRuntimeState) -> None:
+    """Expire idle replay sessions even when no traffic reaches their rule set.
+
+    Ticks at half the configured idle timeout, read again after every tick so
+    reloads apply. A sweep stops at the first session of each store that is still live.
+    """
+    while True:
+        handler, _ = runtime_state.current_handler()
+        await asyncio.sleep(handler.config.replay_sessions.idle_timeout_s / 2)
+        handler, _ = runtime_state.current_handler()
+        expired = handler.expire_replay_sessions()
+        if expired:
+            log_event("replay_sessions_expired", count=expired, config_version=handler.config_version)
 
 
-async def start_proxy(src_host: str, src_port: int, runtime_state: ProxyRuntimeState) -> None:
-    """Bind the transparent listening socket and serve connections forever."""
+async def start_proxy(
+    src_host: str,
+    src_port: int,
+    runtime_state: ProxyRuntimeState,
+    *,
+    reuse_port: bool = False,
+    serve_metrics: bool = True,
+    sweep_sessions: bool = True,
+    metrics: Optional[MetricsRegistry] = None,
+    on_listening: Optional[Callable[[], None]] = None,
+) -> None:
+    """Bind the listening socket and serve connections forever.
+
+    Workers pass ``reuse_port`` so each binds its own socket on the shared port and
+    the kernel spreads new connections across them; the supervisor serves metrics.
+    Event loops sharing one process each pass their own ``metrics`` registry, and
+    only one of them sweeps the shared replay sessions. ``on_listening`` is called
+    once the listener is bound, so callers waiting on it see bind failures instead.
+    """
+    source = runtime_state.snapshot().source
     listening_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     listening_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    # The proxy is intended for transparent interception, not ordinary TCP forwarding.
-    listening_socket.setsockopt(socket.SOL_IP, socket.IP_TRANSPARENT, 1)
+    if reuse_port:
+        listening_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    if source.transparent:
+        # Accept connections redirected by TPROXY rules for addresses that are not local.
+        listening_socket.setsockopt(socket.SOL_IP, socket.IP_TRANSPARENT, 1)
 
-    listening_socket.bind((src_host, src_port))
-    listening_socket.listen(socket.SOMAXCONN)
+    try:
+        listening_socket.bind((src_host, src_port))
+        listening_socket.listen(socket.SOMAXCONN)
+    except OSError:
+        listening_socket.close()
+        raise
     listening_socket.setblocking(False)
 
     server = await asyncio.start_server(
-        partial(handle_connection, runtime_state=runtime_state),
+        partial(handle_connection, runtime_state=runtime_state, metrics=metrics),
         sock=listening_socket,
     )
 
     addr = server.sockets[0].getsockname()
-    log_event("proxy_listening", host=addr[0], port=addr[1], transparent=True)
+    log_event(
+        "proxy_listening",
+        host=addr[0],
+        port=addr[1],
+        transparent=source.transparent,
+        upstream_host=source.upstream_host,
+        upstream_port=source.upstream_port,
+    )
+
+    if on_listening is not None:
+        on_listening()
+
+    metrics_server = await start_metrics_endpoint(runtime_state) if serve_metrics else None
+    sweeper = asyncio.create_task(sweep_replay_sessions(runtime_state)) if sweep_sessions else None
 
     try:
         async with server:
@@ -388,6 +668,233 @@ async def start_proxy(src_host: str, src_port: int, runtime_state: ProxyRuntimeS
     except asyncio.CancelledError:
         log_event("server_cancelled")
         raise
+    finally:
+        if sweeper is not None:
+            sweeper.cancel()
+        if metrics_server is not None:
+            metrics_server.close()
+
+
+async def start_metrics_endpoint(
+    runtime_state: ProxyRuntimeState,
+    render: Optional[Callable[[], Coroutine[Any, Any, str]]] = None,
+) -> Optional[asyncio.AbstractServer]:
+    """Start the scrape endpoint when the config enables it."""
+    metrics_config = runtime_state.snapshot().payload_handler.config.metrics
+    if not metrics_config.enabled:
+        return None
+
+    metrics_server = await start_metrics_server(runtime_state.metrics, metrics_config, render=render)
+    log_event(
+        "metrics_listening",
+        unix_socket=metrics_config.unix_socket,
+        host=None if metrics_config.unix_socket else metrics_config.host,
+        port=None if metrics_config.unix_socket else metrics_config.port,
+    )
+    return metrics_server
+
+
+async def serve_worker(runtime_state: ProxyRuntimeState, control: socket.socket) -> None:
+    """Run one worker's listener until the supervisor disconnects or stops it."""
+    stop_requested = _stop_on_sigterm()
+    source = runtime_state.snapshot().source
+
+    proxy = asyncio.create_task(
+        start_proxy(source.host, source.port, runtime_state, reuse_port=True, serve_metrics=False)
+    )
+    channel = asyncio.create_task(
+        serve_control_channel(control, runtime_state.metrics, runtime_state.reload_from_file)
+    )
+    try:
+        done, _ = await asyncio.wait({proxy, channel, stop_requested}, return_when=asyncio.FIRST_COMPLETED)
+        for task in done - {stop_requested}:
+            task.result()
+    finally:
+        for task in (proxy, channel):
+            task.cancel()
+        await asyncio.gather(proxy, channel, return_exceptions=True)
+
+
+def run_worker(runtime_state: ProxyRuntimeState, index: int, control: socket.socket) -> None:
+    """Entry point of a forked worker process; it owns a copy of the loaded runtime state."""
+    # Ctrl-C reaches the whole process group; the supervisor decides when workers stop.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    event_log.set_context(worker=index)
+    event_log.configure(runtime_state.snapshot().payload_handler.config.logging)
+    try:
+        run_event_loop(serve_worker(runtime_state, control))
+    except Exception as exc:
+        log_event("runtime_error", error=str(exc))
+        raise
+    finally:
+        runtime_state.close()
+        event_log.shutdown()
+
+
+async def supervise_workers(runtime_state: ProxyRuntimeState, workers: list[WorkerHandle]) -> None:
+    """Fan reloads out to the workers, aggregate their metrics, and stop them on exit."""
+    loop = asyncio.get_running_loop()
+    stop_requested = _stop_on_sigterm()
+    for worker in workers:
+        await worker.connect()
+
+    def request_reloads() -> None:
+        for worker in workers:
+            worker.request_reload()
+
+    def fan_out_reload(_config_version: int) -> None:
+        # Reloads run on the watchdog thread; the channels belong to this loop.
+        loop.call_soon_threadsafe(request_reloads)
+
+    runtime_state.add_reload_listener(fan_out_reload)
+    metrics_server = await start_metrics_endpoint(runtime_state, render=partial(aggregate_metrics, workers))
+    log_event("workers_started", mode="process", count=len(workers), pids=[worker.pid for worker in workers])
+
+    async def watch(worker: WorkerHandle) -> None:
+        exit_code = await worker.wait_exited()
+        log_event("worker_exited", worker=worker.index, pid=worker.pid, exit_code=exit_code)
+
+    watchers = [asyncio.create_task(watch(worker)) for worker in workers]
+    try:
+        # asyncio.wait, unlike gather, leaves the watchers running when this task is cancelled.
+        pending = set(watchers)
+        while pending and not stop_requested.done():
+            _, pending = await asyncio.wait(pending | {stop_requested}, return_when=asyncio.FIRST_COMPLETED)
+            pending.discard(stop_requested)
+        if stop_requested.done():
+            log_event("shutdown", reason="sigterm")
+    finally:
+        if metrics_server is not None:
+            metrics_server.close()
+        for worker in workers:
+            if worker.alive:
+                with contextlib.suppress(ProcessLookupError):
+                    os.kill(worker.pid, signal.SIGTERM)
+        _, pending = await asyncio.wait(watchers, timeout=10)
+        for worker in workers:
+            if worker.alive:
+                with contextlib.suppress(ProcessLookupError):
+                    os.kill(worker.pid, signal.SIGKILL)
+        if pending:
+            await asyncio.wait(pending)
+        for worker in workers:
+            worker.close()
+
+
+def run_loop_thread(
+    runtime_state: ProxyRuntimeState,
+    index: int,
+    metrics: MetricsRegistry,
+    started: concurrent.futures.Future,
+) -> None:
+    """Thread target: run one extra event loop with its own ``SO_REUSEPORT`` listener.
+
+    ``started`` resolves once the listener is bound, or with the error that stopped it.
+    """
+    source = runtime_state.snapshot().source
+
+    async def serve() -> None:
+        loop, task = asyncio.get_running_loop(), asyncio.current_task()
+        await start_proxy(
+            source.host,
+            source.port,
+            runtime_state,
+            reuse_port=True,
+            serve_metrics=False,
+            sweep_sessions=False,
+            metrics=metrics,
+            on_listening=lambda: started.set_result((loop, task)),
+        )
+
+    try:
+        with asyncio.Runner(loop_factory=uvloop.new_event_loop if uvloop is not None else None) as runner:
+            runner.run(serve())
+    except asyncio.CancelledError:
+        pass
+    except Exception as exc:
+        log_event("runtime_error", loop=index, error=str(exc))
+        if not started.done():
+            started.set_exception(exc)
+
+
+async def serve_thread_loops(runtime_state: ProxyRuntimeState, count: int) -> None:
+    """Serve the listener from ``count`` event loops in one process.
+
+    The calling loop is loop 0 and also serves metrics and sweeps replay sessions;
+    the others run in threads.
+    All loops share ``runtime_state`` and therefore one payload handler generation,
+    but each keeps its own metrics registry, which is merged on scrape.
+    """
+    stop_requested = _stop_on_sigterm()
+    source = runtime_state.snapshot().source
+    registries = [runtime_state.metrics] + [MetricsRegistry() for _ in range(1, count)]
+    threads: list[tuple[threading.Thread, asyncio.AbstractEventLoop, asyncio.Task]] = []
+
+    try:
+        for index in range(1, count):
+            started: concurrent.futures.Future = concurrent.futures.Future()
+            thread = threading.Thread(
+                target=run_loop_thread,
+                args=(runtime_state, index, registries[index], started),
+                name=f"proxy-loop-{index}",
+                daemon=True,
+            )
+            thread.start()
+            thread_loop, thread_task = await asyncio.wrap_future(started)
+            threads.append((thread, thread_loop, thread_task))
+
+        async def render_metrics() -> str:
+            merged = MetricsRegistry()
+            merged.merge_state(runtime_state.metrics.export_state())
+            for (_, thread_loop, _), registry in zip(threads, registries[1:]):
+                # Export on the owning loop so its registry is never read mid-update.
+                state = await asyncio.wrap_future(
+                    asyncio.run_coroutine_threadsafe(_export_metrics(registry), thread_loop)
+                )
+                merged.merge_state(state)
+            return merged.render()
+
+        metrics_server = await start_metrics_endpoint(runtime_state, render=render_metrics)
+        log_event("workers_started", mode="thread", count=count)
+        proxy = asyncio.create_task(
+            start_proxy(source.host, source.port, runtime_state, reuse_port=True, serve_metrics=False)
+        )
+        try:
+            done, _ = await asyncio.wait({proxy, stop_requested}, return_when=asyncio.FIRST_COMPLETED)
+            if proxy in done:
+                proxy.result()
+            if stop_requested.done():
+                log_event("shutdown", reason="sigterm")
+        finally:
+            proxy.cancel()
+            await asyncio.gather(proxy, return_exceptions=True)
+            if metrics_server is not None:
+                metrics_server.close()
+    finally:
+        loop = asyncio.get_running_loop()
+        for thread, thread_loop, thread_task in threads:
+            thread_loop.call_soon_threadsafe(thread_task.cancel)
+        for thread, _, _ in threads:
+            await loop.run_in_executor(None, thread.join, 10)
+
+
+async def _export_metrics(registry: MetricsRegistry) -> dict[str, Any]:
+    return registry.export_state()
+
+
+def _stop_on_sigterm() -> asyncio.Future:
+    """Future that completes on SIGTERM, so shutdown runs as normal code instead of a cancel."""
+    loop = asyncio.get_running_loop()
+    stop_requested = loop.create_future()
+    loop.add_signal_handler(signal.SIGTERM, lambda: stop_requested.done() or stop_requested.set_result(None))
+    return stop_requested
+
+
+def run_event_loop(main_coro: Coroutine[Any, Any, None]) -> None:
+    if uvloop is not None:
+        uvloop.run(main_coro)
+    else:
+        asyncio.run(main_coro)
 
 
 def main() -> None:
@@ -404,6 +911,15 @@ def main() -> None:
         log_event("startup_failed", reason="config_read", error=str(exc))
         return
 
+    workers_config = runtime_state.snapshot().payload_handler.config.workers
+    workers: list[WorkerHandle] = []
+    if workers_config.count > 1 and workers_config.mode == "process":
+        # Fork before the log writer and watchdog threads exist; each worker starts its own.
+        workers = [fork_worker(index, partial(run_worker, runtime_state)) for index in range(workers_config.count)]
+
+    # Switch to the batched writer only after startup errors had a chance to print.
+    event_log.configure(runtime_state.snapshot().payload_handler.config.logging)
+
     observer = None
     if Observer is not None:
         event_handler = ConfigReloader(runtime_state)
@@ -420,10 +936,12 @@ def main() -> None:
     src_port = source.port
 
     try:
-        if uvloop is not None:
-            uvloop.run(start_proxy(src_host, src_port, runtime_state))
+        if workers:
+            run_event_loop(supervise_workers(runtime_state, workers))
+        elif workers_config.count > 1:
+            run_event_loop(serve_thread_loops(runtime_state, workers_config.count))
         else:
-            asyncio.run(start_proxy(src_host, src_port, runtime_state))
+            run_event_loop(start_proxy(src_host, src_port, runtime_state))
     except KeyboardInterrupt:
         log_event("shutdown", reason="keyboard_interrupt")
     except Exception as exc:
@@ -432,6 +950,8 @@ def main() -> None:
         if observer is not None:
             observer.stop()
             observer.join()
+        runtime_state.close()
+        event_log.shutdown()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,45 @@
+import pickle
+
+import numpy as np
+
+from utils.action_scan import scan_action
+from utils.contracts import ACTION_UNKNOWN
+
+
+def dumps(message):
+    return pickle.dumps(message, protocol=4)
+
+
+def test_scan_action_reads_first_and_later_top_level_keys():
+    assert scan_action(dumps({"action": "sift", "data": np.arange(1000)})) == "sift"
+    assert scan_action(dumps({"data": np.arange(100000, dtype=np.uint8), "action": "late"})) == "late"
+    assert scan_action(dumps({"action": "only"})) == "only"
+    assert scan_action(memoryview(dumps({"seq": 1, "action": "view"}))) == "view"
+
+
+def test_scan_action_does_not_mistake_nested_action_keys():
+    message = {"meta": {"action": "inner"}, "items": ["action", "x"], "action": "outer"}
+
+    assert scan_action(dumps(message)) == "outer"
+    assert scan_action(dumps({"meta": {"action": "inner"}})) is ACTION_UNKNOWN
+
+
+def test_scan_action_reports_missing_or_non_string_actions_as_none():
+    assert scan_action(dumps({"seq": 1})) is None
+    assert scan_action(dumps({"action": 7})) is None
+    assert scan_action(dumps({"action": None, "data": b"x"})) is None
+
+
+def test_scan_action_handles_batched_setitems():
+    message = {f"key_{idx}": idx for idx in range(2500)}
+    message["action"] = "batched"
+
+    assert scan_action(dumps(message)) == "batched"
+
+
+def test_scan_action_defers_to_full_decode_when_unsure():
+    assert scan_action(dumps(["action", "x"])) is ACTION_UNKNOWN
+    assert scan_action(dumps({})) is ACTION_UNKNOWN
+    assert scan_action(b"#comment") is ACTION_UNKNOWN
+    assert scan_action(dumps({"action": ("not", "a", "str")})) is ACTION_UNKNOWN
+    assert scan_action(dumps({"action": "truncated", "data": 1})[:14]) is ACTION_UNKNOWN
@@ -1,4 +1,8 @@
+import pickle
+
 from utils.config_loading import ConfigValidationError, normalize_proxy_config
+from utils.contracts import InsertRuleConfig, ReplayRuleConfig
+from utils.frame_encoding import encode_frame
 
 
 def test_normalize_proxy_config_builds_typed_rule_sets():
@@ -71,3 +75,285 @@ def test_normalize_proxy_config_warns_and_skips_invalid_direction_entries():
     assert any("Skipping direction 'broken'" in warning for warning in loaded.warnings)
     assert any("non-string source_ip" in warning for warning in loaded.warnings)
     assert any("non-string target_ip" in warning for warning in loaded.warnings)
+
+
+def test_normalize_proxy_config_parses_decoding_offload_settings():
+    loaded = normalize_proxy_config(
+        {
+            "decoding": {"offload_threshold_bytes": 1048576, "offload_executor": "thread", "offload_workers": 3},
+            "payload_handling": {"global": {}},
+        }
+    )
+
+    assert loaded.config.decoding.offload_threshold_bytes == 1048576
+    assert loaded.config.decoding.offload_executor == "thread"
+    assert loaded.config.decoding.offload_workers == 3
+
+    try:
+        normalize_proxy_config({"decoding": {"offload_executor": "gpu"}, "payload_handling": {"global": {}}})
+    except ConfigValidationError as exc:
+        assert exc.errors == ["decoding.offload_executor must be 'thread' or 'process'"]
+    else:
+        raise AssertionError("Expected invalid offload executor to fail validation")
+
+
+def test_normalize_proxy_config_parses_forwarding_settings():
+    loaded = normalize_proxy_config(
+        {
+            "forwarding": {"write_high_water_bytes": 65536, "tcp_cork": True, "delay_max_pending_bytes": 1024},
+            "payload_handling": {"global": {}},
+        }
+    )
+
+    assert loaded.config.forwarding.write_high_water_bytes == 65536
+    assert loaded.config.forwarding.tcp_cork is True
+    assert loaded.config.forwarding.delay_max_pending_bytes == 1024
+
+    try:
+        normalize_proxy_config({"forwarding": {"tcp_cork": "yes"}, "payload_handling": {"global": {}}})
+    except ConfigValidationError as exc:
+        assert exc.errors == ["forwarding.tcp_cork must be a boolean"]
+    else:
+        raise AssertionError("Expected non-boolean tcp_cork to fail validation")
+
+
+def test_normalize_proxy_config_parses_logging_writer_settings():
+    loaded = normalize_proxy_config(
+        {
+            "logging": {"writer": "sync", "queue_size": 50, "batch_size": 8, "overflow": "block"},
+            "payload_handling": {"global": {}},
+        }
+    )
+
+    assert loaded.config.logging.writer == "sync"
+    assert loaded.config.logging.queue_size == 50
+    assert loaded.config.logging.batch_size == 8
+    assert loaded.config.logging.overflow == "block"
+
+    try:
+        normalize_proxy_config({"logging": {"overflow": "spill"}, "payload_handling": {"global": {}}})
+    except ConfigValidationError as exc:
+        assert exc.errors == ["logging.overflow must be 'drop' or 'block'"]
+    else:
+        raise AssertionError("Expected invalid overflow policy to fail validation")
+
+
+def test_normalize_proxy_config_parses_logging_levels_and_sampling():
+    loaded = normalize_proxy_config(
+        {
+            "logging": {
+                "level": "warning",
+                "events": {"frame_decision": "info"},
+                "frame_decisions": "non_default",
+                "sampling": {"default": 0.5, "directions": {"a_to_b": 0.1}, "actions": {"ping": 0}},
+            },
+            "payload_handling": {"global": {}},
+        }
+    )
+
+    logging_config = loaded.config.logging
+    assert logging_config.level == "warning"
+    assert logging_config.events == {"frame_decision": "info"}
+    assert logging_config.frame_decisions == "non_default"
+    assert logging_config.sample_rate == 0.5
+    assert logging_config.direction_sample_rates == {"a_to_b": 0.1}
+    assert logging_config.action_sample_rates == {"ping": 0.0}
+
+    try:
+        normalize_proxy_config(
+            {"logging": {"sampling": {"actions": {"ping": 2}}}, "payload_handling": {"global": {}}}
+        )
+    except ConfigValidationError as exc:
+        assert exc.errors == ["logging.sampling.actions.ping must be a number between 0 and 1"]
+    else:
+        raise AssertionError("Expected out-of-range sample rate to fail validation")
+
+
+def test_normalize_proxy_config_parses_metrics_endpoint():
+    loaded = normalize_proxy_config(
+        {
+            "metrics": {"enabled": True, "unix_socket": "/run/tcp_proxy/metrics.sock"},
+            "payload_handling": {"global": {}},
+        }
+    )
+
+    assert loaded.config.metrics.enabled is True
+    assert loaded.config.metrics.unix_socket == "/run/tcp_proxy/metrics.sock"
+    assert loaded.config.metrics.port == 9100
+
+    try:
+        normalize_proxy_config({"metrics": {"port": 0}, "payload_handling": {"global": {}}})
+    except ConfigValidationError as exc:
+        assert exc.errors == ["metrics.port must be an integer between 1 and 65535"]
+    else:
+        raise AssertionError("Expected invalid metrics port to fail validation")
+
+
+def test_normalize_proxy_config_parses_explicit_upstream_mode():
+    loaded = normalize_proxy_config(
+        {
+            "src": {"port": 9000, "mode": "upstream", "upstream": {"host": "127.0.0.1", "port": 9001}},
+            "payload_handling": {"global": {}},
+        }
+    )
+
+    source = loaded.config.source
+    assert source.transparent is False
+    assert (source.upstream_host, source.upstream_port) == ("127.0.0.1", 9001)
+    assert normalize_proxy_config({"payload_handling": {"global": {}}}).config.source.transparent is True
+
+    try:
+        normalize_proxy_config({"src": {"mode": "upstream", "upstream": {"host": ""}}, "payload_handling": {}})
+    except ConfigValidationError as exc:
+        assert exc.errors == [
+            "src.upstream.host must be a non-empty string",
+            "src.upstream.port must be an integer between 1 and 65535",
+        ]
+    else:
+        raise AssertionError("Expected incomplete upstream to fail validation")
+
+
+def test_normalize_proxy_config_parses_worker_settings():
+    loaded = normalize_proxy_config({"workers": {"count": 4}, "payload_handling": {"global": {}}})
+
+    assert (loaded.config.workers.count, loaded.config.workers.mode) == (4, "process")
+
+    try:
+        normalize_proxy_config({"workers": {"count": 0, "mode": "fibers"}, "payload_handling": {}})
+    except ConfigValidationError as exc:
+        assert exc.errors == ["workers.count must be a positive integer", "workers.mode must be 'process' or 'thread'"]
+    else:
+        raise AssertionError("Expected invalid worker settings to fail validation")
+
+
+def test_normalize_proxy_config_parses_cidr_and_wildcard_directions():
+    loaded = normalize_proxy_config(
+        {
+            "payload_handling": {
+                "global": {},
+                "directions": {
+                    "lab": {"source_ip": "10.10.20.5/24", "target_ip": "*"},
+                    "lab_again": {"source_ip": "10.10.20.0/24", "target_ip": "*"},
+                    "half": {"source_ip": "10.10.20.11"},
+                },
+            }
+        }
+    )
+
+    lab, lab_again, half = loaded.config.directions
+    assert (lab.source_ip, lab.target_ip) == ("10.10.20.0/24", "*")
+    assert (lab_again.source_ip, lab_again.target_ip) == ("10.10.20.0/24", "*")
+    assert half.target_ip is None
+    assert any("'lab_again' matches the same source_ip and target_ip as 'lab'" in warning for warning in loaded.warnings)
+    assert any("'half' has no target_ip" in warning for warning in loaded.warnings)
+
+    try:
+        normalize_proxy_config(
+            {"payload_handling": {"directions": {"typo": {"source_ip": "10.0.0.300", "target_ip": "*"}}}}
+        )
+    except ConfigValidationError as exc:
+        assert exc.errors == [
+            "payload_handling.directions.typo.source_ip must be an IP address, CIDR prefix, or '*'"
+        ]
+    else:
+        raise AssertionError("Expected an invalid direction address to fail validation")
+
+
+def test_normalize_proxy_config_decodes_insert_rules_and_warns_about_invalid_ones():
+    loaded = normalize_proxy_config(
+        {
+            "payload_handling": {
+                "global": {
+                    "insert": [
+                        {"action": "ok", "data": "de ad", "position": "after", "repeat": 2, "delay_ms": 3},
+                        {"action": "once", "data": "aa", "repeat": False},
+                        {"action": "bad_hex", "data": "xyz"},
+                        {"action": "bad_position", "data": "aa", "position": "middle"},
+                        {"action": "bad_repeat", "data": "aa", "repeat": 0},
+                    ]
+                }
+            }
+        }
+    )
+
+    assert loaded.config.global_rules.insert_rules == [
+        InsertRuleConfig(action="ok", data=b"\xde\xad", position="after", repeat=2, delay_ms=3),
+        InsertRuleConfig(action="once", data=b"\xaa", once=True),
+        InsertRuleConfig(action="bad_repeat", data=b"\xaa"),
+    ]
+    assert "Skipping payload_handling.global.insert rule for action 'bad_hex': data is not valid hex." in loaded.warnings
+    assert any("'bad_position' with position 'middle'" in warning for warning in loaded.warnings)
+    assert any("'bad_repeat' has invalid repeat 0; using 1." in warning for warning in loaded.warnings)
+
+
+def test_normalize_proxy_config_validates_replay_rules_and_warns_about_invalid_ones():
+    loaded = normalize_proxy_config(
+        {
+            "payload_handling": {
+                "global": {
+                    "replay": [
+                        {"action": "echo", "count": 2, "data": "bb", "delay_ms": 10},
+                        {"action": "ack", "count": 1, "data": {"action": "ack"}, "block_original": True},
+                        {"action": "bad_source", "count": 1, "source": "socket"},
+                        {"action": "bad_data", "count": 1, "data": {"handle": lambda: None}},
+                        {"action": "bad_count", "count": 0},
+                        {"action": "no_count"},
+                    ]
+                }
+            }
+        }
+    )
+
+    assert loaded.config.global_rules.replay_rules == [
+        ReplayRuleConfig(action="echo", count=2, delay_ms=10, data=b"bb"),
+        ReplayRuleConfig(action="ack", block_original=True, data=encode_frame({"action": "ack"})),
+        ReplayRuleConfig(action="bad_source"),
+    ]
+    assert (
+        "payload_handling.global.replay rule for action 'bad_source' has invalid source 'socket'; using 'data'."
+        in loaded.warnings
+    )
+    assert any("'bad_data': data cannot be pickled" in warning for warning in loaded.warnings)
+    assert any("'bad_count' with invalid count 0." in warning for warning in loaded.warnings)
+    assert "Skipping payload_handling.global.replay rule without a count." in loaded.warnings
+
+
+def test_normalize_proxy_config_parses_replay_session_limits():
+    loaded = normalize_proxy_config(
+        {"payload_handling": {}, "replay_sessions": {"max_sessions": 50, "idle_timeout_s": 2}}
+    )
+    assert (loaded.config.replay_sessions.max_sessions, loaded.config.replay_sessions.idle_timeout_s) == (50, 2.0)
+
+    try:
+        normalize_proxy_config({"payload_handling": {}, "replay_sessions": {"max_sessions": 0, "idle_timeout_s": -1}})
+    except ConfigValidationError as exc:
+        assert exc.errors == [
+            "replay_sessions.max_sessions must be a positive integer",
+            "replay_sessions.idle_timeout_s must be a positive number",
+        ]
+    else:
+        raise AssertionError("Expected invalid replay session limits to fail validation")
+
+
+def test_normalize_proxy_config_compiles_insert_message_templates():
+    loaded = normalize_proxy_config(
+        {
+            "payload_handling": {
+                "global": {
+                    "insert": [
+                        {"action": "static", "message": {"action": "ack", "seq": 0}},
+                        {"action": "dynamic", "message": {"action": "ack", "seq": {"$counter": 1}}},
+                        {"action": "both", "data": "aa", "message": {"action": "ack"}},
+                        {"action": "broken", "message": {"action": "ack", "seq": {"$copy": ""}}},
+                    ]
+                }
+            }
+        }
+    )
+
+    static, dynamic = loaded.config.global_rules.insert_rules
+    assert static.template is None
+    assert pickle.loads(static.data[4:]) == {"action": "ack", "seq": 0}
+    assert dynamic.data == b"" and dynamic.template is not None
+    assert "Skipping payload_handling.global.insert rule for action 'both': use either data or message." in loaded.warnings
+    assert any("'broken': field 'seq': $copy needs a field name." in warning for warning in loaded.warnings)
@@ -1,5 +1,6 @@
 import pickle
 
+from utils import frame_encoding
 from utils.decode_pickle import PickleDecoder
 
 
@@ -62,3 +63,109 @@ def test_restricted_unpickler_rejects_unsafe_globals():
     assert len(frames) == 1
     assert frames[0].decoded is None
     assert "not allowed" in frames[0].decode_error
+
+
+def test_zero_copy_frames_are_views_into_one_chunk():
+    decoder = PickleDecoder(zero_copy=True)
+    frame1 = encode_frame({"action": "a"})
+    frame2 = encode_frame({"action": "b"})
+    chunk = frame1 + frame2 + frame1[:3]
+
+    frames = decoder.add_data_frames(chunk)
+
+    assert [frame.decoded["action"] for frame in frames] == ["a", "b"]
+    assert all(isinstance(frame.raw_frame, memoryview) for frame in frames)
+    assert frames[0].raw_frame.obj is frames[1].raw_frame.obj
+    assert frames[0].raw_frame == frame1
+    assert frames[1].payload == frame2[4:]
+    assert bytes(decoder.buffer) == frame1[:3]
+
+
+def test_large_frame_split_across_many_reads_is_assembled_once():
+    decoder = PickleDecoder(zero_copy=True)
+    frame = encode_frame({"action": "big", "blob": b"x" * 10000})
+    pieces = [frame[idx:idx + 1000] for idx in range(0, len(frame), 1000)]
+
+    frames = []
+    for piece in pieces:
+        frames.extend(decoder.add_data_frames(piece))
+
+    assert len(frames) == 1
+    assert frames[0].raw_frame == frame
+    assert frames[0].decoded["blob"] == b"x" * 10000
+    assert len(decoder.buffer) == 0
+
+
+def test_frames_are_decoded_only_on_first_access():
+    decoder = PickleDecoder()
+    frames = decoder.add_data_frames(encode_frame({"action": "lazy"}))
+
+    assert frames[0].is_decoded is False
+    assert frames[0].decoded == {"action": "lazy"}
+    assert frames[0].is_decoded is True
+    assert frames[0].decode_error is None
+
+
+def test_action_scan_is_used_only_for_large_frames():
+    decoder = PickleDecoder(action_scan_min_bytes=1024)
+    small, large = decoder.add_data_frames(
+        encode_frame({"action": "small"}) + encode_frame({"action": "large", "blob": b"x" * 2048})
+    )
+
+    assert small.action == "small"
+    assert small.is_decoded is True
+    assert large.action == "large"
+    assert large.is_decoded is False
+
+
+def test_encoded_frames_round_trip_and_retained_views_release_large_chunks():
+    message = {"action": "ping", "seq": 7}
+    assert frame_encoding.encode_frame(message) == encode_frame(message)
+
+    small = encode_frame({"action": "a"})
+    chunk = small + encode_frame({"action": "b", "pad": b"x" * 4096})
+    decoder = PickleDecoder(zero_copy=True)
+    first, second = decoder.add_data_frames(chunk)
+
+    # A small slice of a big chunk is copied once; a slice covering most of it is kept.
+    assert type(frame_encoding.retain_frame(first.raw_frame)) is bytes
+    assert frame_encoding.retain_frame(first.raw_frame) == small
+    assert frame_encoding.retain_frame(second.raw_frame) is second.raw_frame
+
+
+def test_frame_templates_encode_static_parts_once_and_fill_fields_per_frame():
+    static = frame_encoding.compile_template({"action": "ack", "seq": 0})
+    assert static.static and static.render() == encode_frame({"action": "ack", "seq": 0})
+
+    template = frame_encoding.compile_template(
+        {
+            "action": "sift",
+            "seq": {"$counter": 100},
+            "session": {"$copy": "session"},
+            "meta": {"bits": {"$ndarray": {"dtype": "uint8", "shape": [3], "fill": 1}}},
+        }
+    )
+    assert template.needs_message
+    assert len(template.parts) == 3
+
+    frame = template.render(2, {"action": "raw_key", "session": "alice-bob"})
+    assert int.from_bytes(frame[:4], "big") == len(frame) - 4
+    message = pickle.loads(frame[4:])
+    assert (message["action"], message["seq"], message["session"]) == ("sift", 102, "alice-bob")
+    assert message["meta"]["bits"].tolist() == [1, 1, 1]
+    assert PickleDecoder().add_data_frames(frame)[0].decoded["seq"] == 102
+
+
+def test_frame_templates_reject_invalid_directives():
+    for message, reason in (
+        ({"action": "x", "seq": {"$counter": "one"}}, "needs an integer start value"),
+        ({"action": "x", "meta": {"seq": {"$counter": 1}}}, "only supported on top-level fields"),
+        ({"action": "x", "seq": {"$uuid": True}}, "unknown directive '$uuid'"),
+        ({"action": "x", "bits": {"$ndarray": {"dtype": "uint8"}}}, "invalid $ndarray spec"),
+    ):
+        try:
+            frame_encoding.compile_template(message)
+        except ValueError as exc:
+            assert reason in str(exc)
+        else:
+            raise AssertionError(f"Expected {message!r} to be rejected")
@@ -0,0 +1,54 @@
+import io
+import json
+import threading
+
+from utils import event_log
+from utils.contracts import LoggingConfig
+from utils.event_log import BatchedEventWriter
+
+
+class GatedStream(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.write_started = threading.Event()
+        self.release = threading.Event()
+
+    def write(self, text):
+        self.write_started.set()
+        self.release.wait(5)
+        return super().write(text)
+
+
+def read_events(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_configured_event_log_writes_in_order_and_flushes_on_shutdown():
+    stream = io.StringIO()
+    event_log.configure(LoggingConfig(writer="async", batch_size=4), stream=stream)
+    try:
+        for seq in range(10):
+            event_log.emit({"event": "frame_decision", "seq": seq})
+    finally:
+        stats = event_log.shutdown()
+
+    assert [event["seq"] for event in read_events(stream)] == list(range(10))
+    assert stats.written == 10
+    assert stats.dropped == 0
+
+
+def test_batched_writer_drops_and_reports_when_queue_is_full():
+    stream = GatedStream()
+    writer = BatchedEventWriter(LoggingConfig(queue_size=1, overflow="drop"), stream=stream)
+
+    writer.emit({"event": "first"})
+    assert stream.write_started.wait(5)
+    writer.emit({"event": "second"})
+    writer.emit({"event": "third"})
+    stream.release.set()
+    writer.close()
+
+    events = read_events(stream)
+    assert [event["event"] for event in events] == ["first", "second", "log_events_dropped"]
+    assert events[-1]["dropped_total"] == 1
+    assert writer.stats.dropped == 1
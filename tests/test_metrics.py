@@ -0,0 +1,131 @@
+import asyncio
+
+from utils.contracts import Insertion, MetricsConfig, RuleDecision
+from utils.metrics import LogHistogram, MetricsRegistry, start_metrics_server
+
+
+def test_direction_metrics_render_prometheus_text():
+    registry = MetricsRegistry()
+    direction = registry.direction("10.0.0.1", "10.0.0.2", frozenset({"slow", "drop_me"}))
+
+    direction.record_read(120)
+    direction.record_decision(
+        RuleDecision(
+            forward_original=True,
+            action="slow",
+            delayed_ms=20,
+            after_insertions=[Insertion(data=b"\xaa\xbb", position="after", tag="t")],
+        ),
+        frame_size=40,
+    )
+    direction.record_decision(
+        RuleDecision(forward_original=False, action="drop_me", drop_reason="block:global"),
+        frame_size=40,
+    )
+    direction.record_decision(RuleDecision(forward_original=True, decode_failed=True), frame_size=40)
+
+    text = registry.render()
+    assert 'tcp_proxy_received_bytes_total{direction="10.0.0.1->10.0.0.2"} 120' in text
+    assert 'tcp_proxy_frames_total{direction="10.0.0.1->10.0.0.2",action="slow"} 1' in text
+    assert 'tcp_proxy_frames_total{direction="10.0.0.1->10.0.0.2",action=""} 1' in text
+    assert 'tcp_proxy_forwarded_bytes_total{direction="10.0.0.1->10.0.0.2"} 80' in text
+    assert (
+        'tcp_proxy_frames_dropped_total{direction="10.0.0.1->10.0.0.2",drop_reason="block:global"} 1' in text
+    )
+    assert 'tcp_proxy_injected_bytes_total{direction="10.0.0.1->10.0.0.2"} 2' in text
+    assert 'tcp_proxy_decode_errors_total{direction="10.0.0.1->10.0.0.2"} 1' in text
+    assert 'tcp_proxy_frame_delay_ms_bucket{direction="10.0.0.1->10.0.0.2",le="10"} 0' in text
+    assert 'tcp_proxy_frame_delay_ms_bucket{direction="10.0.0.1->10.0.0.2",le="25"} 1' in text
+    assert "# TYPE tcp_proxy_connections_active gauge" in text
+
+
+def test_direction_metrics_export_decode_offloads_and_fallbacks():
+    registry = MetricsRegistry()
+    direction = registry.direction("10.0.0.1", "10.0.0.2")
+
+    direction.record_decision(RuleDecision(forward_original=True, offload_queue_delay_ms=0.3), frame_size=4096)
+    direction.record_decision(RuleDecision(forward_original=True, offload_queue_delay_ms=7.0), frame_size=4096)
+    direction.record_decision(RuleDecision(forward_original=True, offload_fallback=True), frame_size=4096)
+    direction.record_decision(RuleDecision(forward_original=True), frame_size=40)
+
+    text = registry.render()
+    assert 'tcp_proxy_decode_offloads_total{direction="10.0.0.1->10.0.0.2"} 2' in text
+    assert 'tcp_proxy_decode_offload_fallbacks_total{direction="10.0.0.1->10.0.0.2"} 1' in text
+    assert 'tcp_proxy_decode_offload_queue_delay_ms_bucket{direction="10.0.0.1->10.0.0.2",le="0.5"} 1' in text
+    assert 'tcp_proxy_decode_offload_queue_delay_ms_bucket{direction="10.0.0.1->10.0.0.2",le="10"} 2' in text
+    assert 'tcp_proxy_decode_offload_queue_delay_ms_count{direction="10.0.0.1->10.0.0.2"} 2' in text
+
+
+def test_metrics_server_serves_scrapes_and_rejects_other_paths():
+    registry = MetricsRegistry()
+    registry.connections_active.labels().value += 3
+
+    async def fetch(port, path):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        response = await reader.read()
+        writer.close()
+        return response.decode()
+
+    async def scenario():
+        server = await start_metrics_server(registry, MetricsConfig(enabled=True, host="127.0.0.1", port=0))
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return await fetch(port, "/metrics"), await fetch(port, "/")
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    metrics_response, missing_response = asyncio.run(scenario())
+    assert metrics_response.startswith("HTTP/1.1 200 OK")
+    assert "tcp_proxy_connections_active 3" in metrics_response
+    assert missing_response.startswith("HTTP/1.1 404")
+
+
+def test_metrics_server_closes_connections_that_never_finish_the_request():
+    async def scenario():
+        server = await start_metrics_server(
+            MetricsRegistry(), MetricsConfig(enabled=True, host="127.0.0.1", port=0), request_timeout_s=0.05
+        )
+        port = server.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n")
+            response = await asyncio.wait_for(reader.read(), timeout=5)
+            writer.close()
+            return response
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    assert asyncio.run(scenario()) == b""
+
+
+def test_log_histogram_percentiles_stay_within_bucket_precision():
+    histogram = LogHistogram()
+    for value in range(1, 10001):
+        histogram.record(value)
+    histogram.record(-5)
+
+    assert histogram.count == 10001
+    assert histogram.percentile(0.0) == 0
+    # Buckets are at most 1/8 of their value wide.
+    for quantile, exact in ((0.5, 5000), (0.99, 9900)):
+        assert exact <= histogram.percentile(quantile) <= exact * 1.125
+    assert histogram.percentile(1.0) == histogram.max == 10000
+
+
+def test_actions_outside_the_rules_share_one_label_series():
+    registry = MetricsRegistry()
+    direction = registry.direction("10.0.0.1", "10.0.0.2", frozenset({"slow"}))
+
+    for action in ["slow"] + [f"peer-chosen-{index}" for index in range(100)]:
+        direction.record_decision(RuleDecision(forward_original=True, action=action), frame_size=10)
+        direction.latency_recorders(action)[0].record(5)
+
+    text = registry.render()
+    assert 'tcp_proxy_frames_total{direction="10.0.0.1->10.0.0.2",action="slow"} 1' in text
+    assert 'tcp_proxy_frames_total{direction="10.0.0.1->10.0.0.2",action="other"} 100' in text
+    assert 'tcp_proxy_added_latency_us_count{direction="10.0.0.1->10.0.0.2",action="other"} 100' in text
+    assert "peer-chosen" not in text
+    assert len(registry.frames.export_state()) == 2
@@ -1,6 +1,9 @@
 import asyncio
+import json
+import pickle
 
 from utils.contracts import ForwardingContext, MessageFrame
+from utils.decode_pickle import PickleDecoder
 from utils.payload_handling import PayloadHandler
 
 
@@ -15,6 +18,11 @@ def make_frame(action, decode_error=None):
     )
 
 
+def encode_message(message):
+    payload = pickle.dumps(message, protocol=4)
+    return len(payload).to_bytes(4, "big") + payload
+
+
 def run_process(handler, frame, source_ip="10.0.0.1", target_ip="10.0.0.2"):
     return asyncio.run(
         handler.process_frame(
@@ -123,6 +131,97 @@ def test_replay_block_original_blocks_and_replays_once_per_blocked_call():
         assert decision.after_insertions[0].data == b"X"
 
 
+def test_replay_can_resend_the_original_frame_or_a_pre_encoded_message():
+    handler = PayloadHandler(
+        {
+            "payload_handling": {
+                "global": {
+                    "replay": [
+                        {"action": "echo", "count": 2, "source": "frame"},
+                        {"action": "forge", "count": 1, "data": {"action": "forged", "seq": 1}},
+                    ]
+                }
+            }
+        }
+    )
+    raw = encode_message({"action": "echo", "data": "body"})
+    frame = MessageFrame(length_prefix=raw[:4], payload=raw[4:], raw_frame=memoryview(raw), decoded={"action": "echo"})
+
+    echoed = run_process(handler, frame)
+    forged = run_process(handler, make_frame("forge"))
+
+    assert [insertion.data for insertion in echoed.after_insertions] == [raw, raw]
+    assert all(insertion.data is frame.raw_frame for insertion in echoed.after_insertions)
+    assert forged.after_insertions[0].data == encode_message({"action": "forged", "seq": 1})
+    assert handler.global_replay_action.needs_message("echo") is False
+
+
+def test_insert_message_templates_count_and_copy_fields_from_undecoded_frames():
+    handler = PayloadHandler(
+        {
+            "payload_handling": {
+                "global": {
+                    "insert": [
+                        {
+                            "action": "raw_key",
+                            "position": "after",
+                            "repeat": 2,
+                            "message": {"action": "ack", "seq": {"$counter": 1}, "round": {"$copy": "round"}},
+                        }
+                    ]
+                }
+            }
+        }
+    )
+
+    def pending_frame(message):
+        raw = encode_message(message)
+        return PickleDecoder().add_data_frames(raw)[0]
+
+    frame = pending_frame({"action": "raw_key", "round": 4})
+    first = run_process(handler, frame)
+    second = run_process(handler, pending_frame({"action": "raw_key", "round": 5}))
+
+    (insertion,) = first.after_insertions
+    decoder = PickleDecoder()
+    acks = [frame.decoded for frame in decoder.add_data_frames(insertion.data + second.after_insertions[0].data)]
+    assert acks == [
+        {"action": "ack", "seq": 1, "round": 4},
+        {"action": "ack", "seq": 2, "round": 4},
+        {"action": "ack", "seq": 3, "round": 5},
+        {"action": "ack", "seq": 4, "round": 5},
+    ]
+    assert decoder.buffer == b""
+
+
+def test_replay_block_on_one_connection_does_not_consume_frames_of_another():
+    handler = PayloadHandler(
+        {
+            "payload_handling": {
+                "global": {"replay": [{"action": "ping", "count": 2, "block_original": True, "data": "X"}]},
+            }
+        }
+    )
+    first, second = (
+        ForwardingContext(
+            connection_id=connection_id,
+            direction_label="unit-test",
+            source_ip="10.0.0.1",
+            target_ip="10.0.0.2",
+        )
+        for connection_id in ("conn-1", "conn-2")
+    )
+
+    blocked = asyncio.run(handler.process_frame(make_frame("ping"), first))
+    other = asyncio.run(handler.process_frame(make_frame("ping"), second))
+
+    assert blocked.drop_reason == other.drop_reason == "replay_block:global"
+    assert handler.global_replay_action.get_active_replay_count("ping", key=first) == 1
+    handler.release_context(first)
+    assert handler.global_replay_action.get_active_replay_count("ping", key=first) == 0
+    assert handler.global_replay_action.get_active_replay_count("ping", key=second) == 1
+
+
 def test_direction_rules_match_by_ip_pair_and_add_insertion():
     handler = PayloadHandler(
         {
@@ -154,6 +253,150 @@ def test_direction_rules_match_by_ip_pair_and_add_insertion():
     assert unmatched.after_insertions == []
 
 
+def test_direction_rules_match_subnets_and_wildcards_by_specificity():
+    handler = PayloadHandler(
+        {
+            "payload_handling": {
+                "global": {},
+                "directions": {
+                    "lab_out": {"source_ip": "10.0.0.0/24", "target_ip": "*", "block": [{"action": "x"}]},
+                    "alice": {"source_ip": "10.0.0.1", "target_ip": "*", "delay": [{"action": "x", "delay_ms": 5}]},
+                },
+            }
+        }
+    )
+
+    alice = run_process(handler, make_frame("x"), source_ip="10.0.0.1", target_ip="192.168.0.9")
+    other = run_process(handler, make_frame("x"), source_ip="10.0.0.2", target_ip="192.168.0.9")
+    outside = run_process(handler, make_frame("x"), source_ip="10.0.1.2", target_ip="192.168.0.9")
+
+    assert (alice.forward_original, alice.delayed_ms) == (True, 5)
+    assert other.drop_reason == "block:lab_out"
+    assert (outside.forward_original, outside.delayed_ms) == (True, 0)
+
+
+def test_direction_is_resolved_once_per_context_and_handler():
+    config = {
+        "payload_handling": {
+            "global": {},
+            "directions": {
+                "a_to_b": {
+                    "source_ip": "10.0.0.1",
+                    "target_ip": "10.0.0.2",
+                    "block": [{"action": "drop_me"}],
+                }
+            },
+        }
+    }
+    first = PayloadHandler(config)
+    second = PayloadHandler(config)
+    lookups = []
+    for handler in (first, second):
+        original = handler.get_matching_direction
+        handler.get_matching_direction = lambda *pair, original=original: lookups.append(pair) or original(*pair)
+    context = ForwardingContext(
+        connection_id="conn-1",
+        direction_label="unit-test",
+        source_ip="10.0.0.1",
+        target_ip="10.0.0.2",
+    )
+
+    decisions = [asyncio.run(first.process_frame(make_frame("drop_me"), context)) for _ in range(3)]
+    assert [decision.drop_reason for decision in decisions] == ["block:a_to_b"] * 3
+    assert lookups == [("10.0.0.1", "10.0.0.2")]
+
+    # A new handler generation re-resolves even with the same config_version.
+    asyncio.run(second.process_frame(make_frame("drop_me"), context))
+    assert context.binding.handler is second
+    assert len(lookups) == 2
+
+
+def test_rules_compile_into_one_plan_per_direction_and_action():
+    handler = PayloadHandler(
+        {
+            "payload_handling": {
+                "global": {
+                    "delay": [{"action": "x", "delay_ms": 5}, {"action": "g", "delay_ms": 1}],
+                    "block": [{"action": "y"}],
+                },
+                "directions": {
+                    "a_to_b": {
+                        "source_ip": "10.0.0.1",
+                        "target_ip": "10.0.0.2",
+                        "delay": [{"action": "x", "delay_ms": 7}],
+                        "block": [{"action": "y"}],
+                        "insert": [{"action": "x", "data": "aa", "position": "after"}],
+                    }
+                },
+            }
+        }
+    )
+    direction_ctx = handler.get_matching_direction("10.0.0.1", "10.0.0.2")
+
+    assert set(handler.global_plans) == {"x", "g", "y"}
+    assert direction_ctx.plans["g"] is handler.global_plans["g"]
+    assert direction_ctx.plans["x"].delay_ms == 12
+    assert direction_ctx.plans["x"].insert_actions == (direction_ctx.insert_action,)
+    assert direction_ctx.plans["y"].drop_reason == "block:global"
+    assert "z" not in direction_ctx.plans
+
+    unmatched = run_process(handler, make_frame("z"))
+    assert (unmatched.forward_original, unmatched.delayed_ms, unmatched.after_insertions) == (True, 0, [])
+
+
+def reload_config(c_delay_ms=1, global_data="aa", max_sessions=100):
+    return {
+        "replay_sessions": {"max_sessions": max_sessions},
+        "payload_handling": {
+            "global": {"insert": [{"action": "hello", "data": global_data, "repeat": False}]},
+            "directions": {
+                "a_to_b": {
+                    "source_ip": "10.0.0.1",
+                    "target_ip": "10.0.0.2",
+                    "replay": [{"action": "ping", "count": 2, "block_original": True, "data": "X"}],
+                },
+                "c_to_d": {
+                    "source_ip": "10.0.0.3",
+                    "target_ip": "10.0.0.4",
+                    "delay": [{"action": "ping", "delay_ms": c_delay_ms}],
+                },
+            },
+        },
+    }
+
+
+def test_reload_rebuilds_only_changed_rule_sets_and_keeps_their_state():
+    context = ForwardingContext(
+        connection_id="conn-1",
+        direction_label="unit-test",
+        source_ip="10.0.0.1",
+        target_ip="10.0.0.2",
+    )
+    first = PayloadHandler(reload_config())
+    assert len(run_process(first, make_frame("hello")).before_insertions) == 1
+    assert asyncio.run(first.process_frame(make_frame("ping"), context)).drop_reason == "replay_block:a_to_b"
+
+    second = PayloadHandler(reload_config(c_delay_ms=2), config_version=1, previous=first)
+    a_to_b = second.get_matching_direction("10.0.0.1", "10.0.0.2")
+    assert (second.rule_sets_reused, second.rule_sets_rebuilt) == (2, 1)
+    assert second.global_insert_action is first.global_insert_action
+    assert a_to_b is first.get_matching_direction("10.0.0.1", "10.0.0.2")
+    assert second.get_matching_direction("10.0.0.3", "10.0.0.4").plans["ping"].delay_ms == 2
+    # The once-only insert already fired and the replay session is still live.
+    assert run_process(second, make_frame("hello")).before_insertions == []
+    assert a_to_b.replay_action.get_active_replay_count("ping", key=context) == 1
+
+    third = PayloadHandler(reload_config(c_delay_ms=2, global_data="bb"), config_version=2, previous=second)
+    assert (third.rule_sets_reused, third.rule_sets_rebuilt) == (2, 1)
+    assert third.global_insert_action is not second.global_insert_action
+    assert third.get_matching_direction("10.0.0.1", "10.0.0.2").replay_action is a_to_b.replay_action
+    assert run_process(third, make_frame("hello")).before_insertions[0].data == b"\xbb"
+
+    fourth = PayloadHandler(reload_config(c_delay_ms=2, global_data="bb", max_sessions=5), previous=third)
+    assert fourth.get_matching_direction("10.0.0.1", "10.0.0.2").replay_action is not a_to_b.replay_action
+    assert fourth.global_insert_action is third.global_insert_action
+
+
 def test_decode_error_frame_forwards_without_rule_evaluation():
     handler = PayloadHandler({"payload_handling": {"global": {"block": [{"action": "x"}]}}})
     frame = make_frame("x", decode_error="broken pickle")
@@ -185,6 +428,76 @@ def test_delay_ms_is_applied_from_global_and_direction_rules():
     assert decision.delayed_ms == 3
 
 
+def test_frames_without_applicable_rules_are_not_decoded():
+    handler = PayloadHandler(
+        {
+            "payload_handling": {
+                "global": {},
+                "directions": {
+                    "a_to_b": {
+                        "source_ip": "10.0.0.1",
+                        "target_ip": "10.0.0.2",
+                        "block": [{"action": "dir"}],
+                    }
+                },
+            }
+        }
+    )
+    decode_calls = []
+
+    def decoder(payload):
+        decode_calls.append(payload)
+        return {"action": "dir"}, None
+
+    def lazy_frame():
+        return MessageFrame(
+            length_prefix=b"\x00\x00\x00\x04",
+            payload=b"data",
+            raw_frame=b"\x00\x00\x00\x04data",
+            decoder=decoder,
+        )
+
+    unmatched = run_process(handler, lazy_frame(), source_ip="10.0.0.3", target_ip="10.0.0.4")
+    assert unmatched.forward_original is True
+    assert decode_calls == []
+
+    matched = run_process(handler, lazy_frame(), source_ip="10.0.0.1", target_ip="10.0.0.2")
+    assert matched.forward_original is False
+    assert len(decode_calls) == 1
+
+
+def test_action_only_rules_do_not_fully_decode_pickled_frames():
+    handler = PayloadHandler(
+        {
+            "payload_handling": {
+                "global": {
+                    "block": [{"action": "drop_me"}],
+                    "replay": [{"action": "copy_me", "count": 1}],
+                }
+            }
+        }
+    )
+    decoder = PickleDecoder(zero_copy=True, action_scan_min_bytes=0)
+    chunk = b"".join(
+        len(payload).to_bytes(4, "big") + payload
+        for payload in (
+            pickle.dumps({"action": "drop_me", "data": b"x" * 100}, protocol=4),
+            pickle.dumps({"action": "keep_me", "data": b"y" * 100}, protocol=4),
+            pickle.dumps({"action": "copy_me", "data": b"z"}, protocol=4),
+        )
+    )
+    dropped, kept, replayed = decoder.add_data_frames(chunk)
+
+    assert run_process(handler, dropped).forward_original is False
+    assert run_process(handler, kept).forward_original is True
+    replay_decision = run_process(handler, replayed)
+
+    assert dropped.is_decoded is False
+    assert kept.is_decoded is False
+    assert replayed.is_decoded is True
+    assert replay_decision.after_insertions[0].data == b"z"
+
+
 def test_empty_placeholder_rules_do_not_require_frame_processing():
     handler = PayloadHandler(
         {
@@ -213,3 +526,96 @@ def test_effective_rules_require_frame_processing():
     handler = PayloadHandler({"payload_handling": {"global": {"block": [{"action": "drop_me"}]}}})
 
     assert handler.requires_frame_processing is True
+
+
+def logged_events(capsys):
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith("{")]
+
+
+def test_frame_decision_logging_keeps_non_default_outcomes_and_samples_the_rest(capsys):
+    handler = PayloadHandler(
+        {
+            "logging": {"frame_decisions": "non_default"},
+            "payload_handling": {
+                "global": {
+                    "block": [{"action": "drop_me"}],
+                    "delay": [{"action": "slow", "delay_ms": 5}],
+                },
+            },
+        }
+    )
+
+    run_process(handler, make_frame("plain"))
+    run_process(handler, make_frame("slow"))
+    run_process(handler, make_frame("drop_me"))
+
+    events = logged_events(capsys)
+    assert [(event["event"], event["action"]) for event in events] == [
+        ("frame_decision", "slow"),
+        ("frame_decision", "drop_me"),
+    ]
+
+
+def test_no_applicable_rules_is_logged_once_per_binding(capsys):
+    handler = PayloadHandler(
+        {
+            "payload_handling": {
+                "global": {},
+                "directions": {
+                    "a_to_b": {"source_ip": "10.0.0.1", "target_ip": "10.0.0.2", "block": [{"action": "x"}]}
+                },
+            },
+        }
+    )
+    context = ForwardingContext(
+        connection_id="conn-1",
+        direction_label="unit-test",
+        source_ip="10.0.0.9",
+        target_ip="10.0.0.2",
+    )
+
+    async def scenario():
+        for _ in range(3):
+            await handler.process_frame(frame=make_frame("plain"), context=context)
+
+    asyncio.run(scenario())
+
+    events = logged_events(capsys)
+    assert [(event["event"], event["matched_direction"]) for event in events] == [("no_applicable_rules", None)]
+
+
+def test_per_frame_events_share_the_frame_decision_sampling(capsys):
+    handler = PayloadHandler(
+        {
+            "logging": {"frame_decisions": "non_default"},
+            "payload_handling": {"global": {"block": [{"action": "drop_me"}]}},
+        }
+    )
+    non_dict = MessageFrame(b"\x00\x00\x00\x04", b"data", b"\x00\x00\x00\x04data", decoded=["not", "a", "dict"])
+
+    run_process(handler, non_dict)
+    run_process(handler, make_frame(None, decode_error="truncated"))
+
+    events = logged_events(capsys)
+    assert [event["event"] for event in events] == ["decode_error"]
+
+
+def test_frame_decision_sampling_prefers_action_over_direction_rates(capsys):
+    handler = PayloadHandler(
+        {
+            "logging": {"sampling": {"default": 0, "directions": {"a_to_b": 1}, "actions": {"noise": 0}}},
+            "payload_handling": {
+                "global": {"block": [{"action": "never"}]},
+                "directions": {
+                    "a_to_b": {"source_ip": "10.0.0.1", "target_ip": "10.0.0.2", "block": [{"action": "x"}]}
+                },
+            },
+        }
+    )
+
+    run_process(handler, make_frame("signal"))
+    run_process(handler, make_frame("noise"))
+    run_process(handler, make_frame("signal"), source_ip="10.0.0.9")
+
+    events = logged_events(capsys)
+    assert [(event["action"], event["matched_direction"]) for event in events] == [("signal", "a_to_b")]
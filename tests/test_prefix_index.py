@@ -0,0 +1,38 @@
+from utils.prefix_index import DirectionIndex, normalize_address_pattern
+
+
+def test_direction_index_prefers_longest_source_then_longest_target():
+    index = DirectionIndex()
+    index.add("*", "*", "any")
+    index.add("10.0.0.0/24", "*", "subnet_to_any")
+    index.add("10.0.0.0/24", "10.0.1.0/24", "subnet_to_subnet")
+    index.add("10.0.0.7", "*", "host_to_any")
+    index.add("*", "10.0.1.9", "any_to_host")
+
+    assert index.lookup("10.0.0.7", "10.0.1.9") == "host_to_any"
+    assert index.lookup("10.0.0.8", "10.0.1.9") == "subnet_to_subnet"
+    assert index.lookup("10.0.0.8", "10.0.2.1") == "subnet_to_any"
+    assert index.lookup("192.168.1.1", "10.0.1.9") == "any_to_host"
+    assert index.lookup("192.168.1.1", "10.0.1.8") == "any"
+    assert index.lookup("2001:db8::1", "2001:db8::2") == "any"
+    assert index.lookup("::ffff:10.0.0.7", "10.0.1.9") == "host_to_any"
+    assert index.lookup("not-an-ip", "10.0.1.9") is None
+
+
+def test_direction_index_falls_back_to_shorter_source_when_targets_miss():
+    index = DirectionIndex()
+    index.add("10.0.0.0/8", "172.16.0.0/12", "wide")
+    index.add("10.1.0.0/16", "192.168.0.0/16", "narrow")
+    index.add("2001:db8::/32", "*", "v6")
+
+    assert index.lookup("10.1.2.3", "172.16.5.5") == "wide"
+    assert index.lookup("10.1.2.3", "192.168.5.5") == "narrow"
+    assert index.lookup("10.1.2.3", "8.8.8.8") is None
+    assert index.lookup("2001:db8:1::1", "::1") == "v6"
+
+
+def test_address_patterns_normalize_to_canonical_text():
+    assert normalize_address_pattern(" * ") == "*"
+    assert normalize_address_pattern("10.0.0.7/24") == "10.0.0.0/24"
+    assert normalize_address_pattern("10.0.0.7/32") == "10.0.0.7"
+    assert normalize_address_pattern("2001:DB8::1") == "2001:db8::1"
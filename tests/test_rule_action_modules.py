@@ -1,9 +1,14 @@
 import asyncio
+import json
+import threading
 
+from utils import event_log
 from utils.block_action import BlockAction
+from utils.contracts import LoggingConfig
+from utils.decode_pickle import PickleDecoder
 from utils.delay_action import DelayAction
 from utils.insert_action import InsertAction
-from utils.replay_action import ReplayAction
+from utils.replay_action import ReplayAction, ReplaySessionStore
 
 
 def test_block_action_matches_only_configured_actions():
@@ -43,12 +48,58 @@ def test_insert_action_repeat_false_runs_only_once():
     assert second == []
 
 
+def test_insert_action_counters_are_exact_across_threads():
+    action = InsertAction(
+        [
+            {"action": "once", "data": "aa", "repeat": False},
+            {"action": "ack", "message": {"action": "ack", "seq": {"$counter": 1}}, "repeat": 2},
+        ]
+    )
+    barrier = threading.Barrier(8)
+    once_results = []
+    ack_payloads = []
+
+    def worker():
+        barrier.wait()
+        for _ in range(50):
+            once_results.append(len(action.collect_insertions({"action": "once"})[0]))
+            ack_payloads.extend(insertion.data for insertion in action.collect_insertions({"action": "ack"})[0])
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(once_results) == 1
+    frames = [frame for payload in ack_payloads for frame in PickleDecoder().add_data_frames(payload)]
+    assert sorted(frame.decoded["seq"] for frame in frames) == list(range(1, 801))
+
+
 def test_insert_action_skips_invalid_hex_payloads():
     action = InsertAction([{"action": "bad", "position": "after", "data": "xyz", "repeat": 1}])
 
     assert asyncio.run(action.get_insertions({"action": "bad"})) == []
 
 
+def test_insert_action_joins_repeated_data_into_one_insertion():
+    action = InsertAction(
+        [
+            {"action": "burst", "position": "after", "data": "ab", "repeat": 3},
+            {"action": "burst", "position": "before", "data": "cd", "delay_ms": 5},
+        ]
+    )
+
+    insertions, delay_ms = action.collect_insertions({"action": "burst"})
+
+    assert [(insertion.data, insertion.position) for insertion in insertions] == [
+        (b"\xab\xab\xab", "after"),
+        (b"\xcd", "before"),
+    ]
+    assert delay_ms == 5
+    assert action.collect_insertions({"action": "other"}) == ([], 0)
+
+
 def test_replay_action_blocks_and_emits_expected_replays():
     action = ReplayAction(
         [
@@ -74,3 +125,145 @@ def test_replay_action_blocks_and_emits_expected_replays():
     assert second[0].data == b"X"
     assert action.get_active_replay_count("ping") == 0
     assert action.get_total_replay_count("ping") == 2
+
+
+def test_insert_action_collect_insertions_reports_delay_without_waiting():
+    action = InsertAction([{"action": "late", "position": "after", "data": "bb", "delay_ms": 250}])
+
+    insertions, delay_ms = action.collect_insertions({"action": "late"})
+
+    assert [insertion.data for insertion in insertions] == [b"\xbb"]
+    assert delay_ms == 250
+
+
+def test_replay_sessions_are_scoped_per_key_and_released():
+    action = ReplayAction([{"action": "ping", "count": 1, "block_original": True, "data": "X"}])
+    message = {"action": "ping", "data": "body"}
+
+    assert action.check_replay_block(message, key="conn-a") is True
+    assert action.get_active_replay_count("ping", key="conn-b") == 0
+    assert action.check_replay_block(message, key="conn-b") is True
+    assert action.get_replay_status()["total_active_sessions"] == 2
+
+    assert action.release("conn-a") == 1
+    assert action.get_active_replay_count("ping", key="conn-a") == 0
+    assert action.get_active_replay_count("ping", key="conn-b") == 1
+
+
+def test_replay_session_store_caps_sessions_and_expires_idle_ones():
+    now = [0.0]
+    rules = [{"action": "ping", "count": 3}]
+    action = ReplayAction(rules, max_sessions=2, idle_timeout_s=10.0)
+    action.sessions = store = ReplaySessionStore(max_sessions=2, idle_timeout_s=10.0, clock=lambda: now[0])
+    message = {"action": "ping", "data": "body"}
+
+    for key in ("a", "b"):
+        action.start_replay_if_needed(message, key)
+        now[0] += 1.0
+    action.get_active_replay_count("ping", key="a")  # touch "a" so "b" is the oldest
+    action.start_replay_if_needed(message, "c")
+
+    assert store.evicted == 1
+    assert [session.key for session in store.values()] == ["a", "c"]
+
+    now[0] += 10.5
+    assert action.get_active_replay_count("ping", key="c") == 0
+    assert (len(store), store.expired) == (0, 2)
+
+
+def test_replay_session_store_expire_drops_idle_sessions_without_access():
+    now = [0.0]
+    action = ReplayAction([{"action": "ping", "count": 3}])
+    action.sessions = store = ReplaySessionStore(idle_timeout_s=10.0, clock=lambda: now[0])
+    message = {"action": "ping", "data": "body"}
+
+    action.start_replay_if_needed(message, "a")
+    now[0] += 5.0
+    action.start_replay_if_needed(message, "b")
+
+    now[0] += 6.0
+    assert action.expire_idle() == 1
+    assert [session.key for session in store.values()] == ["b"]
+    now[0] += 5.0
+    assert action.expire_idle() == 1
+    assert len(store) == 0
+
+
+def test_replay_session_store_stays_flat_across_many_short_connections():
+    action = ReplayAction([{"action": "ping", "count": 5, "delay_ms": 1000}])
+    message = {"action": "ping", "data": "body"}
+
+    for connection in range(5000):
+        action.start_replay_if_needed(message, key=connection)
+        action.get_replay_insertions(message, key=connection)
+        action.release(connection)
+
+    assert len(action.sessions) == 0
+    # The first copy is written with the frame, the other four are scheduled.
+    assert action.get_total_replay_count("ping") == 25000
+
+
+def test_delayed_replay_schedules_remaining_copies_and_stays_live_until_the_last():
+    action = ReplayAction([{"action": "ping", "count": 3, "delay_ms": 40, "data": "X"}])
+    message = {"action": "ping", "data": "body"}
+
+    assert action.start_replay_if_needed(message) is True
+    immediate, scheduled = action.collect_replays(message)
+
+    assert [insertion.data for insertion in immediate] == [b"X"]
+    assert [(item.data, item.delay_ms) for item in scheduled] == [(b"X", 40), (b"X", 80)]
+    assert action.start_replay_if_needed(message) is False
+    assert action.collect_replays(message) == ([], [])
+
+    action.sessions.get("ping").next_emit_at = 0.0
+    assert action.get_active_replay_count("ping") == 0
+    assert action.start_replay_if_needed(message) is True
+
+
+def test_scheduled_replays_are_logged_only_at_debug_level(capsys):
+    action = ReplayAction([{"action": "ping", "count": 2, "delay_ms": 40, "data": "X"}])
+    message = {"action": "ping", "data": "body"}
+
+    try:
+        for level in ("info", "debug"):
+            event_log.set_policy(event_log.LogPolicy(LoggingConfig(level=level)))
+            action.clear_replays()
+            action.start_replay_if_needed(message)
+            action.collect_replays(message)
+    finally:
+        event_log.set_policy(event_log.LogPolicy(LoggingConfig()))
+
+    events = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith("{")]
+    assert [(event["count"], event["interval_ms"]) for event in events if event["event"] == "replay_scheduled"] == [
+        (2, 40)
+    ]
+    assert {event["event"] for event in events} == {"replay_cleared", "replay_started", "replay_scheduled"}
+
+
+def test_replay_events_follow_frame_decision_sampling(capsys):
+    action = ReplayAction([{"action": "ping", "count": 2, "data": "X"}])
+    message = {"action": "ping", "data": "body"}
+    configs = [
+        LoggingConfig(level="debug", action_sample_rates={"ping": 0.0}),
+        LoggingConfig(level="debug", frame_decisions="non_default"),
+        LoggingConfig(level="debug"),
+    ]
+
+    try:
+        for config in configs:
+            event_log.set_policy(event_log.LogPolicy(config))
+            action.clear_replays()
+            action.start_replay_if_needed(message)
+            action.collect_replays(message)
+    finally:
+        event_log.set_policy(event_log.LogPolicy(LoggingConfig()))
+
+    out = capsys.readouterr().out
+    assert "[REPLAY]" not in out
+    events = [json.loads(line) for line in out.splitlines() if line.startswith("{")]
+    assert [event["event"] for event in events if event["action"] == "ping"] == [
+        "replay_started",
+        "replay_emitted",
+        "replay_emitted",
+        "replay_completed",
+    ]
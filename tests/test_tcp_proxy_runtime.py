@@ -1,8 +1,30 @@
 import asyncio
+import concurrent.futures
+import json
+import socket
+import threading
+import time
 from pathlib import Path
 
-from tcp_proxy import ProxyRuntimeState, finish_writer_output, forward_data
-from utils.contracts import ForwardingContext, MessageFrame
+import pytest
+
+import tcp_proxy
+from tcp_proxy import (
+    ProxyRuntimeState,
+    finish_writer_output,
+    forward_data,
+    handle_connection,
+    serve_thread_loops,
+    sweep_replay_sessions,
+)
+from utils import event_log
+from utils.contracts import ForwardingContext, LoggingConfig, MessageFrame
+from utils.frame_encoding import encode_frame
+from utils.splice_passthrough import splice_available
+
+
+def write_yaml(path: Path, *lines: str) -> None:
+    path.write_text("\n".join([*lines, ""]), encoding="utf-8")
 
 
 def write_config(path: Path, *, host: str, port: int, blocked_action: str) -> None:
@@ -23,6 +45,28 @@ def write_config(path: Path, *, host: str, port: int, blocked_action: str) -> No
     )
 
 
+def load_runtime(path: Path, *lines: str) -> ProxyRuntimeState:
+    """Write ``lines`` as the config at ``path`` and load it like proxy startup does."""
+    write_yaml(path, *lines)
+    runtime_state = ProxyRuntimeState(str(path))
+    runtime_state.load_initial()
+    return runtime_state
+
+
+def action_frame(action: str, **fields) -> bytes:
+    return encode_frame({"action": action, **fields})
+
+
+@pytest.fixture
+def context() -> ForwardingContext:
+    return ForwardingContext(
+        connection_id="conn-1",
+        direction_label="unit-test",
+        source_ip="10.0.0.1",
+        target_ip="10.0.0.2",
+    )
+
+
 def make_frame(action: str) -> MessageFrame:
     return MessageFrame(
         length_prefix=b"\x00\x00\x00\x04",
@@ -67,12 +111,17 @@ class FakeReader:
 class FakeStreamWriter:
     def __init__(self):
         self.writes = []
+        self.batches = []
         self.eof_written = False
         self.drain_count = 0
 
     def write(self, data):
         self.writes.append(data)
 
+    def writelines(self, data):
+        self.batches.append([bytes(item) for item in data])
+        self.writes.extend(data)
+
     def can_write_eof(self):
         return True
 
@@ -116,8 +165,11 @@ def test_runtime_reload_updates_handler_but_keeps_boot_listener(tmp_path):
     assert initial_snapshot.source.host == "127.0.0.1"
     assert initial_snapshot.source.port == 9000
 
+    fanned_out = []
+    runtime_state.add_reload_listener(fanned_out.append)
     write_config(config_path, host="127.0.0.2", port=9001, blocked_action="second")
     assert runtime_state.reload_from_file() is True
+    assert fanned_out == [1]
 
     reloaded_snapshot = runtime_state.snapshot()
     assert reloaded_snapshot.source.host == "127.0.0.1"
@@ -202,3 +254,535 @@ def test_forward_data_passthrough_writes_incomplete_frame_when_no_rules(tmp_path
 
     assert writer.writes == [partial_frame]
     assert writer.eof_written is True
+
+
+def test_forward_data_offloads_large_decodes_and_keeps_frame_order(tmp_path, context):
+    runtime_state = load_runtime(
+        tmp_path / "config.yaml",
+        "decoding:",
+        "  offload_threshold_bytes: 1024",
+        '  offload_executor: "thread"',
+        "  offload_workers: 1",
+        "payload_handling:",
+        "  global:",
+        "    block:",
+        '      - action: "drop_me"',
+    )
+
+    # The large tuple payload is not a dict, so the action scan cannot settle it.
+    first = action_frame("keep", seq=1)
+    large = encode_frame(("big", b"x" * 4096))
+    dropped = action_frame("drop_me", seq=2)
+    last = action_frame("keep", seq=3)
+    reader = FakeReader([first + large + dropped + last])
+    writer = FakeStreamWriter()
+
+    try:
+        asyncio.run(forward_data(reader, writer, runtime_state, context))
+        stats = runtime_state.snapshot().payload_handler.decode_offloader.stats_snapshot()
+    finally:
+        runtime_state.close()
+
+    assert [bytes(data) for data in writer.writes] == [first, large, last]
+    assert stats["offloaded_frames"] == 1
+    assert stats["offloaded_bytes"] == len(large) - 4
+    metrics = runtime_state.metrics
+    assert sum(metrics.decode_offloads.export_state().values()) == 1
+    assert [count for _, _, count in metrics.decode_offload_queue_delay_ms.export_state().values()] == [1]
+
+
+@pytest.mark.skipif(not splice_available(), reason="os.splice is Linux-only")
+def test_forward_data_splices_raw_direction_between_sockets(tmp_path, context):
+    runtime_state = load_runtime(tmp_path / "config.yaml", "payload_handling:", "  global: {}")
+    early = b"buffered-before-splice"
+    late = bytes(range(256)) * 2048
+
+    async def scenario():
+        accepted = asyncio.get_running_loop().create_future()
+        received = asyncio.get_running_loop().create_future()
+
+        async def on_proxy_client(reader, writer):
+            accepted.set_result((reader, writer))
+
+        async def on_sink(reader, writer):
+            received.set_result(await reader.read())
+            writer.close()
+
+        proxy_server = await asyncio.start_server(on_proxy_client, "127.0.0.1", 0)
+        sink_server = await asyncio.start_server(on_sink, "127.0.0.1", 0)
+        client_reader, client_writer = await asyncio.open_connection(
+            "127.0.0.1", proxy_server.sockets[0].getsockname()[1]
+        )
+        client_writer.write(early)
+        await client_writer.drain()
+        proxy_reader, proxy_writer = await accepted
+        # Let the stream buffer the first bytes so the splice path has to flush them.
+        await proxy_reader.readexactly(0)
+        await asyncio.sleep(0.05)
+
+        _, sink_writer = await asyncio.open_connection("127.0.0.1", sink_server.sockets[0].getsockname()[1])
+        forward = asyncio.create_task(
+            forward_data(proxy_reader, sink_writer, runtime_state, context, source_transport=proxy_writer.transport)
+        )
+        client_writer.write(late)
+        client_writer.write_eof()
+        await client_writer.drain()
+
+        data = await asyncio.wait_for(received, timeout=5)
+        await asyncio.wait_for(forward, timeout=5)
+        for writer in (client_writer, proxy_writer, sink_writer):
+            writer.close()
+        proxy_server.close()
+        sink_server.close()
+        return data
+
+    assert asyncio.run(scenario()) == early + late
+
+
+def test_forward_data_coalesces_chunk_writes_and_holds_delayed_frames_in_order(tmp_path, context):
+    runtime_state = load_runtime(
+        tmp_path / "config.yaml",
+        "payload_handling:",
+        "  global:",
+        "    delay:",
+        '      - action: "slow"',
+        "        delay_ms: 5",
+        "    insert:",
+        '      - action: "tagged"',
+        '        position: "after"',
+        '        data: "deadbeef"',
+    )
+
+    first = action_frame("fast", seq=1)
+    tagged = action_frame("tagged", seq=2)
+    slow = action_frame("slow", seq=3)
+    last = action_frame("fast", seq=4)
+    reader = FakeReader([first + tagged + slow + last])
+    writer = FakeStreamWriter()
+
+    asyncio.run(forward_data(reader, writer, runtime_state, context))
+
+    # Frames before the delay leave at once; the frame queued behind it waits with it.
+    assert writer.batches == [[first, tagged, bytes.fromhex("deadbeef")], [slow, last]]
+
+    metrics = runtime_state.metrics.render()
+    # "fast" is named by no rule, so it is counted under the shared "other" label.
+    assert 'tcp_proxy_frames_total{direction="10.0.0.1->10.0.0.2",action="other"} 2' in metrics
+    assert 'tcp_proxy_injected_bytes_total{direction="10.0.0.1->10.0.0.2"} 4' in metrics
+
+
+def test_forward_data_stops_when_the_peer_resets_below_the_high_water_mark(tmp_path, context):
+    runtime_state = load_runtime(
+        tmp_path / "config.yaml",
+        "payload_handling:",
+        "  global:",
+        "    block:",
+        '      - action: "drop_me"',
+    )
+
+    class ResetTransport:
+        def __init__(self):
+            self.closing = False
+
+        def set_write_buffer_limits(self, high):
+            pass
+
+        def get_extra_info(self, name):
+            return None
+
+        def get_write_buffer_size(self):
+            return 0
+
+        def is_closing(self):
+            return self.closing
+
+    class ResettingWriter(FakeStreamWriter):
+        def __init__(self):
+            super().__init__()
+            self.transport = ResetTransport()
+
+        def writelines(self, data):
+            super().writelines(data)
+            # The peer resets right after the first batch reaches the transport.
+            self.transport.closing = True
+
+    reader = FakeReader([action_frame("keep", seq=seq) for seq in range(3)])
+    writer = ResettingWriter()
+
+    asyncio.run(forward_data(reader, writer, runtime_state, context))
+
+    assert writer.batches == [[action_frame("keep", seq=0)]]
+    assert len(reader.chunks) == 2
+
+
+def test_forward_data_picks_up_reloaded_handler_between_frames(tmp_path, context):
+    config_path = tmp_path / "config.yaml"
+    write_config(config_path, host="127.0.0.1", port=9000, blocked_action="first")
+    runtime_state = ProxyRuntimeState(str(config_path))
+    runtime_state.load_initial()
+
+    class ReloadingReader(FakeReader):
+        async def read(self, size):
+            if len(self.chunks) == 1:
+                write_config(config_path, host="127.0.0.1", port=9000, blocked_action="second")
+                assert runtime_state.reload_from_file() is True
+            return await super().read(size)
+
+    chunk = action_frame("first") + action_frame("second")
+    writer = FakeStreamWriter()
+
+    asyncio.run(forward_data(ReloadingReader([chunk, chunk]), writer, runtime_state, context))
+
+    assert writer.batches == [[action_frame("second")], [action_frame("first")]]
+    assert runtime_state.handler_version == 1
+    assert runtime_state.current_handler() == (runtime_state.payload_handler(), 1)
+
+
+def replay_config_lines(count: int = 3, delay_ms: int = 60000) -> tuple:
+    return (
+        "payload_handling:",
+        "  global:",
+        "    replay:",
+        '      - action: "ping"',
+        f"        count: {count}",
+        f"        delay_ms: {delay_ms}",
+        '        data: "X"',
+        '        position: "after"',
+    )
+
+
+def test_forward_data_releases_replay_sessions_when_the_direction_ends(tmp_path, context):
+    runtime_state = load_runtime(tmp_path / "config.yaml", *replay_config_lines())
+    replay_action = runtime_state.payload_handler().global_replay_action
+
+    class ObservingReader(FakeReader):
+        async def read(self, size):
+            if not self.chunks:
+                # The session is live until the direction finishes.
+                assert replay_action.get_active_replay_count("ping", key=context) == 1
+            return await super().read(size)
+
+    reader = ObservingReader([action_frame("ping")])
+    asyncio.run(forward_data(reader, FakeStreamWriter(), runtime_state, context))
+
+    assert len(replay_action.sessions) == 0
+
+
+def test_forward_data_releases_replay_sessions_of_every_handler_generation(tmp_path, context):
+    config_path = tmp_path / "config.yaml"
+    runtime_state = load_runtime(config_path, *replay_config_lines(count=2))
+    handlers = [runtime_state.payload_handler()]
+
+    class ReloadingReader(FakeReader):
+        async def read(self, size):
+            if self.chunks:
+                # Each chunk runs under a new generation with a rebuilt replay action.
+                write_yaml(config_path, *replay_config_lines(count=len(handlers) + 2))
+                assert runtime_state.reload_from_file() is True
+                handlers.append(runtime_state.payload_handler())
+            return await super().read(size)
+
+    reader = ReloadingReader([action_frame("ping"), action_frame("other")])
+    asyncio.run(forward_data(reader, FakeStreamWriter(), runtime_state, context))
+
+    assert len(handlers) == 3
+    assert handlers[1].global_replay_action.get_total_replay_count("ping") == 3
+    assert [len(handler.global_replay_action.sessions) for handler in handlers] == [0, 0, 0]
+
+
+def test_replay_session_sweep_expires_idle_sessions_on_a_quiet_proxy(tmp_path):
+    runtime_state = load_runtime(
+        tmp_path / "config.yaml",
+        "replay_sessions:",
+        "  idle_timeout_s: 0.05",
+        *replay_config_lines(delay_ms=0),
+    )
+    replay_action = runtime_state.payload_handler().global_replay_action
+    replay_action.start_replay_if_needed({"action": "ping"}, key="idle-conn")
+
+    async def scenario():
+        sweeper = asyncio.create_task(sweep_replay_sessions(runtime_state))
+        await asyncio.sleep(0.2)
+        sweeper.cancel()
+        await asyncio.gather(sweeper, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+    assert (len(replay_action.sessions), replay_action.sessions.expired) == (0, 1)
+
+
+def test_forward_data_emits_delayed_replays_on_a_quiet_link(tmp_path, context):
+    runtime_state = load_runtime(tmp_path / "config.yaml", *replay_config_lines(delay_ms=30))
+
+    class QuietReader(FakeReader):
+        async def read(self, size):
+            if len(self.chunks) == 1:
+                # No traffic while the replays come due.
+                await asyncio.sleep(0.15)
+            return await super().read(size)
+
+    class TimedWriter(FakeStreamWriter):
+        def __init__(self):
+            super().__init__()
+            self.times = []
+
+        def writelines(self, data):
+            super().writelines(data)
+            self.times.append(time.monotonic())
+
+    writer = TimedWriter()
+    started = time.monotonic()
+    asyncio.run(forward_data(QuietReader([action_frame("ping"), action_frame("pong")]), writer, runtime_state, context))
+
+    assert writer.batches == [[action_frame("ping"), b"X"], [b"X"], [b"X"], [action_frame("pong")]]
+    offsets = [moment - started for moment in writer.times]
+    assert 0.025 <= offsets[1] < 0.15
+    assert 0.055 <= offsets[2] < 0.15
+
+
+def test_forward_data_keeps_reading_while_delayed_frames_wait(tmp_path, context):
+    runtime_state = load_runtime(
+        tmp_path / "config.yaml",
+        "payload_handling:",
+        "  global:",
+        "    delay:",
+        '      - action: "slow"',
+        "        delay_ms: 50",
+        '      - action: "short"',
+        "        delay_ms: 1",
+    )
+
+    slow = action_frame("slow")
+    short = action_frame("short")
+    events = []
+
+    class TimedReader(FakeReader):
+        async def read(self, size):
+            events.append("read")
+            return await super().read(size)
+
+    class TimedWriter(FakeStreamWriter):
+        def writelines(self, data):
+            events.append("write")
+            super().writelines(data)
+
+    reader = TimedReader([slow, short])
+    writer = TimedWriter()
+
+    latency = asyncio.run(forward_data(reader, writer, runtime_state, context))
+
+    # All reads, including EOF, finish before the 50ms frame is released, and the
+    # 1ms frame read later never overtakes it.
+    assert events == ["read", "read", "read", "write"]
+    assert writer.batches == [[slow, short]]
+
+    # Configured delays are subtracted; only the proxy's own time remains.
+    assert latency["slow"]["count"] == 1
+    assert latency["slow"]["max_us"] < 20_000
+    assert latency["short"]["count"] == 1
+    assert 'tcp_proxy_added_latency_us_count{direction="10.0.0.1->10.0.0.2",action="slow"} 1' in (
+        runtime_state.metrics.render()
+    )
+
+
+def test_runtime_reload_keeps_actions_of_unchanged_rule_sets(tmp_path):
+    config_path = tmp_path / "config.yaml"
+    write_config(config_path, host="127.0.0.1", port=9000, blocked_action="drop")
+    runtime_state = ProxyRuntimeState(str(config_path))
+    runtime_state.load_initial()
+    initial = runtime_state.payload_handler()
+
+    config_path.write_text(
+        config_path.read_text(encoding="utf-8") + "logging:\n  frame_decisions: non_default\n",
+        encoding="utf-8",
+    )
+    assert runtime_state.reload_from_file() is True
+    reloaded = runtime_state.payload_handler()
+
+    assert reloaded is not initial
+    assert reloaded.global_block_action is initial.global_block_action
+    assert reloaded.global_replay_action is initial.global_replay_action
+    assert (reloaded.rule_sets_reused, reloaded.rule_sets_rebuilt) == (1, 0)
+
+
+def test_runtime_reload_applies_logging_levels_without_restart(tmp_path):
+    config_path = tmp_path / "config.yaml"
+    write_config(config_path, host="127.0.0.1", port=9000, blocked_action="drop")
+    runtime_state = ProxyRuntimeState(str(config_path))
+    runtime_state.load_initial()
+    assert event_log.enabled("frame_decision") is True
+
+    config_path.write_text(
+        config_path.read_text(encoding="utf-8")
+        + "logging:\n  level: warning\n  events:\n    config_reloaded: error\n",
+        encoding="utf-8",
+    )
+    try:
+        assert runtime_state.reload_from_file() is True
+        handler = runtime_state.payload_handler()
+        assert handler.log_policy.frame_decision_enabled is False
+        assert event_log.enabled("frame_decision") is False
+        assert event_log.enabled("config_reloaded") is True
+        assert event_log.enabled("forward_error") is True
+    finally:
+        event_log.set_policy(event_log.LogPolicy(LoggingConfig()))
+
+
+def test_handle_connection_forwards_to_explicit_upstream_without_privileges(tmp_path):
+    async def scenario():
+        received = asyncio.get_running_loop().create_future()
+
+        async def on_upstream(reader, writer):
+            received.set_result(await reader.read())
+            writer.write(action_frame("reply"))
+            writer.close()
+
+        upstream = await asyncio.start_server(on_upstream, "127.0.0.1", 0)
+        runtime_state = load_runtime(
+            tmp_path / "config.yaml",
+            "src:",
+            '  mode: "upstream"',
+            "  upstream:",
+            '    host: "127.0.0.1"',
+            f"    port: {upstream.sockets[0].getsockname()[1]}",
+            "payload_handling:",
+            "  global:",
+            "    block:",
+            '      - action: "drop"',
+        )
+        handled = []
+        proxy = await asyncio.start_server(
+            lambda r, w: handled.append(asyncio.create_task(handle_connection(r, w, runtime_state))),
+            "127.0.0.1",
+            0,
+        )
+
+        reader, writer = await asyncio.open_connection("127.0.0.1", proxy.sockets[0].getsockname()[1])
+        writer.write(action_frame("keep") + action_frame("drop") + action_frame("keep"))
+        writer.write_eof()
+        forwarded = await asyncio.wait_for(received, timeout=5)
+        reply = await asyncio.wait_for(reader.read(), timeout=5)
+        writer.close()
+        await asyncio.wait_for(asyncio.gather(*handled), timeout=5)
+        proxy.close()
+        upstream.close()
+        return forwarded, reply
+
+    forwarded, reply = asyncio.run(scenario())
+
+    assert forwarded == action_frame("keep") * 2
+    assert reply == action_frame("reply")
+
+
+def test_handle_connection_rejected_transparent_bind_is_never_opened_or_closed(tmp_path, monkeypatch, capsys):
+    runtime_state = load_runtime(tmp_path / "config.yaml", "payload_handling:", "  global: {}")
+
+    def refuse_bind(client_ip, client_port):
+        raise PermissionError("IP_TRANSPARENT needs CAP_NET_ADMIN")
+
+    monkeypatch.setattr(tcp_proxy, "get_original_dest", lambda sock: ("10.0.0.2", 80))
+    monkeypatch.setattr(tcp_proxy, "bind_transparent_socket", refuse_bind)
+
+    class ClientWriter(FakeHalfCloseWriter):
+        def get_extra_info(self, name):
+            return {"peername": ("10.0.0.1", 40000), "socket": object()}.get(name)
+
+    writer = ClientWriter()
+    asyncio.run(handle_connection(FakeReader([]), writer, runtime_state))
+
+    events = [json.loads(line)["event"] for line in capsys.readouterr().out.splitlines() if line.startswith("{")]
+    assert "connection_rejected" in events
+    assert "connection_closed" not in events
+    assert writer.closed is True
+    assert runtime_state.metrics.connections_total.labels().value == 0
+
+
+def test_thread_loops_share_runtime_state_and_merge_metrics(tmp_path, monkeypatch):
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        proxy_port = probe.getsockname()[1]
+    metrics_socket = tmp_path / "metrics.sock"
+    sweepers = []
+
+    async def count_sweepers(runtime_state):
+        sweepers.append(threading.current_thread().name)
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(tcp_proxy, "sweep_replay_sessions", count_sweepers)
+
+    async def scenario():
+        received = []
+
+        async def on_upstream(reader, writer):
+            received.append(await reader.read())
+            writer.close()
+
+        upstream = await asyncio.start_server(on_upstream, "127.0.0.1", 0)
+        runtime_state = load_runtime(
+            tmp_path / "config.yaml",
+            "src:",
+            '  host: "127.0.0.1"',
+            f"  port: {proxy_port}",
+            '  mode: "upstream"',
+            "  upstream:",
+            '    host: "127.0.0.1"',
+            f"    port: {upstream.sockets[0].getsockname()[1]}",
+            "workers:",
+            "  count: 3",
+            '  mode: "thread"',
+            "metrics:",
+            "  enabled: true",
+            f'  unix_socket: "{metrics_socket}"',
+            "payload_handling:",
+            "  global:",
+            "    block:",
+            '      - action: "drop"',
+        )
+        serving = asyncio.create_task(serve_thread_loops(runtime_state, 3))
+        while not metrics_socket.exists():
+            await asyncio.sleep(0.01)
+
+        for _ in range(9):
+            reader, writer = await asyncio.open_connection("127.0.0.1", proxy_port)
+            writer.write(action_frame("keep") + action_frame("drop"))
+            writer.write_eof()
+            await asyncio.wait_for(reader.read(), timeout=5)
+            writer.close()
+
+        reader, writer = await asyncio.open_unix_connection(str(metrics_socket))
+        writer.write(b"GET /metrics HTTP/1.1\r\n\r\n")
+        scrape = (await reader.read()).decode()
+        writer.close()
+
+        serving.cancel()
+        await asyncio.gather(serving, return_exceptions=True)
+        upstream.close()
+        return received, scrape
+
+    received, scrape = asyncio.run(scenario())
+
+    assert received == [action_frame("keep")] * 9
+    assert "tcp_proxy_connections_total 9" in scrape
+    assert 'drop_reason="block:global"} 9' in scrape
+    assert sweepers == [threading.current_thread().name]
+
+
+def test_loop_thread_reports_bind_failures_before_it_is_started(tmp_path):
+    with socket.socket() as taken:
+        taken.bind(("127.0.0.1", 0))
+        taken.listen()
+        runtime_state = load_runtime(
+            tmp_path / "config.yaml",
+            "src:",
+            '  host: "127.0.0.1"',
+            f"  port: {taken.getsockname()[1]}",
+            '  mode: "upstream"',
+            "  upstream:",
+            '    host: "127.0.0.1"',
+            "    port: 9",
+            "payload_handling: {}",
+        )
+        started = concurrent.futures.Future()
+        tcp_proxy.run_loop_thread(runtime_state, 1, runtime_state.metrics, started)
+
+    assert isinstance(started.exception(timeout=0), OSError)
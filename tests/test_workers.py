@@ -0,0 +1,115 @@
+import asyncio
+import pickle
+from concurrent.futures import BrokenExecutor, Executor
+
+from utils.contracts import DecodingConfig, MessageFrame, RuleDecision
+from utils.decode_offload import DecodeOffloader
+from utils.decode_pickle import decode_payload
+from utils.metrics import MetricsRegistry
+from utils.workers import aggregate_metrics, fork_worker, serve_control_channel
+
+
+def test_registry_state_merges_across_processes():
+    first = MetricsRegistry()
+    second = MetricsRegistry()
+    for registry, delayed_ms in ((first, 20), (second, 700)):
+        registry.connections_total.labels().value += 2
+        direction = registry.direction("10.0.0.1", "10.0.0.2", frozenset({"key"}))
+        direction.record_decision(RuleDecision(forward_original=True, action="key", delayed_ms=delayed_ms), 40)
+        shared, _ = direction.latency_recorders("key")
+        shared.record(delayed_ms)
+
+    merged = MetricsRegistry()
+    merged.merge_state(pickle.loads(pickle.dumps(first.export_state())))
+    merged.merge_state(pickle.loads(pickle.dumps(second.export_state())))
+
+    text = merged.render()
+    assert "tcp_proxy_connections_total 4" in text
+    assert 'tcp_proxy_forwarded_bytes_total{direction="10.0.0.1->10.0.0.2"} 80' in text
+    assert 'tcp_proxy_frame_delay_ms_count{direction="10.0.0.1->10.0.0.2"} 2' in text
+    assert 'tcp_proxy_frame_delay_ms_bucket{direction="10.0.0.1->10.0.0.2",le="500"} 1' in text
+    latency = merged.added_latency_us.labels("10.0.0.1->10.0.0.2", "key")
+    assert (latency.count, latency.max) == (2, 700)
+
+
+def test_forked_worker_answers_metrics_and_reload_requests(tmp_path):
+    reload_marker = tmp_path / "reloaded"
+
+    def run(index, control):
+        registry = MetricsRegistry()
+        registry.connections_total.labels().value += index + 1
+        asyncio.run(serve_control_channel(control, registry, lambda: reload_marker.write_text("yes")))
+
+    async def scenario():
+        workers = [fork_worker(index, run) for index in range(2)]
+        for worker in workers:
+            await worker.connect()
+        text = await aggregate_metrics(workers)
+
+        workers[0].request_reload()
+        # The metrics answer is queued behind the reload, so it proves the reload ran.
+        await workers[0].collect_metrics()
+        for worker in workers:
+            worker.close()
+        exit_codes = [await asyncio.wait_for(worker.wait_exited(), timeout=5) for worker in workers]
+        return text, exit_codes
+
+    text, exit_codes = asyncio.run(scenario())
+
+    assert "tcp_proxy_connections_total 3" in text
+    assert exit_codes == [0, 0]
+    assert reload_marker.read_text() == "yes"
+
+
+def test_offloader_falls_back_to_inline_decoding_when_its_pool_breaks():
+    class BrokenPool(Executor):
+        def submit(self, fn, *args, **kwargs):
+            raise BrokenExecutor("a pool worker died")
+
+    offloader = DecodeOffloader(DecodingConfig(offload_threshold_bytes=16), executor=BrokenPool())
+    payload = pickle.dumps({"action": "keep", "blob": b"x" * 64}, protocol=4)
+    frame = MessageFrame(len(payload).to_bytes(4, "big"), payload, b"", decoder=decode_payload)
+
+    offloaded = asyncio.run(offloader.decode(frame))
+
+    assert offloaded.fallback is True
+    assert not frame.is_decoded
+    assert frame.decoded["action"] == "keep"
+    assert offloader.stats_snapshot()["fallback_frames"] == 1
+    assert offloader.stats_snapshot()["offloaded_frames"] == 0
+
+
+def test_forked_worker_offloads_decodes_to_its_own_pool():
+    offloader = DecodeOffloader(
+        DecodingConfig(offload_threshold_bytes=16, offload_executor="process", offload_workers=1)
+    )
+
+    def large_frame(seq):
+        payload = pickle.dumps({"action": "keep", "blob": b"x" * 64, "seq": seq}, protocol=4)
+        return MessageFrame(len(payload).to_bytes(4, "big"), payload, b"", decoder=decode_payload)
+
+    async def decode(frame):
+        await asyncio.wait_for(offloader.decode(frame), timeout=10)
+        return frame.decoded["seq"]
+
+    def run(index, control):
+        control.close()
+        assert asyncio.run(decode(large_frame(index))) == index
+        offloader.shutdown()
+
+    async def scenario():
+        # Built before the fork like the supervisor's runtime state, used only after it.
+        workers = [fork_worker(index, run) for index in range(2)]
+        exit_codes = [await asyncio.wait_for(worker.wait_exited(), timeout=20) for worker in workers]
+        for worker in workers:
+            worker.close()
+        return await decode(large_frame(-1)), exit_codes
+
+    try:
+        parent_seq, exit_codes = asyncio.run(scenario())
+    finally:
+        offloader.shutdown()
+
+    assert parent_seq == -1
+    assert exit_codes == [0, 0]
+    assert offloader.stats.offloaded_frames == 1
@@ -0,0 +1,219 @@
+"""Read the top-level ``action`` of a pickled message without unpickling it.
+
+Rules key only on ``message["action"]``, so most frames never need the restricted
+unpickler to rebuild their (often numpy-heavy) payloads. The scanner walks protocol-4
+opcodes, tracks only stack depth and marks, skips argument bytes by length, and stops
+once the first top-level ``action`` entry is stored. Anything it cannot prove is reported as
+``ACTION_UNKNOWN`` so callers fall back to a full decode.
+"""
+
+from __future__ import annotations
+
+import pickletools
+import struct
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.contracts import ACTION_UNKNOWN
+
+
+PICKLE_V4_PREFIX = b"\x80\x04\x95"
+
+_ACTION_KEY = b"action"
+
+# pickletools argument lengths: fixed sizes are positive, length-prefixed ones negative.
+_ARG_LENGTH_PREFIX_SIZES = {
+    pickletools.TAKEN_FROM_ARGUMENT1: 1,
+    pickletools.TAKEN_FROM_ARGUMENT4: 4,
+    pickletools.TAKEN_FROM_ARGUMENT4U: 4,
+    pickletools.TAKEN_FROM_ARGUMENT8U: 8,
+}
+
+_EMPTY_DICT = ord("}")
+_SETITEM = ord("s")
+_SETITEMS = ord("u")
+_NON_STRING_SCALARS = frozenset(
+    ord(code) for code in ("J", "K", "M", "\x8a", "\x8b", "B", "C", "\x8e", "\x96", "N", "\x88", "\x89", "G")
+)
+
+# Opcode kinds the scan loop branches on.
+_GENERIC = 0
+_MEMO_STORE = 1
+_FRAME = 2
+_STRING = 3
+_MEMO_GET = 4
+_STOP = 5
+
+_KINDS = {
+    "\x94": _MEMO_STORE,
+    "q": _MEMO_STORE,
+    "r": _MEMO_STORE,
+    "\x95": _FRAME,
+    "\x8c": _STRING,
+    "X": _STRING,
+    "\x8d": _STRING,
+    "h": _MEMO_GET,
+    "j": _MEMO_GET,
+    ".": _STOP,
+}
+
+_U32 = struct.Struct("<I")
+_U64 = struct.Struct("<Q")
+
+OpcodeInfo = Tuple[int, int, int, int, Optional[int]]
+
+
+def _build_opcode_table() -> List[Optional[OpcodeInfo]]:
+    """Index by opcode byte -> (kind, arg size or -prefix size, pops, pushes, below mark)."""
+    table: List[Optional[OpcodeInfo]] = [None] * 256
+    for opcode in pickletools.opcodes:
+        arg_size = 0
+        if opcode.arg is not None:
+            if opcode.arg.n > 0:
+                arg_size = opcode.arg.n
+            elif opcode.arg.n in _ARG_LENGTH_PREFIX_SIZES:
+                arg_size = -_ARG_LENGTH_PREFIX_SIZES[opcode.arg.n]
+            else:
+                # Newline-terminated text opcodes never appear in protocol-4 output.
+                continue
+
+        before = opcode.stack_before
+        after = opcode.stack_after
+        below_mark: Optional[int] = None
+        if pickletools.markobject in before:
+            below_mark = before.index(pickletools.markobject)
+            pops = 0
+        else:
+            pops = len(before)
+
+        # A negative push count marks the MARK opcode itself.
+        pushes = -1 if pickletools.markobject in after else len(after)
+        table[ord(opcode.code)] = (_KINDS.get(opcode.code, _GENERIC), arg_size, pops, pushes, below_mark)
+    return table
+
+
+_OPCODES = _build_opcode_table()
+
+
+def scan_action(payload: Any) -> Any:
+    """Return the top-level ``action`` string, None, or ``ACTION_UNKNOWN``.
+
+    None means the payload is a dict whose ``action`` is missing or not a string,
+    so no rule can match it. The scan trusts the layout CPython's pickler emits
+    and stops as soon as a top-level ``action`` entry is stored into the dict.
+    """
+    if payload[:3] != PICKLE_V4_PREFIX or len(payload) < 12:
+        return ACTION_UNKNOWN
+
+    # Skip PROTO and the first FRAME header; the top-level object must be a dict.
+    pos = 11
+    if payload[pos] != _EMPTY_DICT:
+        return ACTION_UNKNOWN
+
+    end = len(payload)
+    depth = 0
+    marks: List[int] = []
+    # Only memoized strings matter: pickle refers back to repeated keys by memo index.
+    memo_strings: Dict[int, Tuple[int, int]] = {}
+    memo_count = 0
+    last_string: Optional[Tuple[int, int]] = None
+    # An "action" key is only trusted once SETITEM(S) stores it into the top-level dict;
+    # until then it may belong to a nested dict that happens to sit at the same depth.
+    key_slot = 0
+    value_slot = 0
+    expect_value = False
+    candidate: Any = None
+    ambiguous = False
+    opcodes = _OPCODES
+
+    try:
+        while pos < end:
+            code = payload[pos]
+            info = opcodes[code]
+            if info is None:
+                return ACTION_UNKNOWN
+            kind, arg_size, pops, pushes, below_mark = info
+
+            arg_start = pos = pos + 1
+            if arg_size > 0:
+                pos += arg_size
+            elif arg_size == -1:
+                arg_start = pos + 1
+                pos = arg_start + payload[pos]
+            elif arg_size == -4:
+                arg_start = pos + 4
+                pos = arg_start + _U32.unpack_from(payload, arg_start - 4)[0]
+            elif arg_size == -8:
+                arg_start = pos + 8
+                pos = arg_start + _U64.unpack_from(payload, arg_start - 8)[0]
+            if pos > end:
+                return ACTION_UNKNOWN
+
+            string_span: Optional[Tuple[int, int]] = None
+            if kind == _MEMO_STORE:
+                index = memo_count if arg_size == 0 else int.from_bytes(payload[arg_start:pos], "little")
+                if last_string is not None:
+                    memo_strings[index] = last_string
+                if index >= memo_count:
+                    memo_count = index + 1
+                continue
+            elif kind == _FRAME:
+                continue
+            elif kind == _STRING:
+                string_span = (arg_start, pos)
+            elif kind == _MEMO_GET:
+                string_span = memo_strings.get(int.from_bytes(payload[arg_start:pos], "little"))
+            elif kind == _STOP:
+                if depth != 1 or marks:
+                    return ACTION_UNKNOWN
+                return ACTION_UNKNOWN if ambiguous else None
+            last_string = string_span
+
+            if expect_value:
+                expect_value = False
+                if string_span is not None:
+                    candidate = str(payload[string_span[0]:string_span[1]], "utf-8")
+                elif code in _NON_STRING_SCALARS:
+                    candidate = None
+                else:
+                    candidate = ACTION_UNKNOWN
+            elif (
+                string_span is not None
+                and not key_slot
+                and depth % 2 == 1
+                and payload[string_span[0]:string_span[1]] == _ACTION_KEY
+            ):
+                key_slot = depth + 1
+                value_slot = depth + 2
+                expect_value = True
+
+            if below_mark is not None:
+                if not marks:
+                    return ACTION_UNKNOWN
+                base = marks.pop() - below_mark
+            else:
+                base = depth - pops
+
+            if base < depth:
+                if key_slot and base < value_slot:
+                    if base < key_slot:
+                        if base == 0 and (code == _SETITEMS or code == _SETITEM):
+                            return candidate
+                        # The key belonged to a nested container; keep looking.
+                        key_slot = value_slot = 0
+                        ambiguous = True
+                    else:
+                        # Something was built on top of the first value opcode (a tuple,
+                        # a global lookup, ...), so only a full decode knows its type.
+                        candidate = ACTION_UNKNOWN
+                if base <= 0 and not (base == 0 and (code == _SETITEMS or code == _SETITEM)):
+                    return ACTION_UNKNOWN
+            depth = base
+
+            if pushes < 0:
+                marks.append(depth)
+            else:
+                depth += pushes
+    except (IndexError, UnicodeDecodeError, struct.error):
+        return ACTION_UNKNOWN
+
+    return ACTION_UNKNOWN
@@ -3,11 +3,33 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 import yaml
 
-from utils.contracts import DirectionRuleSetConfig, ProxyConfig, RuleSetConfig, SourceConfig
+from utils.contracts import (
+    DecodingConfig,
+    DirectionRuleSetConfig,
+    ForwardingConfig,
+    InsertRuleConfig,
+    LoggingConfig,
+    MetricsConfig,
+    ProxyConfig,
+    ReplayRuleConfig,
+    ReplaySessionsConfig,
+    RuleSetConfig,
+    SourceConfig,
+    WorkersConfig,
+)
+from utils.frame_encoding import compile_template, encode_frame
+from utils.prefix_index import normalize_address_pattern
+
+
+_LOG_LEVELS = ("debug", "info", "warning", "error", "off")
+_WORKER_MODES = ("process", "thread")
+# Where replayed bytes come from: the message's ``data`` field (or the rule's own
+# ``data``), or the original frame exactly as it was received.
+REPLAY_SOURCES = ("data", "frame")
 
 
 class ConfigValidationError(ValueError):
@@ -61,6 +83,12 @@ def normalize_proxy_config(config: Dict[str, Any]) -> LoadedProxyConfig:
         src = {}
 
     source = _parse_source_config(src, errors)
+    decoding = _parse_decoding_config(config.get("decoding"), errors)
+    forwarding = _parse_forwarding_config(config.get("forwarding"), errors)
+    logging_config = _parse_logging_config(config.get("logging"), errors)
+    metrics = _parse_metrics_config(config.get("metrics"), errors)
+    workers = _parse_workers_config(config.get("workers"), errors)
+    replay_sessions = _parse_replay_sessions_config(config.get("replay_sessions"), errors)
     global_rules = _parse_rule_set(payload_handling.get("global", {}), "payload_handling.global", errors, warnings)
     directions = _parse_directions(payload_handling.get("directions", {}), errors, warnings)
 
@@ -70,6 +98,12 @@ def normalize_proxy_config(config: Dict[str, Any]) -> LoadedProxyConfig:
     return LoadedProxyConfig(
         config=ProxyConfig(
             source=source,
+            decoding=decoding,
+            forwarding=forwarding,
+            logging=logging_config,
+            metrics=metrics,
+            workers=workers,
+            replay_sessions=replay_sessions,
             global_rules=global_rules,
             directions=tuple(directions),
         ),
@@ -91,7 +125,268 @@ def _parse_source_config(src: Dict[str, Any], errors: List[str]) -> SourceConfig
         errors.append("src.port must be between 1 and 65535")
         port = 8000
 
-    return SourceConfig(host=host, port=port)
+    mode = src.get("mode", "transparent")
+    if mode not in ("transparent", "upstream"):
+        errors.append("src.mode must be 'transparent' or 'upstream'")
+        return SourceConfig(host=host, port=port)
+
+    upstream = src.get("upstream")
+    if mode == "transparent":
+        if upstream is not None:
+            errors.append("src.upstream is only valid with src.mode 'upstream'")
+        return SourceConfig(host=host, port=port)
+
+    if not isinstance(upstream, dict):
+        errors.append("src.upstream must be a dictionary with host and port when src.mode is 'upstream'")
+        return SourceConfig(host=host, port=port)
+
+    upstream_host = upstream.get("host")
+    if not isinstance(upstream_host, str) or not upstream_host.strip():
+        errors.append("src.upstream.host must be a non-empty string")
+        upstream_host = None
+
+    upstream_port = upstream.get("port")
+    if not isinstance(upstream_port, int) or isinstance(upstream_port, bool) or not 1 <= upstream_port <= 65535:
+        errors.append("src.upstream.port must be an integer between 1 and 65535")
+        upstream_port = None
+
+    return SourceConfig(
+        host=host,
+        port=port,
+        mode=mode,
+        upstream_host=upstream_host,
+        upstream_port=upstream_port,
+    )
+
+
+def _parse_decoding_config(raw: Any, errors: List[str]) -> DecodingConfig:
+    if raw is None:
+        return DecodingConfig()
+    if not isinstance(raw, dict):
+        errors.append("decoding must be a dictionary when present")
+        return DecodingConfig()
+
+    defaults = DecodingConfig()
+    threshold = raw.get("offload_threshold_bytes", defaults.offload_threshold_bytes)
+    if not isinstance(threshold, int) or isinstance(threshold, bool) or threshold < 0:
+        errors.append("decoding.offload_threshold_bytes must be a non-negative integer")
+        threshold = defaults.offload_threshold_bytes
+
+    executor = raw.get("offload_executor", defaults.offload_executor)
+    if executor not in ("thread", "process"):
+        errors.append("decoding.offload_executor must be 'thread' or 'process'")
+        executor = defaults.offload_executor
+
+    workers = raw.get("offload_workers", defaults.offload_workers)
+    if not isinstance(workers, int) or isinstance(workers, bool) or workers < 1:
+        errors.append("decoding.offload_workers must be a positive integer")
+        workers = defaults.offload_workers
+
+    return DecodingConfig(
+        offload_threshold_bytes=threshold,
+        offload_executor=executor,
+        offload_workers=workers,
+    )
+
+
+def _parse_forwarding_config(raw: Any, errors: List[str]) -> ForwardingConfig:
+    if raw is None:
+        return ForwardingConfig()
+    if not isinstance(raw, dict):
+        errors.append("forwarding must be a dictionary when present")
+        return ForwardingConfig()
+
+    defaults = ForwardingConfig()
+    high_water = raw.get("write_high_water_bytes", defaults.write_high_water_bytes)
+    if not isinstance(high_water, int) or isinstance(high_water, bool) or high_water < 1:
+        errors.append("forwarding.write_high_water_bytes must be a positive integer")
+        high_water = defaults.write_high_water_bytes
+
+    tcp_cork = raw.get("tcp_cork", defaults.tcp_cork)
+    if not isinstance(tcp_cork, bool):
+        errors.append("forwarding.tcp_cork must be a boolean")
+        tcp_cork = defaults.tcp_cork
+
+    max_pending = raw.get("delay_max_pending_bytes", defaults.delay_max_pending_bytes)
+    if not isinstance(max_pending, int) or isinstance(max_pending, bool) or max_pending < 1:
+        errors.append("forwarding.delay_max_pending_bytes must be a positive integer")
+        max_pending = defaults.delay_max_pending_bytes
+
+    return ForwardingConfig(
+        write_high_water_bytes=high_water,
+        tcp_cork=tcp_cork,
+        delay_max_pending_bytes=max_pending,
+    )
+
+
+def _parse_logging_config(raw: Any, errors: List[str]) -> LoggingConfig:
+    if raw is None:
+        return LoggingConfig()
+    if not isinstance(raw, dict):
+        errors.append("logging must be a dictionary when present")
+        return LoggingConfig()
+
+    defaults = LoggingConfig()
+    writer = raw.get("writer", defaults.writer)
+    if writer not in ("async", "sync"):
+        errors.append("logging.writer must be 'async' or 'sync'")
+        writer = defaults.writer
+
+    queue_size = raw.get("queue_size", defaults.queue_size)
+    if not isinstance(queue_size, int) or isinstance(queue_size, bool) or queue_size < 1:
+        errors.append("logging.queue_size must be a positive integer")
+        queue_size = defaults.queue_size
+
+    batch_size = raw.get("batch_size", defaults.batch_size)
+    if not isinstance(batch_size, int) or isinstance(batch_size, bool) or batch_size < 1:
+        errors.append("logging.batch_size must be a positive integer")
+        batch_size = defaults.batch_size
+
+    overflow = raw.get("overflow", defaults.overflow)
+    if overflow not in ("drop", "block"):
+        errors.append("logging.overflow must be 'drop' or 'block'")
+        overflow = defaults.overflow
+
+    level = raw.get("level", defaults.level)
+    if level not in _LOG_LEVELS:
+        errors.append(f"logging.level must be one of {', '.join(_LOG_LEVELS)}")
+        level = defaults.level
+
+    events: Dict[str, str] = {}
+    raw_events = raw.get("events", {})
+    if raw_events is None:
+        raw_events = {}
+    if not isinstance(raw_events, dict):
+        errors.append("logging.events must be a dictionary when present")
+        raw_events = {}
+    for event_name, event_level in raw_events.items():
+        if event_level not in _LOG_LEVELS:
+            errors.append(f"logging.events.{event_name} must be one of {', '.join(_LOG_LEVELS)}")
+            continue
+        events[str(event_name)] = event_level
+
+    frame_decisions = raw.get("frame_decisions", defaults.frame_decisions)
+    if frame_decisions not in ("all", "non_default"):
+        errors.append("logging.frame_decisions must be 'all' or 'non_default'")
+        frame_decisions = defaults.frame_decisions
+
+    sampling = raw.get("sampling", {})
+    if sampling is None:
+        sampling = {}
+    if not isinstance(sampling, dict):
+        errors.append("logging.sampling must be a dictionary when present")
+        sampling = {}
+    sample_rate = _parse_sample_rate(sampling.get("default", defaults.sample_rate), "logging.sampling.default", errors)
+    direction_rates = _parse_sample_rates(sampling.get("directions"), "logging.sampling.directions", errors)
+    action_rates = _parse_sample_rates(sampling.get("actions"), "logging.sampling.actions", errors)
+
+    return LoggingConfig(
+        writer=writer,
+        queue_size=queue_size,
+        batch_size=batch_size,
+        overflow=overflow,
+        level=level,
+        events=events,
+        frame_decisions=frame_decisions,
+        sample_rate=sample_rate if sample_rate is not None else defaults.sample_rate,
+        direction_sample_rates=direction_rates,
+        action_sample_rates=action_rates,
+    )
+
+
+def _parse_metrics_config(raw: Any, errors: List[str]) -> MetricsConfig:
+    if raw is None:
+        return MetricsConfig()
+    if not isinstance(raw, dict):
+        errors.append("metrics must be a dictionary when present")
+        return MetricsConfig()
+
+    defaults = MetricsConfig()
+    enabled = raw.get("enabled", defaults.enabled)
+    if not isinstance(enabled, bool):
+        errors.append("metrics.enabled must be a boolean")
+        enabled = defaults.enabled
+
+    host = raw.get("host", defaults.host)
+    if not isinstance(host, str) or not host.strip():
+        errors.append("metrics.host must be a non-empty string")
+        host = defaults.host
+
+    port = raw.get("port", defaults.port)
+    if not isinstance(port, int) or isinstance(port, bool) or port < 1 or port > 65535:
+        errors.append("metrics.port must be an integer between 1 and 65535")
+        port = defaults.port
+
+    unix_socket = raw.get("unix_socket", defaults.unix_socket)
+    if unix_socket is not None and (not isinstance(unix_socket, str) or not unix_socket):
+        errors.append("metrics.unix_socket must be a non-empty string when present")
+        unix_socket = defaults.unix_socket
+
+    return MetricsConfig(enabled=enabled, host=host, port=port, unix_socket=unix_socket)
+
+
+def _parse_workers_config(raw: Any, errors: List[str]) -> WorkersConfig:
+    if raw is None:
+        return WorkersConfig()
+    if not isinstance(raw, dict):
+        errors.append("workers must be a dictionary when present")
+        return WorkersConfig()
+
+    defaults = WorkersConfig()
+    count = raw.get("count", defaults.count)
+    if not isinstance(count, int) or isinstance(count, bool) or count < 1:
+        errors.append("workers.count must be a positive integer")
+        count = defaults.count
+
+    mode = raw.get("mode", defaults.mode)
+    if mode not in _WORKER_MODES:
+        errors.append("workers.mode must be " + " or ".join(f"'{name}'" for name in _WORKER_MODES))
+        mode = defaults.mode
+
+    return WorkersConfig(count=count, mode=mode)
+
+
+def _parse_replay_sessions_config(raw: Any, errors: List[str]) -> ReplaySessionsConfig:
+    if raw is None:
+        return ReplaySessionsConfig()
+    if not isinstance(raw, dict):
+        errors.append("replay_sessions must be a dictionary when present")
+        return ReplaySessionsConfig()
+
+    defaults = ReplaySessionsConfig()
+    max_sessions = raw.get("max_sessions", defaults.max_sessions)
+    if not isinstance(max_sessions, int) or isinstance(max_sessions, bool) or max_sessions < 1:
+        errors.append("replay_sessions.max_sessions must be a positive integer")
+        max_sessions = defaults.max_sessions
+
+    idle_timeout_s = raw.get("idle_timeout_s", defaults.idle_timeout_s)
+    if isinstance(idle_timeout_s, bool) or not isinstance(idle_timeout_s, (int, float)) or idle_timeout_s <= 0:
+        errors.append("replay_sessions.idle_timeout_s must be a positive number")
+        idle_timeout_s = defaults.idle_timeout_s
+
+    return ReplaySessionsConfig(max_sessions=max_sessions, idle_timeout_s=float(idle_timeout_s))
+
+
+def _parse_sample_rate(value: Any, scope: str, errors: List[str]) -> Optional[float]:
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0.0 <= value <= 1.0:
+        errors.append(f"{scope} must be a number between 0 and 1")
+        return None
+    return float(value)
+
+
+def _parse_sample_rates(raw: Any, scope: str, errors: List[str]) -> Dict[str, float]:
+    if raw is None:
+        return {}
+    if not isinstance(raw, dict):
+        errors.append(f"{scope} must be a dictionary when present")
+        return {}
+
+    rates: Dict[str, float] = {}
+    for name, value in raw.items():
+        rate = _parse_sample_rate(value, f"{scope}.{name}", errors)
+        if rate is not None:
+            rates[str(name)] = rate
+    return rates
 
 
 def _parse_directions(raw_directions: Any, errors: List[str], warnings: List[str]) -> List[DirectionRuleSetConfig]:
@@ -102,20 +397,22 @@ def _parse_directions(raw_directions: Any, errors: List[str], warnings: List[str
         return []
 
     directions: List[DirectionRuleSetConfig] = []
+    seen_pairs: Dict[Tuple[str, str], str] = {}
     for direction_name, direction_config in raw_directions.items():
         if not isinstance(direction_config, dict):
             warnings.append(f"Skipping direction '{direction_name}': configuration must be a dictionary.")
             continue
 
-        source_ip = direction_config.get("source_ip")
-        if source_ip is not None and not isinstance(source_ip, str):
-            warnings.append(f"Direction '{direction_name}' has non-string source_ip. Ignoring match constraint.")
-            source_ip = None
-
-        target_ip = direction_config.get("target_ip")
-        if target_ip is not None and not isinstance(target_ip, str):
-            warnings.append(f"Direction '{direction_name}' has non-string target_ip. Ignoring match constraint.")
-            target_ip = None
+        source_ip = _parse_direction_address(direction_config, "source_ip", direction_name, errors, warnings)
+        target_ip = _parse_direction_address(direction_config, "target_ip", direction_name, errors, warnings)
+        if source_ip is not None and target_ip is not None:
+            previous = seen_pairs.get((source_ip, target_ip))
+            if previous is not None:
+                warnings.append(
+                    f"Direction '{direction_name}' matches the same source_ip and target_ip as "
+                    f"'{previous}' and replaces it."
+                )
+            seen_pairs[(source_ip, target_ip)] = direction_name
 
         directions.append(
             DirectionRuleSetConfig(
@@ -134,6 +431,32 @@ def _parse_directions(raw_directions: Any, errors: List[str], warnings: List[str
     return directions
 
 
+def _parse_direction_address(
+    direction_config: Dict[str, Any],
+    key: str,
+    direction_name: str,
+    errors: List[str],
+    warnings: List[str],
+) -> Optional[str]:
+    """Normalize an address, CIDR prefix, or ``*``; None means the direction never matches."""
+    value = direction_config.get(key)
+    if value is None:
+        warnings.append(
+            f"Direction '{direction_name}' has no {key} and will not match any traffic; use '*' to match any address."
+        )
+        return None
+    if not isinstance(value, str):
+        warnings.append(f"Direction '{direction_name}' has non-string {key}. Ignoring match constraint.")
+        return None
+    try:
+        return normalize_address_pattern(value)
+    except ValueError:
+        errors.append(
+            f"payload_handling.directions.{direction_name}.{key} must be an IP address, CIDR prefix, or '*'"
+        )
+        return None
+
+
 def _parse_rule_set(raw_rules: Any, scope: str, errors: List[str], warnings: List[str]) -> RuleSetConfig:
     """Precompute rule collections so frame handling does not parse YAML-shaped dicts."""
     if raw_rules is None:
@@ -163,21 +486,19 @@ def _parse_rule_set(raw_rules: Any, scope: str, errors: List[str], warnings: Lis
         if isinstance(action, str) and action
     }
 
-    insert_rules = [
-        dict(rule)
-        for rule in _coerce_rule_list(raw_rules.get("insert", []), f"{scope}.insert", warnings)
-        if isinstance(rule.get("action"), str)
-        and bool(rule.get("action"))
-        and "data" in rule
-    ]
-
-    replay_rules = [
-        dict(rule)
-        for rule in _coerce_rule_list(raw_rules.get("replay", []), f"{scope}.replay", warnings)
-        if isinstance(rule.get("action"), str)
-        and bool(rule.get("action"))
-        and "count" in rule
-    ]
+    insert_rules = parse_insert_rules(
+        _coerce_rule_list(raw_rules.get("insert", []), f"{scope}.insert", warnings),
+        f"{scope}.insert",
+        warnings,
+    )
+
+    raw_replay_rules = []
+    for rule in _coerce_rule_list(raw_rules.get("replay", []), f"{scope}.replay", warnings):
+        if "count" not in rule:
+            warnings.append(f"Skipping {scope}.replay rule without a count.")
+            continue
+        raw_replay_rules.append(rule)
+    replay_rules = parse_replay_rules(raw_replay_rules, f"{scope}.replay", warnings)
 
     return RuleSetConfig(
         delay_rules=delay_rules,
@@ -187,6 +508,130 @@ def _parse_rule_set(raw_rules: Any, scope: str, errors: List[str], warnings: Lis
     )
 
 
+def parse_insert_rules(rules: List[Dict[str, Any]], scope: str, warnings: List[str]) -> List[InsertRuleConfig]:
+    """Validate insert rules and decode their hex data once, at load time."""
+    parsed: List[InsertRuleConfig] = []
+    for rule in rules:
+        action = rule.get("action")
+        if not isinstance(action, str) or not action:
+            warnings.append(f"Skipping {scope} rule without a valid action.")
+            continue
+
+        template = None
+        if "message" in rule:
+            if "data" in rule:
+                warnings.append(f"Skipping {scope} rule for action '{action}': use either data or message.")
+                continue
+            try:
+                template = compile_template(rule["message"])
+            except ValueError as exc:
+                warnings.append(f"Skipping {scope} rule for action '{action}': {exc}.")
+                continue
+            decoded = template.parts[0] if template.static else b""
+            if template.static:
+                template = None
+        else:
+            data = rule.get("data")
+            if not data:
+                warnings.append(f"Skipping {scope} rule for action '{action}' without data or message.")
+                continue
+            try:
+                decoded = bytes.fromhex(data)
+            except (TypeError, ValueError):
+                warnings.append(f"Skipping {scope} rule for action '{action}': data is not valid hex.")
+                continue
+
+        position = rule.get("position", "before")
+        if position not in ("before", "after"):
+            warnings.append(
+                f"Skipping {scope} rule for action '{action}' with position {position!r}; use 'before' or 'after'."
+            )
+            continue
+
+        repeat = rule.get("repeat", 1)
+        once = repeat is False
+        if isinstance(repeat, bool):
+            repeat = 1
+        elif not isinstance(repeat, int) or repeat < 1:
+            warnings.append(f"{scope} rule for action '{action}' has invalid repeat {repeat!r}; using 1.")
+            repeat = 1
+
+        delay_ms = rule.get("delay_ms", 0)
+        if isinstance(delay_ms, bool) or not isinstance(delay_ms, (int, float)) or delay_ms < 0:
+            warnings.append(f"{scope} rule for action '{action}' has invalid delay_ms {delay_ms!r}; using 0.")
+            delay_ms = 0
+
+        parsed.append(
+            InsertRuleConfig(
+                action=action,
+                data=decoded,
+                position=position,
+                repeat=repeat,
+                once=once,
+                delay_ms=int(delay_ms),
+                template=template,
+            )
+        )
+    return parsed
+
+
+def parse_replay_rules(rules: List[Dict[str, Any]], scope: str, warnings: List[str]) -> List[ReplayRuleConfig]:
+    """Validate replay rules and pre-encode their ``data`` once, at load time."""
+    parsed: List[ReplayRuleConfig] = []
+    for rule in rules:
+        action = rule.get("action")
+        if not isinstance(action, str) or not action:
+            warnings.append(f"Skipping {scope} rule without a valid action.")
+            continue
+
+        count = rule.get("count", 1)
+        if isinstance(count, bool) or not isinstance(count, int) or count < 1:
+            warnings.append(f"Skipping {scope} rule for action '{action}' with invalid count {count!r}.")
+            continue
+
+        block_original = bool(rule.get("block_original", False))
+        delay_ms = rule.get("delay_ms", 0)
+        if isinstance(delay_ms, bool) or not isinstance(delay_ms, (int, float)) or delay_ms < 0:
+            warnings.append(f"{scope} rule for action '{action}' has invalid delay_ms {delay_ms!r}; using 0.")
+            delay_ms = 0
+        if block_original:
+            # A blocking replay emits one copy per blocked frame, so it has no spacing.
+            delay_ms = 0
+
+        position = rule.get("position", "after")
+        if position not in ("before", "after"):
+            warnings.append(f"{scope} rule for action '{action}' has position {position!r}; using 'after'.")
+            position = "after"
+
+        source = rule.get("source", "data")
+        if source not in REPLAY_SOURCES:
+            warnings.append(f"{scope} rule for action '{action}' has invalid source {source!r}; using 'data'.")
+            source = "data"
+
+        data = rule.get("data")
+        if isinstance(data, dict):
+            try:
+                data = encode_frame(data)
+            except Exception as exc:
+                warnings.append(f"Skipping {scope} rule for action '{action}': data cannot be pickled ({exc}).")
+                continue
+        elif data is not None and not isinstance(data, bytes):
+            data = (data if isinstance(data, str) else str(data)).encode("utf-8")
+
+        parsed.append(
+            ReplayRuleConfig(
+                action=action,
+                count=count,
+                block_original=block_original,
+                delay_ms=int(delay_ms),
+                data=data,
+                position=position,
+                source=source,
+            )
+        )
+    return parsed
+
+
 def _coerce_rule_list(value: Any, scope: str, warnings: List[str]) -> List[Dict[str, Any]]:
     if value is None:
         return []
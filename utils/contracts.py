@@ -1,18 +1,122 @@
 from __future__ import annotations
 
 from dataclasses import dataclass, field
-from typing import Any, Dict, List, Optional, Protocol, Set, Tuple
+from typing import Any, Callable, Dict, Hashable, List, Optional, Protocol, Set, Tuple
 
+from utils.frame_encoding import FrameTemplate
 
-@dataclass(frozen=True)
-class MessageFrame:
-    """Decoded view of one length-prefixed message while preserving raw bytes."""
 
-    length_prefix: bytes
-    payload: bytes
-    raw_frame: bytes
-    decoded: Any
-    decode_error: Optional[str] = None
+PayloadDecoder = Callable[[Any], Tuple[Any, Optional[str]]]
+ActionScanner = Callable[[Any], Any]
+
+
+class _ActionUnknown:
+    def __repr__(self) -> str:
+        return "ACTION_UNKNOWN"
+
+
+# Returned by action scanners when only a full decode can tell what the action is.
+ACTION_UNKNOWN: Any = _ActionUnknown()
+
+_UNDECODED = object()
+_UNSCANNED = object()
+
+
+class MessageFrame:
+    """Length-prefixed message whose payload is decoded only when first needed.
+
+    The byte fields may be memoryview slices of the read chunk they came from.
+    Frames built with ``decoded=`` (or without a ``decoder``) are already decoded.
+    """
+
+    __slots__ = (
+        "length_prefix",
+        "payload",
+        "raw_frame",
+        "_decoded",
+        "_decode_error",
+        "_decoder",
+        "_action_scanner",
+        "_action",
+    )
+
+    def __init__(
+        self,
+        length_prefix: bytes | memoryview,
+        payload: bytes | memoryview,
+        raw_frame: bytes | memoryview,
+        decoded: Any = _UNDECODED,
+        decode_error: Optional[str] = None,
+        decoder: Optional[PayloadDecoder] = None,
+        action_scanner: Optional[ActionScanner] = None,
+    ):
+        self.length_prefix = length_prefix
+        self.payload = payload
+        self.raw_frame = raw_frame
+        self._decoded = None if decoded is _UNDECODED else decoded
+        self._decode_error = decode_error
+        self._decoder = decoder if decoded is _UNDECODED and decode_error is None else None
+        self._action_scanner = action_scanner
+        self._action: Any = _UNSCANNED
+
+    @property
+    def is_decoded(self) -> bool:
+        return self._decoder is None
+
+    @property
+    def decoded(self) -> Any:
+        if self._decoder is not None:
+            self._decode()
+        return self._decoded
+
+    @property
+    def decode_error(self) -> Optional[str]:
+        if self._decoder is not None:
+            self._decode()
+        return self._decode_error
+
+    @property
+    def action(self) -> Optional[str]:
+        """Top-level ``action`` string of a dict message, or None for anything else.
+
+        Uses the action scanner when the payload is still undecoded and only falls
+        back to a full decode when the scanner cannot tell.
+        """
+        action = self.peek_action()
+        if action is ACTION_UNKNOWN:
+            action = self._action = self._action_from_decoded()
+        return action
+
+    def peek_action(self) -> Any:
+        """Like ``action``, but returns ``ACTION_UNKNOWN`` instead of decoding."""
+        if self._action is _UNSCANNED:
+            if self._decoder is None:
+                self._action = self._action_from_decoded()
+            elif self._action_scanner is not None:
+                self._action = self._action_scanner(self.payload)
+            else:
+                self._action = ACTION_UNKNOWN
+        return self._action
+
+    def resolve(self, decoded: Any, decode_error: Optional[str]) -> None:
+        """Store a decode result computed elsewhere, e.g. in a worker pool."""
+        self._decoded = decoded
+        self._decode_error = decode_error
+        self._decoder = None
+
+    def _action_from_decoded(self) -> Optional[str]:
+        message = self.decoded
+        if not isinstance(message, dict):
+            return None
+        action = message.get("action")
+        return action if isinstance(action, str) else None
+
+    def _decode(self) -> None:
+        self.resolve(*self._decoder(self.payload))
+
+    def __repr__(self) -> str:
+        state = "decoded" if self.is_decoded else "pending"
+        return f"MessageFrame(length={len(self.payload)}, {state})"
 
 
 @dataclass(frozen=True)
@@ -22,6 +126,16 @@ class Insertion:
     tag: str
 
 
+@dataclass(frozen=True)
+class ScheduledInsertion:
+    """Bytes written ``delay_ms`` after the triggering frame was read, with or without
+    further traffic in that direction."""
+
+    data: bytes
+    delay_ms: int
+    tag: str
+
+
 class DelayActionProtocol(Protocol):
     def get_delay(self, message: Dict[str, Any]) -> Optional[int]:
         ...
@@ -33,18 +147,36 @@ class BlockActionProtocol(Protocol):
 
 
 class InsertActionProtocol(Protocol):
+    def needs_message(self, action: Optional[str]) -> bool:
+        ...
+
+    def collect_insertions(self, message: Any) -> Tuple[List["Insertion"], int]:
+        ...
+
     async def get_insertions(self, message: Any) -> List["Insertion"]:
         ...
 
 
 class ReplayActionProtocol(Protocol):
-    def check_replay_block(self, message: Dict[str, Any]) -> bool:
+    # ``key`` names the forwarding context that owns the replay session.
+    def needs_message(self, action: Optional[str], key: Hashable = None) -> bool:
         ...
 
-    def start_replay_if_needed(self, message: Dict[str, Any]) -> bool:
+    def check_replay_block(self, message: Dict[str, Any], key: Hashable = None, raw_frame: Any = None) -> bool:
         ...
 
-    def get_replay_insertions(self, message: Dict[str, Any]) -> List["Insertion"]:
+    def start_replay_if_needed(self, message: Dict[str, Any], key: Hashable = None, raw_frame: Any = None) -> bool:
+        ...
+
+    def get_replay_insertions(self, message: Dict[str, Any], key: Hashable = None) -> List["Insertion"]:
+        ...
+
+    def collect_replays(
+        self, message: Dict[str, Any], key: Hashable = None
+    ) -> Tuple[List["Insertion"], List["ScheduledInsertion"]]:
+        ...
+
+    def release(self, key: Hashable) -> int:
         ...
 
 
@@ -55,8 +187,33 @@ class RuleDecision:
     forward_original: bool
     before_insertions: List[Insertion] = field(default_factory=list)
     after_insertions: List[Insertion] = field(default_factory=list)
+    # Timer-driven writes, e.g. the later copies of a replay with ``delay_ms``.
+    scheduled_insertions: List[ScheduledInsertion] = field(default_factory=list)
     drop_reason: Optional[str] = None
     delayed_ms: int = 0
+    action: Optional[str] = None
+    decode_failed: bool = False
+    # Set when the payload went to the decode pool: the wait for a pool worker, in ms.
+    offload_queue_delay_ms: Optional[float] = None
+    # The pool could not take the payload, so it was decoded inline instead.
+    offload_fallback: bool = False
+
+
+@dataclass(frozen=True)
+class ActionPlan:
+    """Global and direction rules for one action in one direction, merged at load time.
+
+    Scopes are listed global first, so evaluating them in order matches the
+    precedence of the separate rule sets they were compiled from.
+    """
+
+    drop_reason: Optional[str] = None
+    delay_ms: int = 0
+    insert_actions: Tuple[InsertActionProtocol, ...] = ()
+    # (drop reason used when the replay blocks the original, replay action)
+    replay_actions: Tuple[Tuple[str, ReplayActionProtocol], ...] = ()
+    # Whether a rule copies message fields, so an undecoded frame must be decoded.
+    needs_message: bool = False
 
 
 @dataclass
@@ -68,14 +225,50 @@ class DirectionContext:
     block_action: BlockActionProtocol
     insert_action: InsertActionProtocol
     replay_action: ReplayActionProtocol
+    has_rules: bool = True
+    # Action name -> merged plan; actions missing here have no rule in this direction.
+    plans: Dict[str, ActionPlan] = field(default_factory=dict, repr=False)
+
+
+@dataclass(frozen=True)
+class InsertRuleConfig:
+    """One validated insert rule with its hex ``data`` already decoded.
+
+    Rules written as a ``message`` carry the encoded frame in ``data``. When the
+    message has per-frame fields, ``data`` is empty and ``template`` renders it.
+    """
+
+    action: str
+    data: bytes
+    position: str = "before"
+    repeat: int = 1
+    # ``repeat: false`` in YAML: insert only while the action has not matched yet.
+    once: bool = False
+    delay_ms: int = 0
+    template: Optional[FrameTemplate] = None
+
+
+@dataclass(frozen=True)
+class ReplayRuleConfig:
+    """One validated replay rule; a ``data`` mapping is already pickled and framed."""
+
+    action: str
+    count: int = 1
+    block_original: bool = False
+    # Always 0 when ``block_original`` is set.
+    delay_ms: int = 0
+    data: Optional[bytes] = None
+    position: str = "after"
+    # "data" replays the message's (or the rule's) ``data``; "frame" the original bytes.
+    source: str = "data"
 
 
 @dataclass(frozen=True)
 class RuleSetConfig:
     delay_rules: Dict[str, int] = field(default_factory=dict)
     block_rules: Set[str] = field(default_factory=set)
-    insert_rules: List[Dict[str, Any]] = field(default_factory=list)
-    replay_rules: List[Dict[str, Any]] = field(default_factory=list)
+    insert_rules: List[InsertRuleConfig] = field(default_factory=list)
+    replay_rules: List[ReplayRuleConfig] = field(default_factory=list)
 
 
 @dataclass(frozen=True)
@@ -88,8 +281,96 @@ class DirectionRuleSetConfig:
 
 @dataclass(frozen=True)
 class SourceConfig:
+    """Listener settings.
+
+    ``mode="transparent"`` serves TPROXY-redirected connections and forwards each one to
+    its original destination. ``mode="upstream"`` is an ordinary listener that forwards
+    every connection to ``upstream_host:upstream_port`` and needs no privileges.
+    """
+
     host: str = "0.0.0.0"
     port: int = 8000
+    mode: str = "transparent"
+    upstream_host: Optional[str] = None
+    upstream_port: Optional[int] = None
+
+    @property
+    def transparent(self) -> bool:
+        return self.mode == "transparent"
+
+
+@dataclass(frozen=True)
+class DecodingConfig:
+    """Worker-pool settings for decoding large frames off the event loop."""
+
+    offload_threshold_bytes: int = 0
+    offload_executor: str = "process"
+    offload_workers: int = 2
+
+
+@dataclass(frozen=True)
+class ForwardingConfig:
+    """Write batching and delay-queue settings for frame-processing directions."""
+
+    write_high_water_bytes: int = 256 * 1024
+    tcp_cork: bool = False
+    delay_max_pending_bytes: int = 64 * 1024 * 1024
+
+
+@dataclass(frozen=True)
+class LoggingConfig:
+    """Event output settings; ``writer="async"`` batches lines on a background thread.
+
+    The writer fields are fixed at startup; level and sampling fields follow reloads.
+    """
+
+    writer: str = "async"
+    queue_size: int = 10000
+    batch_size: int = 256
+    overflow: str = "drop"
+    level: str = "info"
+    events: Dict[str, str] = field(default_factory=dict)
+    frame_decisions: str = "all"
+    sample_rate: float = 1.0
+    direction_sample_rates: Dict[str, float] = field(default_factory=dict)
+    action_sample_rates: Dict[str, float] = field(default_factory=dict)
+
+    def writer_settings(self) -> Tuple[str, int, int, str]:
+        return (self.writer, self.queue_size, self.batch_size, self.overflow)
+
+
+@dataclass(frozen=True)
+class MetricsConfig:
+    """Prometheus scrape endpoint; ``unix_socket`` replaces host/port when set."""
+
+    enabled: bool = False
+    host: str = "127.0.0.1"
+    port: int = 9100
+    unix_socket: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class WorkersConfig:
+    """How many event loops serve the listener; ``count=1`` keeps the single-loop proxy.
+
+    ``mode="process"`` forks one worker per loop; ``mode="thread"`` runs the loops as
+    threads of one process that share a single runtime state.
+    """
+
+    count: int = 1
+    mode: str = "process"
+
+
+@dataclass(frozen=True)
+class ReplaySessionsConfig:
+    """Bounds on live replay sessions, which are kept per forwarding direction.
+
+    ``max_sessions`` caps each replay rule set; the least recently used session is
+    evicted first. Sessions untouched for ``idle_timeout_s`` seconds are dropped.
+    """
+
+    max_sessions: int = 10000
+    idle_timeout_s: float = 300.0
 
 
 @dataclass(frozen=True)
@@ -97,10 +378,28 @@ class ProxyConfig:
     """Normalized proxy config used to build runtime handlers."""
 
     source: SourceConfig = field(default_factory=SourceConfig)
+    decoding: DecodingConfig = field(default_factory=DecodingConfig)
+    forwarding: ForwardingConfig = field(default_factory=ForwardingConfig)
+    logging: LoggingConfig = field(default_factory=LoggingConfig)
+    metrics: MetricsConfig = field(default_factory=MetricsConfig)
+    workers: WorkersConfig = field(default_factory=WorkersConfig)
+    replay_sessions: ReplaySessionsConfig = field(default_factory=ReplaySessionsConfig)
     global_rules: RuleSetConfig = field(default_factory=RuleSetConfig)
     directions: Tuple[DirectionRuleSetConfig, ...] = field(default_factory=tuple)
 
 
+@dataclass
+class DirectionBinding:
+    """Direction rules resolved for one forwarding context by one handler generation.
+
+    ``handler`` is the ``PayloadHandler`` that resolved ``direction``; ``None`` in
+    ``direction`` means no direction-specific rules match this IP pair.
+    """
+
+    handler: Any = None
+    direction: Optional[DirectionContext] = None
+
+
 @dataclass(frozen=True)
 class ForwardingContext:
     """Connection metadata for one traffic direction through the proxy."""
@@ -109,3 +408,6 @@ class ForwardingContext:
     direction_label: str
     source_ip: str
     target_ip: str
+    # The IP pair is fixed for the connection, so the matching direction is looked up
+    # once per handler generation instead of once per frame.
+    binding: DirectionBinding = field(default_factory=DirectionBinding, compare=False, repr=False)
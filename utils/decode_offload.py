@@ -0,0 +1,135 @@
+"""Decode large frames in a worker pool so one big pickle cannot stall the event loop."""
+
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from utils.contracts import DecodingConfig, MessageFrame
+from utils.decode_pickle import decode_payload
+
+
+def _timed_decode(payload: Any) -> Tuple[Any, Optional[str], float, float]:
+    """Worker entry point: decode and report when the worker picked the job up."""
+    started = time.monotonic()
+    decoded, decode_error = decode_payload(payload)
+    return decoded, decode_error, started, time.monotonic()
+
+
+@dataclass
+class DecodeOffloadStats:
+    offloaded_frames: int = 0
+    offloaded_bytes: int = 0
+    fallback_frames: int = 0
+    queue_delay_total_s: float = 0.0
+    queue_delay_max_s: float = 0.0
+    decode_time_total_s: float = 0.0
+
+
+@dataclass(frozen=True)
+class OffloadedDecode:
+    """Timing of one offloaded decode, for per-frame logging."""
+
+    payload_bytes: int
+    queue_delay_s: float
+    decode_time_s: float
+    # The pool was broken; the frame is left to decode inline on first access.
+    fallback: bool = False
+
+
+class DecodeOffloader:
+    """Runs full decodes of frames above a size threshold in a thread or process pool.
+
+    Callers await ``decode`` before touching ``frame.decoded``, so frames of one
+    direction stay strictly ordered while other connections keep running. The pool
+    is built on the first offloaded decode, in the process that runs it: a pool
+    inherited across ``fork`` shares its queues with the parent and never answers.
+    A pool that breaks (a worker process died) is replaced on the next offload.
+    """
+
+    def __init__(self, config: DecodingConfig, executor: Optional[Executor] = None):
+        self.config = config
+        self.threshold_bytes = config.offload_threshold_bytes
+        self.uses_processes = executor is None and config.offload_executor == "process"
+        self.stats = DecodeOffloadStats()
+        self._owns_executor = executor is None
+        self._executor: Optional[Executor] = executor
+        self._executor_pid = os.getpid() if executor is not None else None
+
+    @staticmethod
+    def _build_executor(config: DecodingConfig) -> Executor:
+        if config.offload_executor == "process":
+            # Spawned workers avoid forking a process that already runs watcher threads.
+            return ProcessPoolExecutor(
+                max_workers=config.offload_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return ThreadPoolExecutor(max_workers=config.offload_workers, thread_name_prefix="decode")
+
+    def _current_executor(self) -> Executor:
+        pid = os.getpid()
+        if self._owns_executor and self._executor_pid != pid:
+            # Never reuse (or shut down) a pool that belongs to the pre-fork parent.
+            self._executor = self._build_executor(self.config)
+            self._executor_pid = pid
+        return self._executor
+
+    def should_offload(self, frame: MessageFrame) -> bool:
+        return not frame.is_decoded and len(frame.payload) >= self.threshold_bytes
+
+    async def decode(self, frame: MessageFrame) -> Optional[OffloadedDecode]:
+        """Decode ``frame`` in the pool if it is large enough; otherwise leave it lazy."""
+        if not self.should_offload(frame):
+            return None
+
+        # Memoryview slices cannot cross a process boundary.
+        payload = bytes(frame.payload) if self.uses_processes else frame.payload
+        loop = asyncio.get_running_loop()
+        executor = self._current_executor()
+        submitted = time.monotonic()
+        try:
+            decoded, decode_error, started, finished = await loop.run_in_executor(executor, _timed_decode, payload)
+        except BrokenExecutor:
+            # Other decodes may have failed on the same pool and replaced it already.
+            if self._owns_executor and self._executor is executor:
+                self.shutdown()
+            self.stats.fallback_frames += 1
+            return OffloadedDecode(payload_bytes=len(payload), queue_delay_s=0.0, decode_time_s=0.0, fallback=True)
+        frame.resolve(decoded, decode_error)
+
+        queue_delay = max(0.0, started - submitted)
+        decode_time = finished - started
+        stats = self.stats
+        stats.offloaded_frames += 1
+        stats.offloaded_bytes += len(payload)
+        stats.queue_delay_total_s += queue_delay
+        stats.queue_delay_max_s = max(stats.queue_delay_max_s, queue_delay)
+        stats.decode_time_total_s += decode_time
+        return OffloadedDecode(
+            payload_bytes=len(payload),
+            queue_delay_s=queue_delay,
+            decode_time_s=decode_time,
+        )
+
+    def stats_snapshot(self) -> Dict[str, Any]:
+        stats = self.stats
+        mean_delay = stats.queue_delay_total_s / stats.offloaded_frames if stats.offloaded_frames else 0.0
+        return {
+            "offloaded_frames": stats.offloaded_frames,
+            "offloaded_bytes": stats.offloaded_bytes,
+            "fallback_frames": stats.fallback_frames,
+            "queue_delay_mean_ms": round(mean_delay * 1000.0, 3),
+            "queue_delay_max_ms": round(stats.queue_delay_max_s * 1000.0, 3),
+            "decode_time_total_ms": round(stats.decode_time_total_s * 1000.0, 3),
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None and self._executor_pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        self._executor_pid = None
@@ -19,9 +19,16 @@ except ModuleNotFoundError:
     np = _DummyNumpy()  # type: ignore[assignment]
     NUMPY_AVAILABLE = False
 
+from utils.action_scan import scan_action
 from utils.contracts import MessageFrame
 
 
+_LENGTH_PREFIX = struct.Struct(">I")
+
+# Below this size the C unpickler beats the Python opcode scan (see
+# benchmarks/bench_action_scan.py), so small frames are simply decoded in full.
+ACTION_SCAN_MIN_BYTES = 512 * 1024
+
 SAFE_BUILTIN_GLOBALS = {
     name: getattr(builtins, name)
     for name in (
@@ -89,43 +96,86 @@ def restricted_loads(data: bytes) -> Any:
     return RestrictedUnpickler(io.BytesIO(data)).load()
 
 
+def decode_payload(msg_data: bytes) -> Tuple[Any, Optional[str]]:
+    """Decode one frame payload, returning ``(message, error)`` instead of raising."""
+    if msg_data[:3] == b"\x80\x04\x95":
+        try:
+            # Network pickles remain risky; the restricted loader is the safety boundary.
+            return restricted_loads(msg_data), None
+        except Exception as exc:
+            return None, f"pickle decode failed: {exc}"
+
+    try:
+        text = str(msg_data, "utf-8", errors="replace")
+        if text.startswith("#"):
+            return text, None
+        return f"Text: {text}", None
+    except UnicodeDecodeError:
+        return f"Raw binary ({len(msg_data)} bytes)", None
+
+
 class PickleDecoder:
-    """Incrementally decode length-prefixed payload frames from a TCP byte stream."""
+    """Incrementally decode length-prefixed payload frames from a TCP byte stream.
+
+    With ``zero_copy=True`` the frames returned from one call are memoryview slices
+    into a single immutable chunk, so forwarding a frame unchanged does not copy it.
+    Frames of at least ``action_scan_min_bytes`` read their action with the opcode
+    scanner instead of a full decode.
+    """
 
-    def __init__(self):
+    def __init__(self, zero_copy: bool = False, action_scan_min_bytes: int = ACTION_SCAN_MIN_BYTES):
         self.buffer = bytearray()
+        self.zero_copy = zero_copy
+        self.action_scan_min_bytes = action_scan_min_bytes
 
     def add_data_frames(self, data: bytes) -> List[MessageFrame]:
         """Append bytes and return every complete frame currently buffered."""
         if not data:
             return []
 
-        self.buffer.extend(data)
+        if self.buffer:
+            self.buffer.extend(data)
+            if len(self.buffer) < self._pending_frame_length():
+                # Large frames arrive over many reads; only materialize once complete.
+                return []
+            chunk = bytes(self.buffer)
+        else:
+            chunk = bytes(data)
+
+        view = memoryview(chunk) if self.zero_copy else chunk
+        chunk_len = len(chunk)
         frames: List[MessageFrame] = []
+        offset = 0
 
-        while len(self.buffer) >= 4:
-            msg_len = struct.unpack(">I", self.buffer[:4])[0]
-            total_len = 4 + msg_len
-            if len(self.buffer) < total_len:
+        while chunk_len - offset >= 4:
+            msg_len = _LENGTH_PREFIX.unpack_from(chunk, offset)[0]
+            frame_end = offset + 4 + msg_len
+            if frame_end > chunk_len:
                 break
 
-            raw_frame = bytes(self.buffer[:total_len])
-            payload = bytes(self.buffer[4:total_len])
-            del self.buffer[:total_len]
-
-            decoded_msg, decode_error = self._decode_message_with_error(payload)
+            # Decoding is deferred until a rule actually needs the message.
             frames.append(
                 MessageFrame(
-                    length_prefix=raw_frame[:4],
-                    payload=payload,
-                    raw_frame=raw_frame,
-                    decoded=decoded_msg,
-                    decode_error=decode_error,
+                    length_prefix=view[offset:offset + 4],
+                    payload=view[offset + 4:frame_end],
+                    raw_frame=view[offset:frame_end],
+                    decoder=decode_payload,
+                    action_scanner=scan_action if msg_len >= self.action_scan_min_bytes else None,
                 )
             )
+            offset = frame_end
+
+        # Compact once per chunk instead of shifting the buffer after every frame.
+        if offset or not self.buffer:
+            self.buffer = bytearray(memoryview(chunk)[offset:])
 
         return frames
 
+    def _pending_frame_length(self) -> int:
+        if len(self.buffer) < 4:
+            return 4
+        return 4 + _LENGTH_PREFIX.unpack_from(self.buffer, 0)[0]
+
     def add_data(self, data: bytes) -> List[Tuple[Any, bytes]]:
         messages = []
         for frame in self.add_data_frames(data):
@@ -165,20 +215,7 @@ class PickleDecoder:
         return f"Buffer: {len(self.buffer)} bytes (insufficient for length header), Preview: {buffer_preview}"
 
     def _decode_message_with_error(self, msg_data: bytes) -> Tuple[Any, Optional[str]]:
-        if msg_data.startswith(b"\x80\x04\x95"):
-            try:
-                # Network pickles remain risky; the restricted loader is the safety boundary.
-                return restricted_loads(msg_data), None
-            except Exception as exc:
-                return None, f"pickle decode failed: {exc}"
-
-        try:
-            text = msg_data.decode("utf-8", errors="replace")
-            if text.startswith("#"):
-                return text, None
-            return f"Text: {text}", None
-        except UnicodeDecodeError:
-            return f"Raw binary ({len(msg_data)} bytes)", None
+        return decode_payload(msg_data)
 
     @staticmethod
     def format_message(msg: Any) -> str:
@@ -0,0 +1,229 @@
+"""JSON event output shared by the proxy and the payload handler.
+
+Events are emitted synchronously until ``configure`` installs the background writer.
+The writer takes event dicts from a bounded queue, serializes them off the event
+loop, and writes them in batches so a slow stdout consumer does not stall traffic.
+A ``LogPolicy`` decides which events are emitted at all; it is rebuilt with every
+handler generation, so levels and sampling follow config reloads.
+"""
+
+from __future__ import annotations
+
+import json
+import queue
+import random
+import sys
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, TextIO
+
+from utils.contracts import LoggingConfig
+
+
+def _encode(payload: Dict[str, Any]) -> str:
+    return json.dumps(payload, default=str)
+
+
+@dataclass
+class EventLogStats:
+    written: int = 0
+    dropped: int = 0
+    batches: int = 0
+
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40, "off": 100}
+
+# Events not listed here are "info".
+DEFAULT_EVENT_LEVELS = {
+    "replay_started": "debug",
+    "replay_blocked": "debug",
+    "replay_emitted": "debug",
+    "replay_scheduled": "debug",
+    "replay_no_data": "debug",
+    "replay_completed": "debug",
+    "replay_cleared": "debug",
+    "decode_error": "warning",
+    "forward_error": "warning",
+    "config_warning": "warning",
+    "config_reload_failed": "error",
+    "startup_failed": "error",
+    "runtime_error": "error",
+}
+
+
+class LogPolicy:
+    """Level filter for all events plus sampling for per-frame events.
+
+    Per-frame events (``frame_decision``, ``decode_error``, ``decode_offloaded``, ...)
+    pass the level filter and then the sampling rules. Non-default frame outcomes
+    (drops, delays, insertions, decode failures) are never sampled away; frames
+    forwarded unchanged are logged at the most specific sample rate configured for
+    their action, then their direction, then the default.
+    """
+
+    def __init__(self, config: LoggingConfig):
+        self.config = config
+        self._threshold = LEVELS[config.level]
+        self._event_enabled: Dict[str, bool] = {}
+        self.frame_decision_enabled = self.enabled("frame_decision")
+        self._log_default_outcomes = config.frame_decisions == "all"
+        self._sample_rate = config.sample_rate
+        self._direction_rates = config.direction_sample_rates
+        self._action_rates = config.action_sample_rates
+
+    def enabled(self, event: str) -> bool:
+        cached = self._event_enabled.get(event)
+        if cached is None:
+            level = self.config.events.get(event) or DEFAULT_EVENT_LEVELS.get(event, "info")
+            cached = LEVELS[level] >= self._threshold and level != "off"
+            self._event_enabled[event] = cached
+        return cached
+
+    def log_frame_event(
+        self, event: str, direction_name: Optional[str], action: Optional[str], non_default: bool
+    ) -> bool:
+        """Return whether one per-frame ``event`` should be built and emitted."""
+        if not self.enabled(event):
+            return False
+        if non_default:
+            return True
+        if not self._log_default_outcomes:
+            return False
+
+        rate = self._action_rates.get(action) if action is not None else None
+        if rate is None and direction_name is not None:
+            rate = self._direction_rates.get(direction_name)
+        if rate is None:
+            rate = self._sample_rate
+        return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
+
+    def log_frame_decision(self, direction_name: Optional[str], action: Optional[str], non_default: bool) -> bool:
+        if not self.frame_decision_enabled:
+            return False
+        return self.log_frame_event("frame_decision", direction_name, action, non_default)
+
+
+_STOP = object()
+
+
+class BatchedEventWriter:
+    """Bounded queue drained by one writer thread.
+
+    With ``overflow="drop"`` a full queue discards the new event and counts it; with
+    ``overflow="block"`` the emitting thread waits for space, which slows the proxy
+    down to the speed of the log consumer instead of losing events.
+    """
+
+    def __init__(self, config: LoggingConfig, stream: Optional[TextIO] = None):
+        self.config = config
+        self.stream = stream if stream is not None else sys.stdout
+        self.stats = EventLogStats()
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=config.queue_size)
+        self._block = config.overflow == "block"
+        self._reported_dropped = 0
+        self._thread = threading.Thread(target=self._run, name="event-log", daemon=True)
+        self._thread.start()
+
+    def emit(self, payload: Dict[str, Any]) -> None:
+        if self._block:
+            self._queue.put(payload)
+            return
+        try:
+            self._queue.put_nowait(payload)
+        except queue.Full:
+            self.stats.dropped += 1
+
+    def close(self, timeout: Optional[float] = 5.0) -> None:
+        """Write everything already queued, then stop the writer thread."""
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        batch_size = self.config.batch_size
+        while True:
+            item = self._queue.get()
+            batch: List[Any] = [item]
+            while len(batch) < batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stopping = any(entry is _STOP for entry in batch)
+            lines = [_encode(entry) for entry in batch if entry is not _STOP]
+            dropped = self.stats.dropped
+            if dropped != self._reported_dropped:
+                lines.append(
+                    _encode({"component": "event_log", "event": "log_events_dropped", "dropped_total": dropped})
+                )
+                self._reported_dropped = dropped
+            if lines:
+                self._write(lines)
+            if stopping:
+                return
+
+    def _write(self, lines: List[str]) -> None:
+        try:
+            self.stream.write("\n".join(lines) + "\n")
+            self.stream.flush()
+        except (OSError, ValueError):
+            # A closed or broken stdout must not take the writer thread down.
+            return
+        self.stats.written += len(lines)
+        self.stats.batches += 1
+
+
+_writer: Optional[BatchedEventWriter] = None
+_policy = LogPolicy(LoggingConfig())
+_context: Dict[str, Any] = {}
+
+
+def set_policy(policy: LogPolicy) -> None:
+    """Install the policy used by ``enabled`` for events outside the payload handler."""
+    global _policy
+    _policy = policy
+
+
+def set_context(**fields: Any) -> None:
+    """Add fields (such as the worker index) to every event emitted by this process."""
+    global _context
+    _context = dict(fields)
+
+
+def enabled(event: str) -> bool:
+    return _policy.enabled(event)
+
+
+def log_frame_event(event: str, direction_name: Optional[str], action: Optional[str], non_default: bool) -> bool:
+    """``LogPolicy.log_frame_event`` for per-frame events outside the payload handler."""
+    return _policy.log_frame_event(event, direction_name, action, non_default)
+
+
+def emit(payload: Dict[str, Any]) -> None:
+    """Emit one JSON event through the active writer."""
+    if _context:
+        payload = {**payload, **_context}
+    writer = _writer
+    if writer is None:
+        print(_encode(payload))
+        return
+    writer.emit(payload)
+
+
+def configure(config: LoggingConfig, stream: Optional[TextIO] = None) -> None:
+    """Switch to the batched background writer described by ``config``."""
+    global _writer
+    if config.writer != "async":
+        return
+    shutdown()
+    _writer = BatchedEventWriter(config, stream)
+
+
+def shutdown() -> Optional[EventLogStats]:
+    """Flush queued events and return to synchronous output."""
+    global _writer
+    writer, _writer = _writer, None
+    if writer is None:
+        return None
+    writer.close()
+    return writer.stats
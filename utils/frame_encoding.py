@@ -0,0 +1,206 @@
+"""Build wire frames (4-byte big-endian length prefix + pickle) for injected messages.
+
+``compile_template`` turns a YAML message description into a ``FrameTemplate``.
+Static messages are pickled exactly once. Templates with per-frame fields keep
+their static parts as pre-encoded opcode runs and pickle only the changing
+values when rendered.
+"""
+
+from __future__ import annotations
+
+import io
+import pickle
+import struct
+from dataclasses import dataclass
+from typing import Any, Dict, Tuple
+
+try:
+    import numpy as np
+except ModuleNotFoundError:
+    np = None
+
+_LENGTH_PREFIX = struct.Struct(">I")
+_FRAME_LENGTH = struct.Struct("<Q")
+
+# The protocol the action scanner walks and the QKD endpoints write.
+PICKLE_PROTOCOL = 4
+
+# A retained frame may keep its read chunk alive; above this ratio it is copied once.
+_MAX_RETAINED_OVERHEAD = 4
+
+
+def encode_frame(message: Any, protocol: int = PICKLE_PROTOCOL) -> bytes:
+    """Pickle ``message`` and prepend its length, exactly as the endpoints frame it."""
+    payload = pickle.dumps(message, protocol=protocol)
+    return _LENGTH_PREFIX.pack(len(payload)) + payload
+
+
+def retain_frame(raw_frame: bytes | memoryview) -> bytes | memoryview:
+    """Return ``raw_frame`` in a form that is safe to keep after its chunk is processed.
+
+    Zero-copy decoders hand out memoryview slices of the read chunk. Keeping the
+    slice is free, but it also keeps the whole chunk alive. Small frames cut from
+    large chunks are therefore copied, once, when they are kept.
+    """
+    if isinstance(raw_frame, memoryview):
+        owner = raw_frame.obj
+        if owner is not None and len(owner) > _MAX_RETAINED_OVERHEAD * max(len(raw_frame), 1):
+            return bytes(raw_frame)
+    return raw_frame
+
+
+# Directives are single-key mappings in a template message.
+COUNTER = "$counter"  # {"$counter": start}: start, start + 1, ... per rendered frame
+COPY = "$copy"  # {"$copy": "field"}: the field's value in the triggering message
+NDARRAY = "$ndarray"  # {"$ndarray": {"dtype": ..., "shape": [...], "fill": 0} or "values": [...]}
+_PER_FRAME = (COUNTER, COPY)
+
+# Receivers recognise protocol-4 pickles by PROTO followed by a FRAME opcode, so a
+# rendered body is wrapped in one frame whose length is only known per render.
+_PICKLE_HEADER = pickle.PROTO + bytes([PICKLE_PROTOCOL]) + pickle.FRAME
+_DICT_HEADER = pickle.EMPTY_DICT + pickle.MARK
+_DICT_FOOTER = pickle.SETITEMS + pickle.STOP
+
+
+class _OpcodePickler(pickle._Pickler):
+    """Pickles one value as bare protocol-4 opcodes: no PROTO, FRAME, memo, or STOP.
+
+    Without memo references each value's opcodes are position independent, so
+    pre-encoded runs and freshly encoded values can be concatenated into one pickle.
+    """
+
+    def __init__(self, file: io.BytesIO):
+        super().__init__(file, protocol=PICKLE_PROTOCOL)
+        self.fast = True
+
+
+def _opcodes(value: Any) -> bytes:
+    buffer = io.BytesIO()
+    _OpcodePickler(buffer).save(value)
+    return buffer.getvalue()
+
+
+@dataclass(frozen=True)
+class FrameTemplate:
+    """An insert message encoded at load time.
+
+    ``parts`` are pre-encoded byte runs. A per-frame value from ``fields`` goes
+    between each pair of neighbouring runs. A template without fields is a single
+    complete frame.
+    """
+
+    parts: Tuple[bytes, ...]
+    fields: Tuple[Tuple[str, Any], ...] = ()
+
+    @property
+    def static(self) -> bool:
+        return not self.fields
+
+    @property
+    def needs_message(self) -> bool:
+        return any(directive == COPY for directive, _ in self.fields)
+
+    def render(self, sequence: int = 0, message: Any = None) -> bytes:
+        """Return the complete frame for the ``sequence``-th use of this template."""
+        if not self.fields:
+            return self.parts[0]
+
+        chunks = [self.parts[0]]
+        for (directive, argument), part in zip(self.fields, self.parts[1:]):
+            if directive == COUNTER:
+                value = argument + sequence
+            else:
+                value = message.get(argument) if isinstance(message, dict) else None
+            chunks.append(_opcodes(value))
+            chunks.append(part)
+        body = b"".join(chunks)
+        header = _PICKLE_HEADER + _FRAME_LENGTH.pack(len(body))
+        return _LENGTH_PREFIX.pack(len(header) + len(body)) + header + body
+
+
+def compile_template(message: Any) -> FrameTemplate:
+    """Validate a template message and pre-encode everything that does not change.
+
+    Raises ``ValueError`` with a config-facing reason for invalid templates.
+    """
+    if not isinstance(message, dict) or not message:
+        raise ValueError("message must be a non-empty mapping")
+
+    resolved: Dict[Any, Any] = {}
+    per_frame: Dict[Any, Tuple[str, Any]] = {}
+    for key, value in message.items():
+        directive = _directive(value)
+        if directive == COUNTER:
+            start = value[COUNTER]
+            if isinstance(start, bool) or not isinstance(start, int):
+                raise ValueError(f"field '{key}': {COUNTER} needs an integer start value")
+            per_frame[key] = (COUNTER, start)
+        elif directive == COPY:
+            if not isinstance(value[COPY], str) or not value[COPY]:
+                raise ValueError(f"field '{key}': {COPY} needs a field name")
+            per_frame[key] = (COPY, value[COPY])
+        else:
+            resolved[key] = _resolve_static(value, str(key))
+
+    if not per_frame:
+        try:
+            return FrameTemplate(parts=(encode_frame(resolved),))
+        except Exception as exc:
+            raise ValueError(f"message cannot be pickled: {exc}") from exc
+
+    parts = []
+    current = [_DICT_HEADER]
+    fields = []
+    try:
+        for key in message:
+            current.append(_opcodes(key))
+            if key in per_frame:
+                parts.append(b"".join(current))
+                fields.append(per_frame[key])
+                current = []
+            else:
+                current.append(_opcodes(resolved[key]))
+    except Exception as exc:
+        raise ValueError(f"message cannot be pickled: {exc}") from exc
+    current.append(_DICT_FOOTER)
+    parts.append(b"".join(current))
+    return FrameTemplate(parts=tuple(parts), fields=tuple(fields))
+
+
+def _directive(value: Any) -> Any:
+    if isinstance(value, dict) and len(value) == 1:
+        (key,) = value
+        if isinstance(key, str) and key.startswith("$"):
+            if key not in (COUNTER, COPY, NDARRAY):
+                raise ValueError(f"unknown directive '{key}'")
+            return key
+    return None
+
+
+def _resolve_static(value: Any, path: str) -> Any:
+    """Replace ``$ndarray`` specs with arrays; reject per-frame directives below the top level."""
+    directive = _directive(value)
+    if directive == NDARRAY:
+        return _build_ndarray(value[NDARRAY], path)
+    if directive in _PER_FRAME:
+        raise ValueError(f"field '{path}': {directive} is only supported on top-level fields")
+    if isinstance(value, dict):
+        return {key: _resolve_static(item, f"{path}.{key}") for key, item in value.items()}
+    if isinstance(value, list):
+        return [_resolve_static(item, f"{path}[{index}]") for index, item in enumerate(value)]
+    return value
+
+
+def _build_ndarray(spec: Any, path: str) -> Any:
+    if np is None:
+        raise ValueError(f"field '{path}': {NDARRAY} needs numpy, which is not installed")
+    if not isinstance(spec, dict):
+        raise ValueError(f"field '{path}': {NDARRAY} needs a mapping with dtype and shape or values")
+    try:
+        dtype = np.dtype(spec.get("dtype", "float64"))
+        if "values" in spec:
+            return np.asarray(spec["values"], dtype=dtype)
+        shape = spec["shape"]
+        return np.full(tuple(shape) if isinstance(shape, list) else shape, spec.get("fill", 0), dtype=dtype)
+    except (KeyError, TypeError, ValueError) as exc:
+        raise ValueError(f"field '{path}': invalid {NDARRAY} spec ({exc})") from exc
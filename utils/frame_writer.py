@@ -0,0 +1,104 @@
+"""Batch the writes produced by one read chunk into a single transport call."""
+
+from __future__ import annotations
+
+import asyncio
+import socket
+import time
+from typing import Any, List, Optional, Sequence, Tuple
+
+from utils.contracts import ForwardingConfig, RuleDecision
+from utils.metrics import LogHistogram
+
+# (perf_counter() when the frame's bytes were read, configured delay_ms, histograms)
+LatencyMark = Tuple[float, int, Sequence[LogHistogram]]
+
+
+def decision_buffers(decision: RuleDecision, raw_frame: Any) -> List[Any]:
+    """Return the buffers one frame decision puts on the wire, in order."""
+    buffers: List[Any] = [insertion.data for insertion in decision.before_insertions]
+    if decision.forward_original:
+        buffers.append(raw_frame)
+    buffers.extend(insertion.data for insertion in decision.after_insertions)
+    return buffers
+
+
+class CoalescingWriter:
+    """Collects frame and insertion buffers and hands them to the transport together.
+
+    ``flush`` is synchronous so it can run right before the rule engine suspends
+    for an offloaded decode; ``drain`` only waits once the transport has buffered
+    more than the configured high-water mark.
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter, config: ForwardingConfig):
+        self.writer = writer
+        self.high_water_bytes = config.write_high_water_bytes
+        self._pending: List[Any] = []
+        self._marks: List[LatencyMark] = []
+        self._transport = getattr(writer, "transport", None)
+        self._cork_socket: Optional[socket.socket] = None
+
+        if self._transport is not None:
+            self._transport.set_write_buffer_limits(high=self.high_water_bytes)
+            sock = self._transport.get_extra_info("socket")
+            if config.tcp_cork and sock is not None and hasattr(socket, "TCP_CORK"):
+                self._cork_socket = sock
+
+    def add_decision(self, decision: RuleDecision, raw_frame: Any, mark: Optional[LatencyMark] = None) -> None:
+        """Queue one frame's writes in on-the-wire order."""
+        self.add_buffers(decision_buffers(decision, raw_frame), mark)
+
+    def add_buffers(self, buffers: List[Any], mark: Optional[LatencyMark] = None) -> None:
+        """Queue buffers; ``mark`` records the frame's added latency when they are flushed."""
+        self._pending.extend(buffers)
+        if mark is not None:
+            self._marks.append(mark)
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+
+        pending, self._pending = self._pending, []
+        if self._cork_socket is None:
+            self.writer.writelines(pending)
+        else:
+            # Corking around the batch lets the kernel fill whole segments before sending.
+            self._set_cork(1)
+            try:
+                self.writer.writelines(pending)
+            finally:
+                self._set_cork(0)
+
+        if self._marks:
+            self._record_latency()
+
+    def _record_latency(self) -> None:
+        marks, self._marks = self._marks, []
+        flushed_at = time.perf_counter()
+        for read_at, delay_ms, histograms in marks:
+            added_us = int((flushed_at - read_at) * 1_000_000) - delay_ms * 1000
+            for histogram in histograms:
+                histogram.record(added_us)
+
+    async def drain(self) -> None:
+        """Flush, then wait for the peer only when the transport is backed up.
+
+        Raises ``ConnectionResetError`` once the transport is closing, so a peer
+        reset stops the caller even while the buffer stays below the mark.
+        """
+        self.flush()
+        transport = self._transport
+        if transport is None or transport.get_write_buffer_size() >= self.high_water_bytes:
+            await self.writer.drain()
+        elif transport.is_closing():
+            raise ConnectionResetError("Connection lost")
+
+    def _set_cork(self, value: int) -> None:
+        if self._cork_socket is None:
+            return
+        try:
+            self._cork_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, value)
+        except OSError:
+            # The socket is already shut down; the transport reports the real error.
+            self._cork_socket = None
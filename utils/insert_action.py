@@ -1,69 +1,95 @@
 import asyncio
-from typing import Any, Dict, List
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
-from utils.contracts import Insertion
+from utils.config_loading import parse_insert_rules
+from utils.contracts import InsertRuleConfig, Insertion
+from utils.frame_encoding import FrameTemplate
 
 
-class InsertAction:
-    def __init__(self, insert_rules: List[Dict[str, Any]]):
-        self.insert_rules = insert_rules
-        self.processed_actions: Dict[str, int] = {}
+@dataclass
+class _PreparedInsert:
+    # ``repeat`` copies of the rule data, joined once so a match is a single write.
+    payload: bytes
+    position: str
+    once: bool
+    delay_ms: int
+    repeat: int = 1
+    # Per-frame templates are rendered on each match; ``rendered`` numbers the copies.
+    template: Optional[FrameTemplate] = None
+    rendered: int = 0
 
-    async def get_insertions(self, message: Any) -> List[Insertion]:
-        insertions: List[Insertion] = []
 
+class InsertAction:
+    def __init__(self, insert_rules: Sequence[Union[InsertRuleConfig, Dict[str, Any]]]):
+        self.insert_rules: List[InsertRuleConfig] = []
+        for rule in insert_rules:
+            if isinstance(rule, dict):
+                # YAML-shaped rules are validated like config rules; invalid ones are dropped.
+                self.insert_rules.extend(parse_insert_rules([rule], "insert", []))
+            else:
+                self.insert_rules.append(rule)
+        self.processed_actions: Dict[str, int] = {}
+        # Thread-mode event loops share one handler; the counters must not race.
+        self._lock = threading.Lock()
+        self.rules_by_action: Dict[str, Tuple[_PreparedInsert, ...]] = {}
         for rule in self.insert_rules:
-            if not isinstance(rule, dict):
-                continue
-
-            action = rule.get("action")
-            if not action or (isinstance(message, dict) and message.get("action") != action):
-                continue
-
-            position = rule.get("position", "before")
-            if position not in ["before", "after"]:
-                continue
-
-            data = rule.get("data", "")
-            if not data:
-                continue
+            prepared = _PreparedInsert(
+                payload=rule.data * rule.repeat,
+                position=rule.position,
+                once=rule.once,
+                delay_ms=rule.delay_ms,
+                repeat=rule.repeat,
+                template=rule.template,
+            )
+            self.rules_by_action[rule.action] = self.rules_by_action.get(rule.action, ()) + (prepared,)
+        self.actions = frozenset(self.rules_by_action)
+        self._message_actions = frozenset(
+            rule.action for rule in self.insert_rules if rule.template is not None and rule.template.needs_message
+        )
+
+    def needs_message(self, action: Optional[str]) -> bool:
+        """Whether an insert for this action copies fields out of the triggering message."""
+        return action in self._message_actions
 
-            try:
-                hex_data = bytes.fromhex(data)
-            except ValueError:
-                print(f"[!] Warning: Invalid hex data '{data}' in insert rule")
-                continue
-
-            repeat = rule.get("repeat", 1)
+    async def get_insertions(self, message: Any) -> List[Insertion]:
+        insertions, delay_ms = self.collect_insertions(message)
+        if delay_ms > 0:
+            await asyncio.sleep(delay_ms / 1000.0)
+        return insertions
 
-            if repeat is False:
-                if action in self.processed_actions:
+    def collect_insertions(self, message: Any) -> Tuple[List[Insertion], int]:
+        """Return matching insertions and the total delay_ms their rules ask for.
+
+        The caller decides how to wait; the proxy hands the delay to its release scheduler.
+        """
+        if not isinstance(message, dict):
+            return [], 0
+        action = message.get("action")
+        rules = self.rules_by_action.get(action) if isinstance(action, str) else None
+        if not rules:
+            return [], 0
+
+        # Only the counters are updated under the lock; templates render outside it.
+        matched: List[Tuple[_PreparedInsert, int, int]] = []
+        with self._lock:
+            for rule in rules:
+                if rule.once and action in self.processed_actions:
                     continue
-                repeat = 1
-            elif repeat is True:
-                repeat = 1
-            elif not isinstance(repeat, int) or repeat < 1:
-                print(f"[!] Warning: Invalid repeat value '{repeat}' for action '{action}'. Using 1.")
-                repeat = 1
-
-            if action not in self.processed_actions:
-                self.processed_actions[action] = 0
-            self.processed_actions[action] += 1
-
-            delay_ms = rule.get("delay_ms", 0)
-            if not isinstance(delay_ms, (int, float)) or delay_ms < 0:
-                delay_ms = 0
+                count = self.processed_actions[action] = self.processed_actions.get(action, 0) + 1
+                first = rule.rendered
+                if rule.template is not None:
+                    rule.rendered += rule.repeat
+                matched.append((rule, count, first))
 
-            if delay_ms > 0:
-                await asyncio.sleep(delay_ms / 1000.0)
-
-            for idx in range(repeat):
-                insertions.append(
-                    Insertion(
-                        data=hex_data,
-                        position=position,
-                        tag=f"insert_{action}_{self.processed_actions[action]}_{idx + 1}",
-                    )
-                )
-
-        return insertions
+        insertions: List[Insertion] = []
+        total_delay_ms = 0
+        for rule, count, first in matched:
+            total_delay_ms += rule.delay_ms
+            payload = rule.payload
+            if rule.template is not None:
+                payload = b"".join(rule.template.render(first + index, message) for index in range(rule.repeat))
+            insertions.append(Insertion(data=payload, position=rule.position, tag=f"insert_{action}_{count}"))
+
+        return insertions, total_delay_ms
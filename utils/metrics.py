@@ -0,0 +1,476 @@
+"""In-process metrics with a Prometheus text scrape endpoint.
+
+Updates run on the event loop for every frame, so each direction binds its label
+children once and then only adds to plain attributes. Rendering walks the registry
+on scrape, which also runs on the event loop, so no locking is needed. Each event
+loop (thread or worker process) owns its own registry; they are combined on scrape
+with ``export_state`` and ``merge_state``.
+
+The ``action`` label comes from peer payloads, so only actions named by configured
+rules get their own series; every other action is counted as ``OTHER_ACTION``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import bisect
+import os
+from typing import AbstractSet, Any, Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from utils.contracts import MetricsConfig, RuleDecision
+
+LabelValues = Tuple[str, ...]
+
+OTHER_ACTION = "other"
+
+DELAY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+QUEUE_DELAY_BUCKETS_MS = (0.1, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 1000)
+LATENCY_QUANTILES = (0.5, 0.9, 0.99, 0.999)
+# A scrape client gets this long to send its request line and headers.
+METRICS_REQUEST_TIMEOUT_S = 5.0
+
+# Log-bucketed (HDR-style) histogram layout: each power of two is split into
+# 2**_SUB_BITS linear sub-buckets, so a bucket is never wider than 1/8 of its value.
+_SUB_BITS = 3
+_SUB_COUNT = 1 << _SUB_BITS
+_EXACT_LIMIT = _SUB_COUNT * 2
+_LOG_BUCKETS = 64 * _SUB_COUNT
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def state(self) -> float:
+        return self.value
+
+    def merge(self, state: float) -> None:
+        self.value += state
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def state(self) -> Tuple[List[int], float, int]:
+        return self.counts, self.sum, self.count
+
+    def merge(self, state: Tuple[List[int], float, int]) -> None:
+        counts, total, count = state
+        for index, bucket_count in enumerate(counts):
+            self.counts[index] += bucket_count
+        self.sum += total
+        self.count += count
+
+
+class LogHistogram:
+    """Integer microsecond samples in log-linear buckets with bounded relative error."""
+
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self) -> None:
+        self.counts = [0] * _LOG_BUCKETS
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def record(self, value: int) -> None:
+        if value < 0:
+            value = 0
+        if value < _EXACT_LIMIT:
+            index = value
+        else:
+            shift = value.bit_length() - _SUB_BITS - 1
+            index = shift * _SUB_COUNT + (value >> shift)
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def state(self) -> Tuple[Dict[int, int], int, int, int]:
+        # Sparse buckets: most of the 512 are empty.
+        return {index: count for index, count in enumerate(self.counts) if count}, self.count, self.sum, self.max
+
+    def merge(self, state: Tuple[Dict[int, int], int, int, int]) -> None:
+        counts, count, total, maximum = state
+        for index, bucket_count in counts.items():
+            self.counts[index] += bucket_count
+        self.count += count
+        self.sum += total
+        if maximum > self.max:
+            self.max = maximum
+
+    def percentile(self, quantile: float) -> int:
+        """Upper bound of the bucket holding the given quantile (0 when empty)."""
+        if not self.count:
+            return 0
+        target = max(1, int(quantile * self.count + 0.5))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(_bucket_upper(index), self.max)
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "p50_us": self.percentile(0.5),
+            "p99_us": self.percentile(0.99),
+            "p999_us": self.percentile(0.999),
+            "max_us": self.max,
+            "mean_us": round(self.sum / self.count, 1) if self.count else 0.0,
+        }
+
+
+def _bucket_upper(index: int) -> int:
+    if index < _EXACT_LIMIT:
+        return index
+    shift, top = divmod(index, _SUB_COUNT)
+    top += _SUB_COUNT
+    shift -= 1
+    return ((top + 1) << shift) - 1
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._children: Dict[LabelValues, Any] = {}
+
+    def labels(self, *values: str) -> Any:
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self) -> Any:
+        raise NotImplementedError
+
+    def export_state(self) -> Dict[LabelValues, Any]:
+        return {values: child.state() for values, child in self._children.items()}
+
+    def merge_state(self, state: Dict[LabelValues, Any]) -> None:
+        for values, child_state in state.items():
+            self.labels(*values).merge(child_state)
+
+    def _label_text(self, values: LabelValues, extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} {self.kind}"
+        yield from self._render_samples()
+
+    def _render_samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def _render_samples(self) -> Iterator[str]:
+        for values, child in self._children.items():
+            yield f"{self.name}{self._label_text(values)} {_number(child.value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str], buckets: Sequence[float]):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def _render_samples(self) -> Iterator[str]:
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, child.counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{self._label_text(values, le)} {cumulative}"
+            inf = 'le="+Inf"'
+            yield f"{self.name}_bucket{self._label_text(values, inf)} {child.count}"
+            yield f"{self.name}_sum{self._label_text(values)} {_number(child.sum)}"
+            yield f"{self.name}_count{self._label_text(values)} {child.count}"
+
+
+class LatencySummary(_Metric):
+    """``LogHistogram`` children rendered as a Prometheus summary with fixed quantiles."""
+
+    kind = "summary"
+
+    def _new_child(self) -> LogHistogram:
+        return LogHistogram()
+
+    def _render_samples(self) -> Iterator[str]:
+        for values, child in self._children.items():
+            for quantile in LATENCY_QUANTILES:
+                q = f'quantile="{quantile}"'
+                yield f"{self.name}{self._label_text(values, q)} {child.percentile(quantile)}"
+            yield f"{self.name}_sum{self._label_text(values)} {child.sum}"
+            yield f"{self.name}_count{self._label_text(values)} {child.count}"
+
+
+class MetricsRegistry:
+    """All proxy metrics; ``direction`` hands out pre-bound per-direction recorders."""
+
+    def __init__(self) -> None:
+        self._metrics: List[_Metric] = []
+        self.connections_active = self._add(Gauge("tcp_proxy_connections_active", "Open client connections.", ()))
+        self.connections_total = self._add(Counter("tcp_proxy_connections_total", "Accepted client connections.", ()))
+        self.received_bytes = self._add(
+            Counter("tcp_proxy_received_bytes_total", "Bytes read from the source socket.", ("direction",))
+        )
+        self.frames = self._add(
+            Counter("tcp_proxy_frames_total", "Frames seen by the rule engine.", ("direction", "action"))
+        )
+        self.forwarded_bytes = self._add(
+            Counter("tcp_proxy_forwarded_bytes_total", "Original bytes written to the peer.", ("direction",))
+        )
+        self.dropped_frames = self._add(
+            Counter("tcp_proxy_frames_dropped_total", "Frames not forwarded, by reason.", ("direction", "drop_reason"))
+        )
+        self.injected_bytes = self._add(
+            Counter("tcp_proxy_injected_bytes_total", "Bytes added by insert and replay rules.", ("direction",))
+        )
+        self.decode_errors = self._add(
+            Counter("tcp_proxy_decode_errors_total", "Frames whose payload failed to decode.", ("direction",))
+        )
+        self.decode_offloads = self._add(
+            Counter("tcp_proxy_decode_offloads_total", "Frames decoded in the decode pool.", ("direction",))
+        )
+        self.decode_offload_fallbacks = self._add(
+            Counter(
+                "tcp_proxy_decode_offload_fallbacks_total",
+                "Large frames decoded inline because the decode pool had failed.",
+                ("direction",),
+            )
+        )
+        self.decode_offload_queue_delay_ms = self._add(
+            Histogram(
+                "tcp_proxy_decode_offload_queue_delay_ms",
+                "Time offloaded decodes waited for a pool worker, in milliseconds.",
+                ("direction",),
+                QUEUE_DELAY_BUCKETS_MS,
+            )
+        )
+        self.frame_delay_ms = self._add(
+            Histogram(
+                "tcp_proxy_frame_delay_ms",
+                "Configured hold time of delayed frames in milliseconds.",
+                ("direction",),
+                DELAY_BUCKETS_MS,
+            )
+        )
+        self.added_latency_us = self._add(
+            LatencySummary(
+                "tcp_proxy_added_latency_us",
+                "Read-to-write time of forwarded frames minus configured delays, in microseconds.",
+                ("direction", "action"),
+            )
+        )
+
+    def _add(self, metric: Any) -> Any:
+        self._metrics.append(metric)
+        return metric
+
+    def direction(
+        self, source_ip: str, target_ip: str, rule_actions: AbstractSet[str] = frozenset()
+    ) -> "DirectionMetrics":
+        return DirectionMetrics(self, f"{source_ip}->{target_ip}", rule_actions)
+
+    def export_state(self) -> Dict[str, Dict[LabelValues, Any]]:
+        """Picklable copy of every sample, for aggregation in another process."""
+        return {metric.name: metric.export_state() for metric in self._metrics}
+
+    def merge_state(self, state: Dict[str, Dict[LabelValues, Any]]) -> None:
+        """Add the samples of another registry's ``export_state`` to this one."""
+        for metric in self._metrics:
+            metric_state = state.get(metric.name)
+            if metric_state:
+                metric.merge_state(metric_state)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class DirectionMetrics:
+    """Label children of one direction, bound when the direction starts.
+
+    Actions outside ``rule_actions`` share the ``OTHER_ACTION`` children, so a peer
+    cannot create label series (or per-connection histograms) without bound.
+    """
+
+    def __init__(self, registry: MetricsRegistry, direction: str, rule_actions: AbstractSet[str] = frozenset()):
+        self.registry = registry
+        self.direction = direction
+        self.rule_actions = rule_actions
+        self.received_bytes = registry.received_bytes.labels(direction)
+        self.forwarded_bytes = registry.forwarded_bytes.labels(direction)
+        self.injected_bytes = registry.injected_bytes.labels(direction)
+        self.decode_errors = registry.decode_errors.labels(direction)
+        self.decode_offloads = registry.decode_offloads.labels(direction)
+        self.decode_offload_fallbacks = registry.decode_offload_fallbacks.labels(direction)
+        self.decode_offload_queue_delay_ms = registry.decode_offload_queue_delay_ms.labels(direction)
+        self.frame_delay_ms = registry.frame_delay_ms.labels(direction)
+        self._frames: Dict[str, _CounterChild] = {}
+        self._drops: Dict[Optional[str], _CounterChild] = {}
+        self._latency: Dict[str, Tuple[LogHistogram, LogHistogram]] = {}
+
+    def _action_label(self, action: Optional[str]) -> str:
+        # Children are cached by label, never by the raw action, so unknown actions add nothing.
+        if action is None:
+            return ""
+        return action if action in self.rule_actions else OTHER_ACTION
+
+    def latency_recorders(self, action: Optional[str]) -> Tuple[LogHistogram, LogHistogram]:
+        """Return the (registry-wide, this-direction-only) latency histograms for ``action``."""
+        label = self._action_label(action)
+        recorders = self._latency.get(label)
+        if recorders is None:
+            recorders = self._latency[label] = (
+                self.registry.added_latency_us.labels(self.direction, label),
+                LogHistogram(),
+            )
+        return recorders
+
+    def latency_snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Per-action latency of this direction only, for the connection_closed event."""
+        return {label: local.snapshot() for label, (_, local) in self._latency.items() if local.count}
+
+    def record_read(self, size: int) -> None:
+        self.received_bytes.value += size
+
+    def record_raw_forward(self, size: int) -> None:
+        self.forwarded_bytes.value += size
+
+    def record_decision(self, decision: RuleDecision, frame_size: int) -> None:
+        label = self._action_label(decision.action)
+        frames = self._frames.get(label)
+        if frames is None:
+            frames = self._frames[label] = self.registry.frames.labels(self.direction, label)
+        frames.value += 1
+
+        if decision.forward_original:
+            self.forwarded_bytes.value += frame_size
+        else:
+            drops = self._drops.get(decision.drop_reason)
+            if drops is None:
+                drops = self._drops[decision.drop_reason] = self.registry.dropped_frames.labels(
+                    self.direction, decision.drop_reason or ""
+                )
+            drops.value += 1
+
+        if decision.before_insertions or decision.after_insertions:
+            injected = 0
+            for insertion in decision.before_insertions:
+                injected += len(insertion.data)
+            for insertion in decision.after_insertions:
+                injected += len(insertion.data)
+            self.injected_bytes.value += injected
+        if decision.scheduled_insertions:
+            # Counted when scheduled; copies dropped at close are still included.
+            self.injected_bytes.value += sum(len(insertion.data) for insertion in decision.scheduled_insertions)
+
+        if decision.delayed_ms:
+            self.frame_delay_ms.observe(decision.delayed_ms)
+        if decision.decode_failed:
+            self.decode_errors.value += 1
+        if decision.offload_queue_delay_ms is not None:
+            self.decode_offloads.value += 1
+            self.decode_offload_queue_delay_ms.observe(decision.offload_queue_delay_ms)
+        elif decision.offload_fallback:
+            self.decode_offload_fallbacks.value += 1
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+async def start_metrics_server(
+    registry: MetricsRegistry,
+    config: MetricsConfig,
+    render: Optional[Callable[[], Awaitable[str]]] = None,
+    request_timeout_s: float = METRICS_REQUEST_TIMEOUT_S,
+) -> asyncio.AbstractServer:
+    """Serve ``GET /metrics`` over TCP or a Unix socket.
+
+    ``render`` replaces ``registry.render`` when the samples have to be gathered
+    first, such as from worker processes. Clients that do not finish sending their
+    request within ``request_timeout_s`` are disconnected.
+    """
+
+    async def read_request(reader: asyncio.StreamReader) -> bytes:
+        request_line = await reader.readline()
+        # Headers are not needed; read them so the client sees a clean close.
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        return request_line
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            try:
+                request_line = await asyncio.wait_for(read_request(reader), request_timeout_s)
+            except asyncio.TimeoutError:
+                return
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?", 1)[0] == "/metrics":
+                text = await render() if render is not None else registry.render()
+                status, body = "200 OK", text.encode("utf-8")
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            else:
+                status, body, content_type = "404 Not Found", b"not found\n", "text/plain"
+            writer.write(
+                (
+                    f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                    f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+                ).encode("latin-1")
+                + body
+            )
+            await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            writer.close()
+
+    if config.unix_socket:
+        if os.path.exists(config.unix_socket):
+            os.unlink(config.unix_socket)
+        return await asyncio.start_unix_server(handle, path=config.unix_socket)
+    return await asyncio.start_server(handle, config.host, config.port)
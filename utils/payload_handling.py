@@ -1,12 +1,13 @@
 from __future__ import annotations
 
-import asyncio
-import json
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
+from utils import event_log
 from utils.block_action import BlockAction
 from utils.config_loading import ConfigValidationError, normalize_proxy_config
 from utils.contracts import (
+    ACTION_UNKNOWN,
+    ActionPlan,
     DirectionContext,
     ForwardingContext,
     Insertion,
@@ -15,38 +16,144 @@ from utils.contracts import (
     RuleDecision,
     RuleSetConfig,
 )
+from utils.decode_offload import DecodeOffloader
 from utils.delay_action import DelayAction
 from utils.insert_action import InsertAction
+from utils.prefix_index import DirectionIndex
 from utils.replay_action import ReplayAction
 
+# (direction name, source pattern, target pattern) identifies a direction across reloads.
+_DirectionKey = Tuple[str, str, str]
+_RuleActions = Tuple[DelayAction, BlockAction, InsertAction, ReplayAction]
+
 
 class PayloadHandler:
     """Applies normalized global and direction-specific payload rules."""
 
-    def __init__(self, config: Optional[ProxyConfig | Dict[str, Any]] = None, config_version: int = 0):
+    def __init__(
+        self,
+        config: Optional[ProxyConfig | Dict[str, Any]] = None,
+        config_version: int = 0,
+        decode_offloader: Optional[DecodeOffloader] = None,
+        previous: Optional["PayloadHandler"] = None,
+    ):
+        """Build the runtime rules for ``config``.
+
+        With ``previous`` (the handler being replaced on reload), rule sets whose
+        config did not change keep their action objects, so insert counters and live
+        replay sessions carry over and only changed rule sets are rebuilt.
+        """
         # Normalize once at construction so frame handling avoids YAML-shaped config parsing.
         self.config = self._normalize_config(config)
         self.config_version = config_version
+        self.decode_offloader = decode_offloader
+        self.log_policy = event_log.LogPolicy(self.config.logging)
         self.requires_frame_processing = self._has_effective_rules()
-        self.direction_lookup: Dict[Tuple[str, str], DirectionContext] = {}
-        self.global_delay_action = DelayAction(self.config.global_rules.delay_rules)
-        self.global_block_action = BlockAction(self.config.global_rules.block_rules)
-        self.global_insert_action = InsertAction(self.config.global_rules.insert_rules)
-        self.global_replay_action = ReplayAction(self.config.global_rules.replay_rules)
+        self.global_rules_active = self._rule_set_has_actions(self.config.global_rules)
+        # Longest-prefix match on (source, target) to a direction key; a later direction
+        # with the same pair of patterns replaces an earlier one.
+        self.direction_index: DirectionIndex[_DirectionKey] = DirectionIndex()
+        # Rule set key (None for global) -> (its config, its actions), for the next reload.
+        self._rule_sets: Dict[Optional[_DirectionKey], Tuple[RuleSetConfig, _RuleActions]] = {}
+        self._direction_contexts: Dict[_DirectionKey, DirectionContext] = {}
+        self.rule_sets_reused = 0
+        self.rule_sets_rebuilt = 0
+        keep_replays = previous is not None and previous.config.replay_sessions == self.config.replay_sessions
 
+        global_actions, global_reused = self._rule_actions(None, self.config.global_rules, previous, keep_replays)
+        (
+            self.global_delay_action,
+            self.global_block_action,
+            self.global_insert_action,
+            self.global_replay_action,
+        ) = global_actions
+        global_scope = ("global", *global_actions)
+        if global_reused:
+            self.global_plans = previous.global_plans
+        else:
+            self.global_plans = self._compile_plans((global_scope,), {})
+
+        direction_keys = []
         for direction in self.config.directions:
             if not direction.source_ip or not direction.target_ip:
                 continue
 
-            self.direction_lookup[(direction.source_ip, direction.target_ip)] = DirectionContext(
-                source_ip=direction.source_ip,
-                target_ip=direction.target_ip,
-                direction_name=direction.direction_name,
-                delay_action=DelayAction(direction.rules.delay_rules),
-                block_action=BlockAction(direction.rules.block_rules),
-                insert_action=InsertAction(direction.rules.insert_rules),
-                replay_action=ReplayAction(direction.rules.replay_rules),
-            )
+            key = (direction.direction_name, direction.source_ip, direction.target_ip)
+            actions, reused = self._rule_actions(key, direction.rules, previous, keep_replays)
+            direction_ctx = previous._direction_contexts.get(key) if global_reused and reused else None
+            if direction_ctx is None:
+                # Plans merge the global scope in, so they are recompiled whenever either side changed.
+                delay_action, block_action, insert_action, replay_action = actions
+                direction_ctx = DirectionContext(
+                    source_ip=direction.source_ip,
+                    target_ip=direction.target_ip,
+                    direction_name=direction.direction_name,
+                    delay_action=delay_action,
+                    block_action=block_action,
+                    insert_action=insert_action,
+                    replay_action=replay_action,
+                    has_rules=self._rule_set_has_actions(direction.rules),
+                )
+                direction_scope = (direction.direction_name, *actions)
+                direction_ctx.plans = self._compile_plans((global_scope, direction_scope), self.global_plans)
+            self._direction_contexts[key] = direction_ctx
+            direction_keys.append(key)
+
+        # Actions named by any rule; metrics give only these their own ``action`` label.
+        rule_actions = set(self.global_plans)
+        for direction_ctx in self._direction_contexts.values():
+            rule_actions.update(direction_ctx.plans)
+        self.rule_actions = frozenset(rule_actions)
+
+        # The index only depends on the direction patterns, which most reloads keep.
+        self._direction_keys = tuple(direction_keys)
+        if previous is not None and previous._direction_keys == self._direction_keys:
+            self.direction_index = previous.direction_index
+        else:
+            for name, source_ip, target_ip in self._direction_keys:
+                self.direction_index.add(source_ip, target_ip, (name, source_ip, target_ip))
+
+    def _rule_actions(
+        self,
+        key: Optional[_DirectionKey],
+        rules: RuleSetConfig,
+        previous: Optional["PayloadHandler"],
+        keep_replays: bool,
+    ) -> Tuple[_RuleActions, bool]:
+        """Return the actions for one rule set and whether all of them were reused.
+
+        Each action is reused from ``previous`` when its part of the rule set is
+        unchanged; replay actions also need the same ``replay_sessions`` limits.
+        """
+        delay_action = block_action = insert_action = replay_action = None
+        earlier = previous._rule_sets.get(key) if previous is not None else None
+        if earlier is not None:
+            old_rules, (old_delay, old_block, old_insert, old_replay) = earlier
+            if old_rules.delay_rules == rules.delay_rules:
+                delay_action = old_delay
+            if old_rules.block_rules == rules.block_rules:
+                block_action = old_block
+            if old_rules.insert_rules == rules.insert_rules:
+                insert_action = old_insert
+            if keep_replays and old_rules.replay_rules == rules.replay_rules:
+                replay_action = old_replay
+
+        reused = all(action is not None for action in (delay_action, block_action, insert_action, replay_action))
+        if delay_action is None:
+            delay_action = DelayAction(rules.delay_rules)
+        if block_action is None:
+            block_action = BlockAction(rules.block_rules)
+        if insert_action is None:
+            insert_action = InsertAction(rules.insert_rules)
+        if replay_action is None:
+            replay_action = self._replay_action(rules)
+        actions = (delay_action, block_action, insert_action, replay_action)
+        self._rule_sets[key] = (rules, actions)
+        if reused:
+            self.rule_sets_reused += 1
+        else:
+            self.rule_sets_rebuilt += 1
+        return actions, reused
 
     @staticmethod
     def validate_config(config: Dict[str, Any]) -> Tuple[bool, List[str]]:
@@ -64,6 +171,10 @@ class PayloadHandler:
             return ProxyConfig()
         return normalize_proxy_config(config).config
 
+    def _replay_action(self, rule_set: RuleSetConfig) -> ReplayAction:
+        limits = self.config.replay_sessions
+        return ReplayAction(rule_set.replay_rules, limits.max_sessions, limits.idle_timeout_s)
+
     @staticmethod
     def _rule_set_has_actions(rule_set: RuleSetConfig) -> bool:
         return bool(
@@ -73,6 +184,47 @@ class PayloadHandler:
             or rule_set.replay_rules
         )
 
+    @staticmethod
+    def _compile_plans(
+        scopes: Tuple[Tuple[str, DelayAction, BlockAction, InsertAction, ReplayAction], ...],
+        inherited: Dict[str, ActionPlan],
+    ) -> Dict[str, ActionPlan]:
+        """Merge the rule sets in ``scopes`` into one plan per action they name.
+
+        Only the last scope's actions are compiled; every other action keeps its plan
+        from ``inherited``, so directions share the global plan objects they do not
+        override.
+        """
+        _, delay_action, block_action, insert_action, replay_action = scopes[-1]
+        actions = set(delay_action.delay_rules)
+        actions.update(block_action.block_rules, insert_action.actions, replay_action.rules)
+
+        plans = dict(inherited)
+        for action in actions:
+            drop_reason = None
+            delay_ms = 0
+            insert_actions = []
+            replay_actions = []
+            for scope, delay_action, block_action, insert_action, replay_action in scopes:
+                if drop_reason is None and action in block_action.block_rules:
+                    drop_reason = f"block:{scope}"
+                delay = delay_action.delay_rules.get(action)
+                if delay:
+                    delay_ms += int(delay)
+                if action in insert_action.actions:
+                    insert_actions.append(insert_action)
+                if action in replay_action.rules:
+                    replay_actions.append((f"replay_block:{scope}", replay_action))
+            plans[action] = ActionPlan(
+                drop_reason=drop_reason,
+                delay_ms=delay_ms,
+                insert_actions=tuple(insert_actions),
+                replay_actions=tuple(replay_actions),
+                needs_message=any(insert.needs_message(action) for insert in insert_actions)
+                or any(replay.needs_message(action) for _, replay in replay_actions),
+            )
+        return plans
+
     def _has_effective_rules(self) -> bool:
         """Return whether this handler can mutate, delay, or drop frames."""
         if self._rule_set_has_actions(self.config.global_rules):
@@ -81,15 +233,110 @@ class PayloadHandler:
         return any(self._rule_set_has_actions(direction.rules) for direction in self.config.directions)
 
     def get_matching_direction(self, source_ip: str, target_ip: str) -> Optional[DirectionContext]:
-        return self.direction_lookup.get((source_ip, target_ip))
+        key = self.direction_index.lookup(source_ip, target_ip)
+        return self._direction_contexts[key] if key is not None else None
+
+    def bind_direction(self, context: ForwardingContext) -> Optional[DirectionContext]:
+        """Return the direction rules for ``context``, resolving them once per handler.
+
+        The binding is keyed by handler identity rather than ``config_version`` so a
+        context that moves to any other handler, including ones built outside the
+        runtime state with the same version, is always re-resolved.
+        """
+        binding = context.binding
+        if binding.handler is not self:
+            direction_ctx = binding.direction = self.get_matching_direction(context.source_ip, context.target_ip)
+            binding.handler = self
+            direction_name = direction_ctx.direction_name if direction_ctx else None
+            if (
+                not self.global_rules_active
+                and (direction_ctx is None or not direction_ctx.has_rules)
+                and self.log_policy.log_frame_event("no_applicable_rules", direction_name, None, non_default=False)
+            ):
+                # Logged once per binding; every frame of it is forwarded without decoding.
+                self._log_event(
+                    event="no_applicable_rules",
+                    connection_id=context.connection_id,
+                    direction=context.direction_label,
+                    source_ip=context.source_ip,
+                    target_ip=context.target_ip,
+                    decision="forward_raw_frame",
+                    matched_direction=direction_name,
+                )
+        return binding.direction
+
+    def release_context(self, context: ForwardingContext) -> None:
+        """Drop replay sessions owned by ``context``; called when its direction ends."""
+        self.global_replay_action.release(context)
+        direction_ctx = self.get_matching_direction(context.source_ip, context.target_ip)
+        if direction_ctx is not None:
+            direction_ctx.replay_action.release(context)
+
+    def expire_replay_sessions(self) -> int:
+        """Drop idle replay sessions of every rule set; called from a periodic sweep."""
+        return sum(actions[3].expire_idle() for _, actions in self._rule_sets.values())
 
     def _log_event(self, **fields: Any) -> None:
+        if not self.log_policy.enabled(fields["event"]):
+            return
         payload = {
             "component": "payload_handler",
             "config_version": self.config_version,
             **fields,
         }
-        print(json.dumps(payload, default=str))
+        event_log.emit(payload)
+
+    async def _decode_large_frame(
+        self,
+        frame: MessageFrame,
+        context: ForwardingContext,
+        decision: RuleDecision,
+        before_wait: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """Move a pending full decode into the worker pool when the frame is large."""
+        if self.decode_offloader is None or not self.decode_offloader.should_offload(frame):
+            return
+
+        if before_wait is not None:
+            before_wait()
+        offloaded = await self.decode_offloader.decode(frame)
+        if offloaded is None:
+            return
+        if offloaded.fallback:
+            decision.offload_fallback = True
+            return
+        decision.offload_queue_delay_ms = offloaded.queue_delay_s * 1000.0
+        direction_ctx = context.binding.direction
+        if self.log_policy.log_frame_event(
+            "decode_offloaded", direction_ctx.direction_name if direction_ctx else None, None, non_default=False
+        ):
+            self._log_event(
+                event="decode_offloaded",
+                connection_id=context.connection_id,
+                direction=context.direction_label,
+                payload_bytes=offloaded.payload_bytes,
+                queue_delay_ms=round(offloaded.queue_delay_s * 1000.0, 3),
+                decode_ms=round(offloaded.decode_time_s * 1000.0, 3),
+            )
+
+    async def _rule_message(
+        self,
+        frame: MessageFrame,
+        action: Optional[str],
+        plan: ActionPlan,
+        context: ForwardingContext,
+        decision: RuleDecision,
+        before_wait: Optional[Callable[[], None]] = None,
+    ) -> Dict[str, Any]:
+        """Return the message view rules need, decoding only for rules that copy fields."""
+        if frame.is_decoded:
+            return frame.decoded
+
+        if plan.needs_message:
+            await self._decode_large_frame(frame, context, decision, before_wait)
+            if isinstance(frame.decoded, dict):
+                return frame.decoded
+        return {"action": action}
 
     def _add_insertions(self, decision: RuleDecision, insertions: List[Insertion]) -> None:
         for insertion in insertions:
@@ -98,61 +345,125 @@ class PayloadHandler:
             else:
                 decision.after_insertions.append(insertion)
 
+    def _add_rule_insertions(self, decision: RuleDecision, insert_action: InsertAction, message: Any) -> None:
+        insertions, delay_ms = insert_action.collect_insertions(message)
+        self._add_insertions(decision, insertions)
+        decision.delayed_ms += delay_ms
+
+    def _log_frame_decision(
+        self,
+        decision: RuleDecision,
+        context: ForwardingContext,
+        direction_ctx: Optional[DirectionContext],
+    ) -> None:
+        non_default = (
+            not decision.forward_original
+            or decision.delayed_ms > 0
+            or bool(decision.before_insertions)
+            or bool(decision.after_insertions)
+            or bool(decision.scheduled_insertions)
+        )
+        # Checked before building the event so sampled-out frames cost no dict or JSON work.
+        if not self.log_policy.log_frame_decision(
+            direction_ctx.direction_name if direction_ctx else None, decision.action, non_default
+        ):
+            return
+
+        self._log_event(
+            event="frame_decision",
+            connection_id=context.connection_id,
+            direction=context.direction_label,
+            source_ip=context.source_ip,
+            target_ip=context.target_ip,
+            action=decision.action,
+            decision="forward" if decision.forward_original else "drop",
+            drop_reason=decision.drop_reason,
+            delayed_ms=decision.delayed_ms,
+            before_insertions=len(decision.before_insertions),
+            after_insertions=len(decision.after_insertions),
+            scheduled_insertions=len(decision.scheduled_insertions),
+            matched_direction=direction_ctx.direction_name if direction_ctx else None,
+        )
+
     async def process_frame(
         self,
         frame: MessageFrame,
         context: ForwardingContext,
+        before_wait: Optional[Callable[[], None]] = None,
     ) -> RuleDecision:
-        """Evaluate one decoded frame and return the writes/drop decision."""
+        """Evaluate one decoded frame and return the writes/drop decision.
+
+        ``decision.delayed_ms`` is the hold time the caller applies before writing.
+        ``before_wait`` is called right before the handler suspends for an offloaded
+        decode, so callers can flush writes they are still batching.
+        """
         decision = RuleDecision(forward_original=True)
+        binding = context.binding
+        direction_ctx = binding.direction if binding.handler is self else self.bind_direction(context)
 
-        if frame.decode_error:
-            self._log_event(
-                event="decode_error",
-                connection_id=context.connection_id,
-                direction=context.direction_label,
-                source_ip=context.source_ip,
-                target_ip=context.target_ip,
-                decode_error=frame.decode_error,
-                decision="forward_raw_frame",
-            )
+        if not self.global_rules_active and (direction_ctx is None or not direction_ctx.has_rules):
+            # No rule can match this direction, so the payload is never decoded.
             return decision
 
-        message = frame.decoded
-        if not isinstance(message, dict):
-            self._log_event(
-                event="non_dict_message",
-                connection_id=context.connection_id,
-                direction=context.direction_label,
-                source_ip=context.source_ip,
-                target_ip=context.target_ip,
-                decision="forward_raw_frame",
-            )
-            return decision
+        # The action scan settles most frames; only ambiguous payloads get fully decoded.
+        if frame.peek_action() is ACTION_UNKNOWN:
+            await self._decode_large_frame(frame, context, decision, before_wait)
+        action = decision.action = frame.action
+        if frame.is_decoded:
+            if frame.decode_error:
+                decision.decode_failed = True
+                if not self.log_policy.log_frame_event(
+                    "decode_error", direction_ctx.direction_name if direction_ctx else None, None, non_default=True
+                ):
+                    return decision
+                self._log_event(
+                    event="decode_error",
+                    connection_id=context.connection_id,
+                    direction=context.direction_label,
+                    source_ip=context.source_ip,
+                    target_ip=context.target_ip,
+                    decode_error=frame.decode_error,
+                    decision="forward_raw_frame",
+                )
+                return decision
 
-        action = message.get("action")
-        direction_ctx = self.get_matching_direction(context.source_ip, context.target_ip)
+            if not isinstance(frame.decoded, dict):
+                if not self.log_policy.log_frame_event(
+                    "non_dict_message", direction_ctx.direction_name if direction_ctx else None, None, non_default=False
+                ):
+                    return decision
+                self._log_event(
+                    event="non_dict_message",
+                    connection_id=context.connection_id,
+                    direction=context.direction_label,
+                    source_ip=context.source_ip,
+                    target_ip=context.target_ip,
+                    decision="forward_raw_frame",
+                )
+                return decision
 
-        replay_blocked = self.global_replay_action.check_replay_block(message)
-        replay_block_scope = "global" if replay_blocked else None
-        if not replay_blocked and direction_ctx:
-            replay_blocked = direction_ctx.replay_action.check_replay_block(message)
-            if replay_blocked:
-                replay_block_scope = direction_ctx.direction_name
+        plans = direction_ctx.plans if direction_ctx is not None else self.global_plans
+        plan = plans.get(action)
+        if plan is None:
+            # No rule names this action, so the frame is forwarded unchanged.
+            self._log_frame_decision(decision, context, direction_ctx)
+            return decision
 
-        if replay_blocked:
-            decision.forward_original = False
-            decision.drop_reason = f"replay_block:{replay_block_scope}"
+        message = await self._rule_message(frame, action, plan, context, decision, before_wait)
 
-        if decision.forward_original and self.global_block_action.should_block(message):
-            decision.forward_original = False
-            decision.drop_reason = "block:global"
+        for drop_reason, replay_action in plan.replay_actions:
+            if replay_action.check_replay_block(message, context, frame.raw_frame):
+                decision.forward_original = False
+                decision.drop_reason = drop_reason
+                break
 
-        if decision.forward_original and direction_ctx and direction_ctx.block_action.should_block(message):
+        if decision.forward_original and plan.drop_reason is not None:
             decision.forward_original = False
-            decision.drop_reason = f"block:{direction_ctx.direction_name}"
-
-        if not decision.forward_original and not decision.drop_reason.startswith("replay_block"):
+            decision.drop_reason = plan.drop_reason
+            if not self.log_policy.log_frame_decision(
+                direction_ctx.direction_name if direction_ctx else None, action, non_default=True
+            ):
+                return decision
             self._log_event(
                 event="frame_decision",
                 connection_id=context.connection_id,
@@ -166,43 +477,20 @@ class PayloadHandler:
             return decision
 
         if decision.forward_original:
-            global_delay = self.global_delay_action.get_delay(message)
-            if global_delay:
-                await asyncio.sleep(global_delay / 1000.0)
-                decision.delayed_ms += int(global_delay)
+            # Delays are only recorded here; the caller's release scheduler holds the
+            # frame so reading and decoding continue while it waits.
+            decision.delayed_ms += plan.delay_ms
+            for _, replay_action in plan.replay_actions:
+                replay_action.start_replay_if_needed(message, context, frame.raw_frame)
 
-            if direction_ctx:
-                direction_delay = direction_ctx.delay_action.get_delay(message)
-                if direction_delay:
-                    await asyncio.sleep(direction_delay / 1000.0)
-                    decision.delayed_ms += int(direction_delay)
-
-            self.global_replay_action.start_replay_if_needed(message)
-            if direction_ctx:
-                direction_ctx.replay_action.start_replay_if_needed(message)
-
-        self._add_insertions(decision, self.global_replay_action.get_replay_insertions(message))
-        if direction_ctx:
-            self._add_insertions(decision, direction_ctx.replay_action.get_replay_insertions(message))
+        for _, replay_action in plan.replay_actions:
+            insertions, scheduled = replay_action.collect_replays(message, context)
+            self._add_insertions(decision, insertions)
+            decision.scheduled_insertions.extend(scheduled)
 
         if decision.forward_original:
-            self._add_insertions(decision, await self.global_insert_action.get_insertions(message))
-            if direction_ctx:
-                self._add_insertions(decision, await direction_ctx.insert_action.get_insertions(message))
-
-        self._log_event(
-            event="frame_decision",
-            connection_id=context.connection_id,
-            direction=context.direction_label,
-            source_ip=context.source_ip,
-            target_ip=context.target_ip,
-            action=action,
-            decision="forward" if decision.forward_original else "drop",
-            drop_reason=decision.drop_reason,
-            delayed_ms=decision.delayed_ms,
-            before_insertions=len(decision.before_insertions),
-            after_insertions=len(decision.after_insertions),
-            matched_direction=direction_ctx.direction_name if direction_ctx else None,
-        )
+            for insert_action in plan.insert_actions:
+                self._add_rule_insertions(decision, insert_action, message)
 
+        self._log_frame_decision(decision, context, direction_ctx)
         return decision
@@ -0,0 +1,141 @@
+"""Longest-prefix index for matching directions by source and target address.
+
+Directions are stored in a binary trie keyed by source prefix. Each source node
+holds a second trie keyed by target prefix. A lookup walks at most one trie path
+per address (33 nodes for IPv4, 129 for IPv6), so its cost depends on address
+width, not on how many directions are configured.
+
+Precedence: the direction with the longest matching source prefix wins. Among
+those, the one with the longest matching target prefix wins. ``*`` is a zero-length
+prefix that matches every IPv4 and IPv6 address.
+"""
+
+from __future__ import annotations
+
+import functools
+import ipaddress
+from typing import Generic, Iterator, List, Optional, Tuple, TypeVar, Union
+
+T = TypeVar("T")
+
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+WILDCARD = "*"
+
+
+# Reloads parse the same patterns again; parsed networks are immutable, so they are shared.
+@functools.lru_cache(maxsize=4096)
+def parse_address_pattern(pattern: str) -> Tuple[IPNetwork, ...]:
+    """Turn ``*``, an address, or a CIDR prefix into the networks it covers.
+
+    Raises ``ValueError`` for anything else. Host bits below the prefix length are
+    ignored, so ``10.0.0.7/24`` means ``10.0.0.0/24``.
+    """
+    pattern = pattern.strip()
+    if pattern == WILDCARD:
+        return ipaddress.ip_network("0.0.0.0/0"), ipaddress.ip_network("::/0")
+    return (ipaddress.ip_network(pattern, strict=False),)
+
+
+@functools.lru_cache(maxsize=4096)
+def normalize_address_pattern(pattern: str) -> str:
+    """Canonical text for a pattern: ``*``, a bare address, or ``network/prefixlen``."""
+    networks = parse_address_pattern(pattern)
+    if len(networks) > 1:
+        return WILDCARD
+    network = networks[0]
+    if network.prefixlen == network.max_prefixlen:
+        return str(network.network_address)
+    return str(network)
+
+
+class _Node:
+    __slots__ = ("children", "value", "has_value")
+
+    def __init__(self) -> None:
+        self.children: List[Optional[_Node]] = [None, None]
+        self.value = None
+        self.has_value = False
+
+
+class PrefixTrie(Generic[T]):
+    """Binary trie over IPv4 and IPv6 prefixes with one value per prefix."""
+
+    def __init__(self) -> None:
+        self._roots = {4: _Node(), 6: _Node()}
+
+    def _node_for(self, network: IPNetwork, create: bool) -> Optional[_Node]:
+        node: Optional[_Node] = self._roots[network.version]
+        bits = int(network.network_address)
+        width = network.max_prefixlen
+        for depth in range(network.prefixlen):
+            bit = (bits >> (width - 1 - depth)) & 1
+            child = node.children[bit]
+            if child is None:
+                if not create:
+                    return None
+                child = node.children[bit] = _Node()
+            node = child
+        return node
+
+    def get(self, network: IPNetwork) -> Optional[T]:
+        node = self._node_for(network, create=False)
+        return node.value if node is not None and node.has_value else None
+
+    def set(self, network: IPNetwork, value: T) -> None:
+        node = self._node_for(network, create=True)
+        node.value = value
+        node.has_value = True
+
+    def matches(self, address: Union[ipaddress.IPv4Address, ipaddress.IPv6Address]) -> Iterator[T]:
+        """Values of every prefix containing ``address``, longest prefix first."""
+        node: Optional[_Node] = self._roots[address.version]
+        bits = int(address)
+        width = address.max_prefixlen
+        found: List[T] = []
+        depth = 0
+        while node is not None:
+            if node.has_value:
+                found.append(node.value)
+            if depth == width:
+                break
+            node = node.children[(bits >> (width - 1 - depth)) & 1]
+            depth += 1
+        return reversed(found)
+
+
+class DirectionIndex(Generic[T]):
+    """Maps (source pattern, target pattern) pairs to values with longest-prefix lookup."""
+
+    def __init__(self) -> None:
+        self._sources: PrefixTrie[PrefixTrie[T]] = PrefixTrie()
+
+    def add(self, source_pattern: str, target_pattern: str, value: T) -> None:
+        """Register ``value``; a later value for the same pair replaces an earlier one."""
+        for source in parse_address_pattern(source_pattern):
+            targets = self._sources.get(source)
+            if targets is None:
+                targets = PrefixTrie()
+                self._sources.set(source, targets)
+            for target in parse_address_pattern(target_pattern):
+                targets.set(target, value)
+
+    def lookup(self, source_ip: str, target_ip: str) -> Optional[T]:
+        try:
+            source = _unmapped(ipaddress.ip_address(source_ip))
+            target = _unmapped(ipaddress.ip_address(target_ip))
+        except ValueError:
+            return None
+
+        for targets in self._sources.matches(source):
+            for value in targets.matches(target):
+                return value
+        return None
+
+
+def _unmapped(
+    address: Union[ipaddress.IPv4Address, ipaddress.IPv6Address],
+) -> Union[ipaddress.IPv4Address, ipaddress.IPv6Address]:
+    # Dual-stack sockets report IPv4 peers as ::ffff:a.b.c.d; match them as IPv4.
+    mapped = getattr(address, "ipv4_mapped", None)
+    return mapped if mapped is not None else address
@@ -0,0 +1,168 @@
+"""Hold delayed writes of one direction until their release time without blocking reads."""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import math
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.frame_writer import CoalescingWriter, LatencyMark
+
+
+@dataclass
+class DelayAccuracyStats:
+    """Measured release delay versus the configured ``delay_ms``, in milliseconds."""
+
+    released: int = 0
+    error_mean_ms: float = 0.0
+    error_m2: float = 0.0
+    error_max_ms: float = 0.0
+
+    def record(self, error_ms: float) -> None:
+        # Welford's update keeps mean and variance without storing samples.
+        self.released += 1
+        delta = error_ms - self.error_mean_ms
+        self.error_mean_ms += delta / self.released
+        self.error_m2 += delta * (error_ms - self.error_mean_ms)
+        self.error_max_ms = max(self.error_max_ms, error_ms)
+
+    @property
+    def jitter_ms(self) -> float:
+        return math.sqrt(self.error_m2 / self.released) if self.released > 1 else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "released": self.released,
+            "error_mean_ms": round(self.error_mean_ms, 3),
+            "error_max_ms": round(self.error_max_ms, 3),
+            "jitter_ms": round(self.jitter_ms, 3),
+        }
+
+
+@dataclass
+class _ScheduledWrite:
+    buffers: List[Any]
+    size: int
+    received_at: float
+    delay_ms: int
+    mark: Optional[LatencyMark]
+    # False for injections, which are released at their own time outside frame order.
+    ordered: bool = True
+
+
+class ReleaseScheduler:
+    """Per-direction heap of writes keyed by ``(release_at, seq)``.
+
+    Frames never overtake each other: a frame is released no earlier than the frame
+    scheduled before it, so a short delay queued behind a long one waits for it. The
+    reader keeps decoding while frames wait; ``wait_for_capacity`` applies
+    backpressure once ``max_pending_bytes`` are held.
+
+    Injections (timer-driven replays) share the heap and the release task but keep
+    their own due time. They go out between whole frames, do not hold back later
+    frames, and are dropped when the direction closes.
+    """
+
+    def __init__(self, writer: CoalescingWriter, max_pending_bytes: int):
+        self.writer = writer
+        self.max_pending_bytes = max_pending_bytes
+        self.stats = DelayAccuracyStats()
+        self.pending_bytes = 0
+        self._heap: List[Tuple[float, int, _ScheduledWrite]] = []
+        self._ordered_pending = 0
+        self.dropped_injections = 0
+        self._seq = 0
+        self._last_release_at = -math.inf
+        self._closed = False
+        self._wakeup = asyncio.Event()
+        self._capacity = asyncio.Event()
+        self._capacity.set()
+
+    @property
+    def has_pending(self) -> bool:
+        """Whether frames are waiting, so a new frame must queue behind them."""
+        return self._ordered_pending > 0
+
+    def schedule(
+        self,
+        buffers: List[Any],
+        received_at: float,
+        delay_ms: int,
+        mark: Optional[LatencyMark] = None,
+    ) -> None:
+        """Queue one frame's writes for ``received_at + delay_ms``, after earlier frames."""
+        release_at = max(received_at + delay_ms / 1000.0, self._last_release_at)
+        self._last_release_at = release_at
+        size = sum(len(buffer) for buffer in buffers)
+        self._seq += 1
+        heapq.heappush(self._heap, (release_at, self._seq, _ScheduledWrite(buffers, size, received_at, delay_ms, mark)))
+        self._ordered_pending += 1
+        self.pending_bytes += size
+        if self.pending_bytes >= self.max_pending_bytes:
+            self._capacity.clear()
+        if self._heap[0][1] == self._seq:
+            self._wakeup.set()
+
+    def inject(self, buffers: List[Any], received_at: float, delay_ms: int) -> None:
+        """Write ``buffers`` at ``received_at + delay_ms`` even if no frame arrives."""
+        self._seq += 1
+        scheduled = _ScheduledWrite(buffers, 0, received_at, delay_ms, None, ordered=False)
+        heapq.heappush(self._heap, (received_at + delay_ms / 1000.0, self._seq, scheduled))
+        if self._heap[0][1] == self._seq:
+            self._wakeup.set()
+
+    async def wait_for_capacity(self) -> None:
+        await self._capacity.wait()
+
+    def close(self) -> None:
+        """No more writes will be scheduled; ``run`` returns once every frame is out."""
+        self._closed = True
+        self._wakeup.set()
+
+    async def run(self) -> None:
+        try:
+            await self._release_loop()
+        finally:
+            # Never leave the reader waiting on a scheduler that stopped.
+            self._capacity.set()
+
+    async def _release_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        heap = self._heap
+        while True:
+            if self._closed and not self._ordered_pending:
+                self.dropped_injections += len(heap)
+                heap.clear()
+                return
+            if not heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            release_at = heap[0][0]
+            if release_at > loop.time():
+                self._wakeup.clear()
+                timer = loop.call_at(release_at, self._wakeup.set)
+                try:
+                    await self._wakeup.wait()
+                finally:
+                    timer.cancel()
+                continue
+
+            now = loop.time()
+            while heap and heap[0][0] <= now:
+                _, _, scheduled = heapq.heappop(heap)
+                self.writer.add_buffers(scheduled.buffers, scheduled.mark)
+                if not scheduled.ordered:
+                    continue
+                self._ordered_pending -= 1
+                self.pending_bytes -= scheduled.size
+                if scheduled.delay_ms:
+                    actual_ms = (now - scheduled.received_at) * 1000.0
+                    self.stats.record(actual_ms - scheduled.delay_ms)
+
+            await self.writer.drain()
+            if self.pending_bytes < self.max_pending_bytes:
+                self._capacity.set()
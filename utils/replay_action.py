@@ -1,21 +1,25 @@
 from __future__ import annotations
 
+import threading
 import time
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Sequence, Set, Tuple, Union
 
-from utils.contracts import Insertion
+from utils import event_log
+from utils.config_loading import parse_replay_rules
+from utils.contracts import Insertion, ReplayRuleConfig, ScheduledInsertion
+from utils.frame_encoding import retain_frame
 
 
-@dataclass
-class ReplayRule:
-    action: str
-    count: int
-    block_original: bool
-    delay_ms: int
-    data: Any
-    position: str
+def _log_enabled(event: str, action: Optional[str]) -> bool:
+    # Replay events fire on the event loop for individual frames, so they share the
+    # level and sampling rules of the other per-frame events.
+    return event_log.log_frame_event(event, None, action, non_default=False)
+
+
+def _log_event(event: str, action: Optional[str], **fields: Any) -> None:
+    event_log.emit({"component": "replay_action", "event": event, "action": action, **fields})
 
 
 @dataclass
@@ -27,65 +31,157 @@ class ReplaySession:
     block_remaining: int
     block_original: bool
     delay_ms: int
-    data: Any
+    data: Optional[bytes]
     position: str
     next_emit_at: float
     emitted_count: int = 0
+    key: Hashable = None
+    last_used: float = 0.0
+    # Original frame bytes, captured when the rule's source is "frame".
+    raw_frame: Any = None
+
+
+class ReplaySessionStore:
+    """Live replay sessions keyed by (owner key, action), bounded in count and idle time.
+
+    The owner key is the forwarding context a session belongs to, so one connection's
+    replay never consumes or blocks another connection's frames. Sessions are kept in
+    least-recently-used order: each access checks only the oldest entry for expiry,
+    and adding past ``max_sessions`` evicts from the same end. ``expire`` runs the
+    same check from the proxy's periodic sweep, so idle sessions also go away when
+    no traffic touches the store.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 10000,
+        idle_timeout_s: float = 300.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_sessions = max_sessions
+        self.idle_timeout_s = idle_timeout_s
+        self.clock = clock
+        self.evicted = 0
+        self.expired = 0
+        self._sessions: "OrderedDict[Tuple[Hashable, str], ReplaySession]" = OrderedDict()
+        self._actions_by_key: Dict[Hashable, Set[str]] = {}
+        # Thread-mode event loops share one handler and therefore one store.
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def values(self) -> Iterator[ReplaySession]:
+        with self._lock:
+            return iter(list(self._sessions.values()))
+
+    def get(self, action: str, key: Hashable = None) -> Optional[ReplaySession]:
+        with self._lock:
+            now = self.clock()
+            self._expire(now)
+            session = self._sessions.get((key, action))
+            if session is not None:
+                session.last_used = now
+                self._sessions.move_to_end((key, action))
+            return session
+
+    def add(self, session: ReplaySession) -> None:
+        with self._lock:
+            now = self.clock()
+            self._expire(now)
+            session.last_used = now
+            entry = (session.key, session.action)
+            if entry not in self._sessions:
+                while len(self._sessions) >= self.max_sessions:
+                    self._pop_oldest()
+                    self.evicted += 1
+                self._actions_by_key.setdefault(session.key, set()).add(session.action)
+            self._sessions[entry] = session
+            self._sessions.move_to_end(entry)
+
+    def remove(self, action: str, key: Hashable = None) -> Optional[ReplaySession]:
+        with self._lock:
+            return self._remove((key, action))
+
+    def release(self, key: Hashable) -> int:
+        """Drop every session owned by ``key`` and return how many there were."""
+        with self._lock:
+            actions = self._actions_by_key.pop(key, ())
+            for action in actions:
+                self._sessions.pop((key, action), None)
+            return len(actions)
+
+    def expire(self) -> int:
+        """Drop sessions idle longer than ``idle_timeout_s`` and return how many."""
+        with self._lock:
+            expired = self.expired
+            self._expire(self.clock())
+            return self.expired - expired
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sessions.clear()
+            self._actions_by_key.clear()
+
+    def _expire(self, now: float) -> None:
+        deadline = now - self.idle_timeout_s
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.last_used > deadline:
+                return
+            self._pop_oldest()
+            self.expired += 1
+
+    def _pop_oldest(self) -> None:
+        entry = next(iter(self._sessions))
+        self._remove(entry)
+
+    def _remove(self, entry: Tuple[Hashable, str]) -> Optional[ReplaySession]:
+        session = self._sessions.pop(entry, None)
+        if session is not None:
+            key, action = entry
+            actions = self._actions_by_key.get(key)
+            if actions is not None:
+                actions.discard(action)
+                if not actions:
+                    del self._actions_by_key[key]
+        return session
 
 
 class ReplayAction:
-    def __init__(self, replay_rules: List[Dict[str, Any]]):
-        self.rules = self._parse_replay_rules(replay_rules)
-        self.sessions: Dict[str, ReplaySession] = {}
+    def __init__(
+        self,
+        replay_rules: Sequence[Union[ReplayRuleConfig, Dict[str, Any]]],
+        max_sessions: int = 10000,
+        idle_timeout_s: float = 300.0,
+    ):
+        self.rules: Dict[str, ReplayRuleConfig] = {}
+        for rule in replay_rules:
+            if isinstance(rule, dict):
+                # YAML-shaped rules are validated like config rules; invalid ones are dropped.
+                parsed = parse_replay_rules([rule], "replay", [])
+                if not parsed:
+                    continue
+                rule = parsed[0]
+            self.rules[rule.action] = rule
+        self.sessions = ReplaySessionStore(max_sessions, idle_timeout_s)
         self.replay_counters = defaultdict(int)
         self._session_counter = 0
 
-    def _parse_replay_rules(self, replay_rules: List[Dict[str, Any]]) -> Dict[str, ReplayRule]:
-        parsed_rules: Dict[str, ReplayRule] = {}
-
-        for rule in replay_rules:
-            if not isinstance(rule, dict):
-                continue
-
-            action = rule.get("action")
-            if not action:
-                continue
-
-            count = rule.get("count", 1)
-            if not isinstance(count, int) or count < 1:
-                print(f"[!] Warning: Replay rule for '{action}' has invalid count '{count}'. Ignoring.")
-                continue
-
-            block_original = bool(rule.get("block_original", False))
-            delay_ms = rule.get("delay_ms", 0)
-            if not isinstance(delay_ms, (int, float)) or delay_ms < 0:
-                delay_ms = 0
-            delay_ms = int(delay_ms)
-            if block_original:
-                delay_ms = 0
-
-            position = rule.get("position", "after")
-            if position not in ("before", "after"):
-                position = "after"
-
-            parsed_rules[action] = ReplayRule(
-                action=action,
-                count=count,
-                block_original=block_original,
-                delay_ms=delay_ms,
-                data=rule.get("data"),
-                position=position,
-            )
-
-        return parsed_rules
-
     def _message_action(self, message: Dict[str, Any]) -> Optional[str]:
         if not isinstance(message, dict):
             return None
         action = message.get("action")
         return action if isinstance(action, str) else None
 
-    def _create_session(self, action: str, message: Dict[str, Any], rule: ReplayRule) -> ReplaySession:
+    def _create_session(
+        self,
+        action: str,
+        message: Dict[str, Any],
+        rule: ReplayRuleConfig,
+        key: Hashable = None,
+        raw_frame: Any = None,
+    ) -> ReplaySession:
         self._session_counter += 1
         session = ReplaySession(
             session_id=self._session_counter,
@@ -98,72 +194,99 @@ class ReplayAction:
             data=rule.data,
             position=rule.position,
             next_emit_at=time.monotonic(),
+            key=key,
+            raw_frame=retain_frame(raw_frame) if rule.source == "frame" and raw_frame is not None else None,
         )
-        self.sessions[action] = session
-        print(
-            f"[REPLAY] Started session action='{action}' session_id={session.session_id} "
-            f"count={rule.count} block_original={rule.block_original}"
-        )
+        self.sessions.add(session)
+        if _log_enabled("replay_started", action):
+            _log_event(
+                "replay_started",
+                action,
+                session_id=session.session_id,
+                count=rule.count,
+                block_original=rule.block_original,
+            )
         return session
 
-    def check_replay_block(self, message: Dict[str, Any]) -> bool:
+    def needs_message(self, action: Optional[str], key: Hashable = None) -> bool:
+        """Whether replaying this action copies data out of the original message."""
+        if not action:
+            return False
+        rule = self.rules.get(action)
+        return rule is not None and rule.source == "data" and rule.data is None
+
+    def check_replay_block(self, message: Dict[str, Any], key: Hashable = None, raw_frame: Any = None) -> bool:
         action = self._message_action(message)
         if not action:
             return False
 
         rule = self.rules.get(action)
-        session = self.sessions.get(action)
+        if rule is None:
+            return False
+        session = self._live_session(action, key)
 
-        if session is None and rule and rule.block_original:
-            session = self._create_session(action, message, rule)
+        if session is None and rule.block_original:
+            session = self._create_session(action, message, rule, key, raw_frame)
 
         if session and session.block_remaining > 0:
             session.block_remaining -= 1
-            print(
-                f"[REPLAY] Blocking action='{action}' session_id={session.session_id} "
-                f"blocks_remaining={session.block_remaining}"
-            )
+            if _log_enabled("replay_blocked", action):
+                _log_event(
+                    "replay_blocked",
+                    action,
+                    session_id=session.session_id,
+                    blocks_remaining=session.block_remaining,
+                )
             return True
 
         return False
 
-    def start_replay_if_needed(self, message: Dict[str, Any]) -> bool:
+    def start_replay_if_needed(self, message: Dict[str, Any], key: Hashable = None, raw_frame: Any = None) -> bool:
         action = self._message_action(message)
         if not action:
             return False
 
-        if action in self.sessions:
-            return False
-
         rule = self.rules.get(action)
         if not rule:
             return False
 
-        self._create_session(action, message, rule)
+        if self._live_session(action, key) is not None:
+            return False
+
+        self._create_session(action, message, rule, key, raw_frame)
         return True
 
-    def get_replay_insertions(self, message: Dict[str, Any]) -> List[Insertion]:
+    def get_replay_insertions(self, message: Dict[str, Any], key: Hashable = None) -> List[Insertion]:
+        """Replays written next to this frame; see ``collect_replays`` for timed ones."""
+        return self.collect_replays(message, key)[0]
+
+    def collect_replays(
+        self, message: Dict[str, Any], key: Hashable = None
+    ) -> Tuple[List[Insertion], List[ScheduledInsertion]]:
+        """Return replays to write with this frame and replays due later.
+
+        A replay with ``delay_ms`` emits its first copy with the frame that started it
+        and hands the rest to the caller's scheduler, spaced ``delay_ms`` apart, so
+        they go out on time whether or not more traffic arrives.
+        """
         action = self._message_action(message)
-        if not action:
-            return []
+        if not action or action not in self.rules:
+            return [], []
 
-        session = self.sessions.get(action)
-        if not session:
-            return []
+        session = self._live_session(action, key)
+        if session is None or session.remaining_count == 0:
+            return [], []
+        if session.delay_ms > 0:
+            return self._schedule_replays(session, message)
 
         insertions: List[Insertion] = []
-        now = time.monotonic()
         max_emits = 1 if session.block_original else None
 
         while session.remaining_count > 0:
-            if session.delay_ms > 0 and now < session.next_emit_at:
-                break
-
             replay_data = self._create_replay_data(session, message)
             if replay_data is None:
-                print(
-                    f"[REPLAY] Session action='{action}' session_id={session.session_id} has no replay data; ending"
-                )
+                if _log_enabled("replay_no_data", action):
+                    _log_event("replay_no_data", action, session_id=session.session_id)
                 session.remaining_count = 0
                 break
 
@@ -179,30 +302,87 @@ class ReplayAction:
                 )
             )
 
-            print(
-                f"[REPLAY] Emitted replay action='{action}' session_id={session.session_id} "
-                f"remaining={session.remaining_count}"
-            )
-
-            if session.delay_ms > 0:
-                session.next_emit_at = now + (session.delay_ms / 1000.0)
-                break
+            if _log_enabled("replay_emitted", action):
+                _log_event(
+                    "replay_emitted",
+                    action,
+                    session_id=session.session_id,
+                    remaining=session.remaining_count,
+                )
 
             if max_emits is not None and len(insertions) >= max_emits:
                 break
 
         if session.remaining_count == 0 and session.block_remaining == 0:
-            del self.sessions[action]
-            print(
-                f"[REPLAY] Completed session action='{action}' session_id={session.session_id} "
-                f"total_emitted={session.emitted_count}"
+            self._complete(session)
+
+        return insertions, []
+
+    def _schedule_replays(
+        self, session: ReplaySession, message: Dict[str, Any]
+    ) -> Tuple[List[Insertion], List[ScheduledInsertion]]:
+        replay_data = self._create_replay_data(session, message)
+        if replay_data is None:
+            if _log_enabled("replay_no_data", session.action):
+                _log_event("replay_no_data", session.action, session_id=session.session_id)
+            session.remaining_count = 0
+            self._complete(session)
+            return [], []
+
+        count = session.remaining_count
+        first_index = session.emitted_count + 1
+        session.remaining_count = 0
+        session.emitted_count += count
+        self.replay_counters[session.action] += count
+        tag = f"replay_{session.action}_{session.session_id}"
+
+        immediate = Insertion(data=replay_data, position=session.position, tag=f"{tag}_{first_index}")
+        scheduled = [
+            ScheduledInsertion(data=replay_data, delay_ms=session.delay_ms * step, tag=f"{tag}_{first_index + step}")
+            for step in range(1, count)
+        ]
+        # The session stays live, so the action does not start a new one, until its
+        # last copy is due.
+        session.next_emit_at = time.monotonic() + session.delay_ms * (count - 1) / 1000.0
+        if _log_enabled("replay_scheduled", session.action):
+            _log_event(
+                "replay_scheduled",
+                session.action,
+                session_id=session.session_id,
+                count=count,
+                interval_ms=session.delay_ms,
             )
+        if count == 1:
+            self._complete(session)
+        return [immediate], scheduled
+
+    def _live_session(self, action: str, key: Hashable) -> Optional[ReplaySession]:
+        session = self.sessions.get(action, key)
+        if (
+            session is not None
+            and session.remaining_count == 0
+            and session.block_remaining == 0
+            and time.monotonic() >= session.next_emit_at
+        ):
+            self._complete(session)
+            return None
+        return session
 
-        return insertions
+    def _complete(self, session: ReplaySession) -> None:
+        self.sessions.remove(session.action, session.key)
+        if _log_enabled("replay_completed", session.action):
+            _log_event(
+                "replay_completed",
+                session.action,
+                session_id=session.session_id,
+                total_emitted=session.emitted_count,
+            )
 
     def _create_replay_data(self, session: ReplaySession, current_message: Dict[str, Any]) -> Optional[bytes]:
+        if session.raw_frame is not None:
+            return session.raw_frame
         if session.data is not None:
-            return self._coerce_bytes(session.data)
+            return session.data
 
         original_data = current_message.get("data")
         if original_data is None:
@@ -219,37 +399,50 @@ class ReplayAction:
             return value.encode("utf-8")
         return str(value).encode("utf-8")
 
-    def get_active_replay_count(self, action: str) -> int:
-        return 1 if action in self.sessions else 0
+    def get_active_replay_count(self, action: str, key: Hashable = None) -> int:
+        return 1 if self._live_session(action, key) is not None else 0
 
     def get_total_replay_count(self, action: str) -> int:
         return self.replay_counters.get(action, 0)
 
-    def clear_replays(self, action: str = None) -> None:
+    def release(self, key: Hashable) -> int:
+        """Drop the sessions of one forwarding context once its direction has ended."""
+        return self.sessions.release(key)
+
+    def expire_idle(self) -> int:
+        """Drop idle sessions without waiting for the next frame of this rule set."""
+        return self.sessions.expire()
+
+    def clear_replays(self, action: str = None, key: Hashable = None) -> None:
         if action is None:
             self.sessions.clear()
             self.replay_counters.clear()
-            print("[REPLAY] Cleared all replay sessions")
+            if _log_enabled("replay_cleared", None):
+                _log_event("replay_cleared", None)
             return
 
-        if action in self.sessions:
-            del self.sessions[action]
-            print(f"[REPLAY] Cleared replay session for action '{action}'")
+        if self.sessions.remove(action, key) is not None and _log_enabled("replay_cleared", action):
+            _log_event("replay_cleared", action)
 
     def get_replay_status(self) -> Dict[str, Any]:
         status = {
             "active_sessions": {},
             "total_replays": dict(self.replay_counters),
             "total_active_sessions": len(self.sessions),
+            "evicted_sessions": self.sessions.evicted,
+            "expired_sessions": self.sessions.expired,
         }
 
-        for action, session in self.sessions.items():
-            status["active_sessions"][action] = {
-                "session_id": session.session_id,
-                "remaining_count": session.remaining_count,
-                "block_remaining": session.block_remaining,
-                "delay_ms": session.delay_ms,
-                "emitted_count": session.emitted_count,
-            }
+        # One entry per forwarding context that has a session for the action.
+        for session in self.sessions.values():
+            status["active_sessions"].setdefault(session.action, []).append(
+                {
+                    "session_id": session.session_id,
+                    "remaining_count": session.remaining_count,
+                    "block_remaining": session.block_remaining,
+                    "delay_ms": session.delay_ms,
+                    "emitted_count": session.emitted_count,
+                }
+            )
 
         return status
@@ -0,0 +1,141 @@
+"""Kernel splice() passthrough for directions that never need frame decoding.
+
+Raw directions only copy bytes from one socket to the other, so on Linux they can
+move data socket -> pipe -> socket with ``os.splice`` and never copy it into Python.
+The asyncio transports stay open for EOF handling and closing; reading on the source
+transport is paused while the splice loop owns the socket.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+from typing import Any, Optional
+
+try:
+    import fcntl
+except ModuleNotFoundError:
+    fcntl = None  # type: ignore[assignment]
+
+
+PIPE_SIZE = 1024 * 1024
+SPLICE_FLAGS = getattr(os, "SPLICE_F_MOVE", 0) | getattr(os, "SPLICE_F_NONBLOCK", 0)
+
+
+def splice_available() -> bool:
+    return sys.platform.startswith("linux") and hasattr(os, "splice") and hasattr(os, "pipe2")
+
+
+def can_splice(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    source_transport: Optional[asyncio.BaseTransport],
+) -> bool:
+    """Whether both ends are plain sockets the splice loop can take over."""
+    if not splice_available() or source_transport is None:
+        return False
+    # Bytes the stream already buffered have to be flushed before splicing starts.
+    if not isinstance(getattr(reader, "_buffer", None), bytearray):
+        return False
+    get_writer_info = getattr(writer, "get_extra_info", None)
+    if get_writer_info is None:
+        return False
+    return source_transport.get_extra_info("socket") is not None and get_writer_info("socket") is not None
+
+
+async def splice_forward(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    source_transport: asyncio.BaseTransport,
+) -> int:
+    """Forward until EOF on the source socket and return the number of bytes moved."""
+    loop = asyncio.get_running_loop()
+    source_transport.pause_reading()
+
+    buffered = bytes(reader._buffer)
+    reader._buffer.clear()
+
+    # Duplicated descriptors let the loop watch sockets that transports already own.
+    src_fd = os.dup(source_transport.get_extra_info("socket").fileno())
+    dst_fd = os.dup(writer.get_extra_info("socket").fileno())
+    pipe_r, pipe_w = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+    pipe_size = _grow_pipe(pipe_w)
+    forwarded = 0
+
+    try:
+        if buffered:
+            await _write_all(loop, dst_fd, buffered)
+            forwarded += len(buffered)
+
+        exc = reader.exception()
+        if exc is not None:
+            raise exc
+        if reader.at_eof():
+            return forwarded
+
+        in_pipe = 0
+        while True:
+            if in_pipe == 0:
+                try:
+                    in_pipe = os.splice(src_fd, pipe_w, pipe_size, flags=SPLICE_FLAGS)
+                except BlockingIOError:
+                    await _wait_fd(loop, src_fd, readable=True)
+                    continue
+                if in_pipe == 0:
+                    break
+
+            try:
+                moved = os.splice(pipe_r, dst_fd, in_pipe, flags=SPLICE_FLAGS)
+            except BlockingIOError:
+                await _wait_fd(loop, dst_fd, readable=False)
+                continue
+            in_pipe -= moved
+            forwarded += moved
+    finally:
+        for fd in (pipe_r, pipe_w, src_fd, dst_fd):
+            os.close(fd)
+
+    return forwarded
+
+
+def _grow_pipe(pipe_fd: int) -> int:
+    set_pipe_size = getattr(fcntl, "F_SETPIPE_SZ", None)
+    if set_pipe_size is None:
+        return 64 * 1024
+    try:
+        return fcntl.fcntl(pipe_fd, set_pipe_size, PIPE_SIZE)
+    except OSError:
+        # Unprivileged processes are capped by /proc/sys/fs/pipe-max-size.
+        return 64 * 1024
+
+
+async def _wait_fd(loop: asyncio.AbstractEventLoop, fd: int, *, readable: bool) -> None:
+    waiter = loop.create_future()
+    if readable:
+        loop.add_reader(fd, _wake, waiter)
+    else:
+        loop.add_writer(fd, _wake, waiter)
+    try:
+        await waiter
+    finally:
+        if readable:
+            loop.remove_reader(fd)
+        else:
+            loop.remove_writer(fd)
+
+
+def _wake(waiter: "asyncio.Future[Any]") -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+async def _write_all(loop: asyncio.AbstractEventLoop, fd: int, data: bytes) -> None:
+    view = memoryview(data)
+    while view:
+        try:
+            sent = os.write(fd, view)
+        except BlockingIOError:
+            await _wait_fd(loop, fd, readable=False)
+            continue
+        view = view[sent:]
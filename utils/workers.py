@@ -0,0 +1,145 @@
+"""Pre-forked worker processes and the supervisor's control channel to them.
+
+Each worker is forked before any thread is started and gets one end of a Unix
+socket pair. The supervisor sends single-byte requests over it: a metrics request
+is answered with the worker's pickled ``MetricsRegistry.export_state``, and a
+reload request makes the worker re-read the config file. When the supervisor goes
+away the channel reaches EOF, which tells the worker to shut down.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import pickle
+import socket
+import struct
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.metrics import MetricsRegistry
+
+REQUEST_METRICS = b"m"
+REQUEST_RELOAD = b"r"
+_LENGTH = struct.Struct(">I")
+
+
+def fork_worker(index: int, run: Callable[[int, socket.socket], None]) -> "WorkerHandle":
+    """Fork one worker that calls ``run(index, control_socket)`` and then exits."""
+    parent_sock, child_sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+    pid = os.fork()
+    if pid == 0:
+        parent_sock.close()
+        exit_code = 0
+        try:
+            run(index, child_sock)
+        except BaseException:
+            exit_code = 1
+        finally:
+            # Never fall back into the supervisor's code path in the child.
+            os._exit(exit_code)
+
+    child_sock.close()
+    return WorkerHandle(index, pid, parent_sock)
+
+
+class WorkerHandle:
+    """Supervisor-side view of one worker process."""
+
+    def __init__(self, index: int, pid: int, control: socket.socket):
+        self.index = index
+        self.pid = pid
+        self.control = control
+        self.alive = True
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def connect(self) -> None:
+        self._reader, self._writer = await asyncio.open_unix_connection(sock=self.control)
+        self._lock = asyncio.Lock()
+
+    def request_reload(self) -> None:
+        if self.alive and self._writer is not None:
+            self._writer.write(REQUEST_RELOAD)
+
+    async def collect_metrics(self, timeout: float = 2.0) -> Optional[Dict[str, Any]]:
+        """Return the worker's exported metrics, or None if it did not answer in time."""
+        if not self.alive or self._reader is None or self._writer is None or self._lock is None:
+            return None
+        async with self._lock:
+            try:
+                self._writer.write(REQUEST_METRICS)
+                header = await asyncio.wait_for(self._reader.readexactly(_LENGTH.size), timeout)
+                payload = await asyncio.wait_for(self._reader.readexactly(_LENGTH.unpack(header)[0]), timeout)
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                self.alive = False
+                return None
+        return pickle.loads(payload)
+
+    async def wait_exited(self) -> int:
+        """Wait for the worker process to exit, reap it, and return its exit code."""
+        loop = asyncio.get_running_loop()
+        try:
+            pidfd = os.pidfd_open(self.pid)
+        except (AttributeError, OSError):
+            pidfd = None
+
+        if pidfd is not None:
+            exited = loop.create_future()
+            loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+            try:
+                await exited
+            finally:
+                loop.remove_reader(pidfd)
+                os.close(pidfd)
+            status = os.waitpid(self.pid, 0)[1]
+        else:
+            while True:
+                pid, status = os.waitpid(self.pid, os.WNOHANG)
+                if pid:
+                    break
+                await asyncio.sleep(0.5)
+
+        self.alive = False
+        return os.waitstatus_to_exitcode(status)
+
+    def close(self) -> None:
+        self.alive = False
+        if self._writer is not None:
+            self._writer.close()
+        else:
+            self.control.close()
+
+
+async def aggregate_metrics(workers: List[WorkerHandle]) -> str:
+    """Render the sum of every live worker's metrics."""
+    merged = MetricsRegistry()
+    states = await asyncio.gather(*(worker.collect_metrics() for worker in workers))
+    for state in states:
+        if state is not None:
+            merged.merge_state(state)
+    return merged.render()
+
+
+async def serve_control_channel(
+    control: socket.socket,
+    registry: MetricsRegistry,
+    reload: Callable[[], Any],
+) -> None:
+    """Worker side: answer supervisor requests until the supervisor disconnects."""
+    loop = asyncio.get_running_loop()
+    reader, writer = await asyncio.open_unix_connection(sock=control)
+    try:
+        while True:
+            request = await reader.read(1)
+            if not request:
+                return
+            if request == REQUEST_METRICS:
+                payload = pickle.dumps(registry.export_state(), protocol=pickle.HIGHEST_PROTOCOL)
+                writer.write(_LENGTH.pack(len(payload)) + payload)
+                await writer.drain()
+            elif request == REQUEST_RELOAD:
+                # Same thread hop as the watchdog callback in the single-process proxy.
+                await loop.run_in_executor(None, reload)
+    finally:
+        writer.close()